@@ -11,13 +11,17 @@
 
 from __future__ import absolute_import
 
+import json
 import logging
 from logging import Formatter, FileHandler, StreamHandler
 
-from flask import Flask
+from flask import Flask, request
 
+from debsources import instrument
+from debsources import local_info
 from debsources import mainlib
-from debsources.sqla_session import _get_engine_session
+from debsources.app.render_cache import make_cache
+from debsources.sqla_session import _get_engine_session, _pool_metrics
 
 
 class AppWrapper(object):
@@ -48,6 +52,9 @@ class AppWrapper(object):
             self.setup_sqlalchemy()
 
         self.setup_logging()
+        self.setup_profiling()
+        self.setup_local_info()
+        self.setup_render_cache()
 
         # setup blueprint
         self.setup_blueprints()
@@ -88,11 +95,97 @@ class AppWrapper(object):
         Creates an engine and a session for SQLAlchemy, using the database URI
         in the configuration.
         """
-        db_uri = self.app.config["SQLALCHEMY_DATABASE_URI"]
-        e, s = _get_engine_session(db_uri,
-                                   verbose=self.app.config["SQLALCHEMY_ECHO"])
+        config = self.app.config
+        db_uri = config["SQLALCHEMY_DATABASE_URI"]
+        pool_opts = {}
+        for key in ['POOL_SIZE', 'MAX_OVERFLOW', 'POOL_RECYCLE']:
+            if config.get('SQLALCHEMY_' + key) is not None:
+                pool_opts[key.lower()] = int(config['SQLALCHEMY_' + key])
+        pool_opts['pool_pre_ping'] = bool(
+            config.get('SQLALCHEMY_POOL_PRE_PING'))
+        e, s = _get_engine_session(
+            db_uri, verbose=config["SQLALCHEMY_ECHO"],
+            replica_url=config.get('SQLALCHEMY_REPLICA_URI'), **pool_opts)
         self.engine, self.session = e, s
 
+    def pool_metrics(self):
+        """
+        Returns the usage metrics of the DB connection pools, if SQLAlchemy
+        has been set up by this AppWrapper.
+        """
+        metrics = {}
+        if getattr(self, 'engine', None) is not None:
+            metrics['primary'] = _pool_metrics(self.engine)
+        if getattr(self.session, 'replica', None) is not None:
+            metrics['replica'] = _pool_metrics(self.session.replica)
+        return metrics
+
+    def setup_profiling(self):
+        """
+        If PROFILE_REQUESTS is set, profiles each request: SQL statements and
+        their time, FS and libmagic work (see debsources.instrument). Timings
+        are returned in a Server-Timing header, and requests slower than
+        SLOW_REQUEST_THRESHOLD seconds are logged, as JSON, to SLOW_REQUEST_LOG
+        (or to the app log, by default).
+        """
+        config = self.app.config
+        if not config.get('PROFILE_REQUESTS'):
+            return
+        engines = [getattr(self, 'engine', None),
+                   getattr(self.session, 'bind', None),
+                   getattr(self.session, 'replica', None)]
+        for engine in engines:
+            if engine is not None:
+                instrument.profile_engine(engine)
+
+        threshold = float(config.get('SLOW_REQUEST_THRESHOLD') or 1.0)
+        slow_log = self.app.logger
+        if config.get('SLOW_REQUEST_LOG'):
+            slow_log = logging.getLogger('debsources.slow_requests')
+            slow_log.propagate = False
+            slow_log.setLevel(logging.INFO)
+            handler = FileHandler(config['SLOW_REQUEST_LOG'])
+            handler.setFormatter(Formatter('%(message)s'))
+            slow_log.addHandler(handler)
+
+        @self.app.before_request
+        def start_profile():
+            instrument.start_profile()
+
+        @self.app.after_request
+        def add_server_timing(response):
+            profile = instrument.current_profile()
+            if profile is None:
+                return response
+            response.headers['Server-Timing'] = profile.server_timing()
+            if profile.elapsed() >= threshold:
+                entry = profile.to_dict()
+                entry.update(endpoint=request.endpoint, path=request.path,
+                             method=request.method,
+                             status=response.status_code)
+                slow_log.warning(json.dumps(entry, sort_keys=True))
+            return response
+
+        @self.app.teardown_request
+        def stop_profile(exception=None):
+            instrument.stop_profile()
+
+    def setup_local_info(self):
+        """
+        Configures the in-process cache of local info files (last update
+        timestamp, package prefixes, credits, news, ...).
+        """
+        interval = self.app.config.get('LOCAL_INFO_CHECK_INTERVAL')
+        if interval is not None:
+            local_info.cache.check_interval = float(interval)
+
+    def setup_render_cache(self):
+        """
+        Creates the cache of rendered responses, as per the RENDER_CACHE*
+        configuration keys.
+        """
+        self.render_cache = make_cache(self.app.config)
+
     def setup_logging(self):
         """
         Sets up everything needed for logging.
@@ -15,7 +15,6 @@ from collections import defaultdict, Counter
 import os
 
 from flask import current_app, request
-from debian.debian_support import version_compare
 
 import debsources.license_helper as helper
 import debsources.query as qry
@@ -23,7 +22,9 @@ import debsources.statistics as statistics
 from debsources.excepts import (Http404ErrorSuggestions, FileOrFolderNotFound,
                                 InvalidPackageOrVersionError,
                                 Http404MissingCopyright, Http404Error)
-from ..views import GeneralView, ChecksumView, session, app
+from debsources.version_key import version_key
+from ..views import (GeneralView, ChecksumView, checksum_may_exist, session,
+                     app)
 from ..sourcecode import SourceCodeIterator
 from ..pagination import Pagination
 from ..extract_stats import extract_stats
@@ -98,11 +99,8 @@ class ChecksumLicenseView(ChecksumView):
                 dd[(f['package'])].append(f)
             files = []
             for package in dd:
-                version = sorted([item['version'] for item
-                                 in dd[package]],
-                                 cmp=version_compare)[-1]
-                files.append(filter(lambda f: f['version'] == version,
-                                    dd[package])[0])
+                files.append(max(dd[package],
+                                 key=lambda f: version_key(f['version'])))
         return files
 
     def _get_license_dict(self, files):
@@ -139,8 +137,12 @@ class ChecksumLicenseView(ChecksumView):
 
     def batch_api(self, checksums, package=None, suite=None):
         results = []
+        known = qry.get_checksums_stats(
+            session, [sha for sha in checksums if checksum_may_exist(sha)])
         for sha in checksums:
-            files = self._get_files(sha, package, suite)
+            files = []
+            if sha in known:
+                files = self._get_files(sha, package, suite)
             if not files:
                 results.append(dict(checksum=sha,
                                     copyright=[],
@@ -167,7 +169,11 @@ class ChecksumLicenseView(ChecksumView):
         package = request.args.get("package") or None
         suite = request.args.get("suite") or None
 
-        all_files = self._get_files(checksum, package=package, suite=suite)
+        all_files = []
+        if checksum_may_exist(checksum) and \
+           qry.get_checksum_stats(session, checksum) is not None:
+            all_files = self._get_files(checksum, package=package,
+                                        suite=suite)
 
         if 'api' in request.endpoint:
             d_copyright = self._get_license_dict(all_files)
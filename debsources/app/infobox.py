@@ -13,8 +13,8 @@ from __future__ import absolute_import
 
 from flask import url_for, current_app
 
-from debsources.models import (
-    PackageName, Package, Suite, SlocCount, Metric, Ctag)
+from debsources import compiled_queries
+from debsources.models import SlocCount, Metric, Ctag
 from debsources.excepts import Http500Error, Http404Error
 
 PTS_PREFIX = "https://tracker.debian.org/pkg/"
@@ -34,43 +34,34 @@ class Infobox(object):
         self.session = session
         self.package = package
         self.version = version
+        self.package_id = None  # known after _get_direct_infos()
 
     def _get_direct_infos(self):
         """ information available directly in Package table """
         try:
-            infos = (self.session.query(Package)
-                     .filter(Package.version == self.version,
-                             Package.name_id == PackageName.id,
-                             PackageName.name == self.package)
-                     .first())
-
+            infos = compiled_queries.package(self.session, self.package,
+                                             self.version)
         except Exception as e:  # pragma: no cover
             raise Http500Error(e)
 
+        if infos is not None:
+            self.package_id = infos.id
         return infos
 
     def _get_associated_suites(self):
         """ associated suites, which come from Suite """
         try:
-            suites = (self.session.query(Suite.suite)
-                      .filter(Suite.package_id == Package.id,
-                              Package.version == self.version,
-                              Package.name_id == PackageName.id,
-                              PackageName.name == self.package)
-                      .all())
+            suites = compiled_queries.suites(self.session, [self.package_id])
         except Exception as e:  # pragma: no cover
             raise Http500Error(e)
 
-        return [x[0] for x in suites]
+        return suites[self.package_id]
 
     def _get_sloc(self):
         """ sloccount """
         try:
             sloc = (self.session.query(SlocCount)
-                    .filter(SlocCount.package_id == Package.id,
-                            Package.version == self.version,
-                            Package.name_id == PackageName.id,
-                            PackageName.name == self.package)
+                    .filter(SlocCount.package_id == self.package_id)
                     .order_by(SlocCount.count.desc())
                     .all())
         except Exception as e:  # pragma: no cover
@@ -82,10 +73,7 @@ class Infobox(object):
         """ metrics"""
         try:
             metric = (self.session.query(Metric)
-                      .filter(Metric.package_id == Package.id,
-                              Package.version == self.version,
-                              Package.name_id == PackageName.id,
-                              PackageName.name == self.package)
+                      .filter(Metric.package_id == self.package_id)
                       .all())
         except Exception as e:  # pragma: no cover
             raise Http500Error(e)
@@ -104,10 +92,7 @@ class Infobox(object):
         """ctags counts"""
         try:
             ctags_count = (self.session.query(Ctag)
-                           .filter(Ctag.package_id == Package.id,
-                                   Package.version == self.version,
-                                   Package.name_id == PackageName.id,
-                                   PackageName.name == self.package)
+                           .filter(Ctag.package_id == self.package_id)
                            .count())
         except Exception as e:  # pragma: no cover
             raise Http500Error(e)
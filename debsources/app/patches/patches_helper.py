@@ -9,55 +9,10 @@
 # see the COPYING file at the top-level directory of this distribution and at
 # https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
 from __future__ import absolute_import
-import re
-import logging
-import subprocess
 
+from debsources import quilt
 
-def get_patch_details(path):
-    """ Parse a patch to extract the description and or bug if it exists
-    """
-    with open(path, 'r') as content_file:
-        patch = content_file.read()
-    # check if subject exists
-    keywords = ['description:', 'subject:']
-    if not any(key in patch.lower() for key in keywords):
-        return ('---', '')
-    else:
-        # split by --- or +++ (file deltas) and then parse as a tag/value
-        # document to extract description or subject or bug
-        contents = re.split(r'---|\+\+\+', patch)[0]
-        dsc = "---"
-        bug = ""
-        in_description = False
-        # possible fields besides description and subject
-        # used to extract multiline descriptions
-        fields = ['origin:', 'forwarded:', 'author:', 'from:',
-                  'reviewed-by:', 'acked-by:', 'last-update:',
-                  'applied-upstream:', 'index:', 'diff', 'change-id']
-        for line in contents.split('\n'):
-            if 'description:' in line.lower() or \
-               'subject:' in line.lower():
-                dsc = re.split(r'description:|subject:', line.lower())[1] \
-                    + '\n'
-                in_description = True
-            elif 'bug: #' in line.lower():
-                bug = line.lower().split('bug: #')[1]
-                in_description = False
-            elif any(key in line.lower() for key in fields):
-                in_description = False
-            elif in_description:
-                dsc += line + '\n'
-        return (dsc, bug)
-
-
-def get_file_deltas(serie_path):
-    """ Get file deltas from a patch using diffstat
-    """
-    p = subprocess.Popen(["diffstat", "-p1", "-f0", serie_path],
-                         stdout=subprocess.PIPE)
-    summary, err = p.communicate()
-    if err:
-        logging.warn('Reading file deltas patch: %s, error: %s', serie_path,
-                     err)
-    return summary
+# patch metadata is parsed by debsources.quilt, which is shared with the
+# patches hook
+get_patch_details = quilt.get_patch_details
+get_file_deltas = quilt.get_file_deltas
@@ -12,11 +12,13 @@
 from __future__ import absolute_import
 
 import io
+import os
 from collections import OrderedDict
 
 from flask import request, current_app
 
 from ..views import GeneralView, session
+from debsources import quilt
 from debsources.navigation import Location, SourceFile
 from debsources.excepts import (Http404ErrorSuggestions, FileOrFolderNotFound,
                                 InvalidPackageOrVersionError)
@@ -24,8 +26,7 @@ from ..sourcecode import SourceCodeIterator
 from . import patches_helper as helper
 
 
-ACCEPTED_FORMATS = ['3.0 (quilt)',
-                    '3.0 (native)']
+ACCEPTED_FORMATS = quilt.ACCEPTED_FORMATS
 
 
 class SummaryView(GeneralView):
@@ -76,6 +77,86 @@ class SummaryView(GeneralView):
                                                bug='')
         return patches_info
 
+    def parse_patches_info(self, package, version, location, info):
+        """ Create the same dict as parse_patch_series from the patch
+            metadata precomputed by the patches hook (see
+            quilt.patches_info)
+
+        """
+        patches_info = OrderedDict()
+        for entry in info['series']:
+            if entry.get('missing'):
+                patches_info[entry['series']] = dict(
+                    summary='Patch does not exist',
+                    description='---',
+                    bug='')
+                continue
+            deltas, deltas_summary = self._parse_file_deltas(
+                entry['file_deltas'], package, version)
+            download = os.path.join(location.sources_path_static,
+                                    quilt.PATCHES_DIR, entry['name'])
+            # templates expect (utf-8 encoded) byte strings, as read from
+            # patch files
+            patches_info[entry['series']] = dict(
+                deltas=deltas,
+                summary=deltas_summary,
+                download=download,
+                description=entry['description'].encode('utf-8'),
+                bug=entry['bug'])
+        return patches_info
+
+    def get_precomputed_objects(self, package, version, path_to):
+        """ Answer from the sidecar file written by the patches hook, if
+            any; return None otherwise
+
+        """
+        try:
+            location = Location(session,
+                                current_app.config['SOURCES_DIR'],
+                                current_app.config['SOURCES_STATIC'],
+                                package, version)
+        except (FileOrFolderNotFound, InvalidPackageOrVersionError):
+            return None
+        info = quilt.read_sidecar(location.version_path)
+        if info is None:
+            return None
+
+        format_file = info['format']
+        if format_file is None:
+            return dict(package=package,
+                        version=version,
+                        path=path_to,
+                        patches=[],
+                        format='unknown')
+        if format_file.rstrip() not in ACCEPTED_FORMATS:
+            return dict(package=package,
+                        version=version,
+                        path=path_to,
+                        format=format_file,
+                        patches=[],
+                        supported=False)
+        if info['series'] is None:
+            return dict(package=package,
+                        version=version,
+                        path=path_to,
+                        format=format_file,
+                        patches=[],
+                        supported=True)
+
+        patches = self.parse_patches_info(package, version, location, info)
+        if 'api' in request.endpoint:
+            return dict(package=package,
+                        version=version,
+                        format=format_file.rstrip(),
+                        patches=[key.rstrip() for key in patches.keys()])
+        return dict(package=package,
+                    version=version,
+                    path=path_to,
+                    format=format_file,
+                    series=patches.keys(),
+                    patches=patches,
+                    supported=True)
+
     def get_objects(self, path_to):
         path_dict = path_to.split('/')
         package = path_dict[0]
@@ -95,6 +176,11 @@ class SummaryView(GeneralView):
             return self._redirect_to_url(request.endpoint,
                                          redirect_url, redirect_code=302)
 
+        precomputed = self.get_precomputed_objects(package, version, path_to)
+        if precomputed is not None:
+            return precomputed
+
+        # no sidecar (e.g. the patches hook is disabled): parse patches now
         # identify patch format, accept only 3.0 quilt
         try:
             source_format, loc = get_sources_path(session, package, version,
@@ -0,0 +1,216 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""cache of rendered responses, shared by all GeneralView subclasses
+
+Cached entries are (status, headers, body) triples. Keys are derived from the
+endpoint, the view and query arguments, the last update timestamp and a
+generation counter that the updater bumps (see
+:func:`debsources.updater.bump_render_generation`) whenever suite mappings or
+metadata change; bumping it invalidates all entries at once.
+
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import logging
+import os
+import threading
+
+from collections import OrderedDict
+
+import six
+from six.moves import cPickle as pickle
+
+from debsources import local_info
+
+GENERATION_FILE = 'render-generation'
+DEFAULT_SIZE = 1000
+DEFAULT_TIMEOUT = 3600
+
+
+def cache_key(endpoint, view_args, args, last_update, generation):
+    """return the cache key for a request
+
+    `view_args` and `args` are mappings (the latter possibly multi-valued, as
+    Flask's request.args); their ordering does not matter
+
+    """
+    if hasattr(args, 'lists'):  # werkzeug MultiDict
+        args = sorted((k, sorted(v)) for (k, v) in args.lists())
+    else:
+        args = sorted(six.iteritems(args or {}))
+    parts = [str(generation), last_update or '', endpoint or '',
+             repr(sorted(six.iteritems(view_args or {}))), repr(args)]
+    return hashlib.sha1('\0'.join(parts).encode('utf8')).hexdigest()
+
+
+class NullCache(object):
+    """cache backend that caches nothing"""
+
+    enabled = False
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryCache(NullCache):
+    """in-process LRU cache, holding at most `size` entries"""
+
+    enabled = True
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._entries[key] = value  # mark as most recently used
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileSystemCache(NullCache):
+    """cache shared among processes, storing one pickle file per entry under
+    `cache_dir`
+
+    Stale entries are never served, as the generation is part of the key, but
+    they are left on disk; use clear() (or just rm the directory) to reclaim
+    space.
+
+    """
+
+    enabled = True
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            tmp = '%s.%d.new' % (path, os.getpid())
+            with open(tmp, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, path)
+        except (IOError, OSError) as e:
+            logging.warn('cannot store rendered page %s: %s' % (path, e))
+
+    def clear(self):
+        for (root, _dirs, files) in os.walk(self.cache_dir):
+            for fname in files:
+                os.unlink(os.path.join(root, fname))
+
+
+class MemcachedCache(NullCache):
+    """cache backend speaking the memcached protocol
+
+    `client` is any object with memcache.Client-like get(key) and set(key,
+    value, time=...) methods; this allows replacing it in tests
+
+    """
+
+    enabled = True
+
+    def __init__(self, client, prefix='debsources:', timeout=DEFAULT_TIMEOUT):
+        self.client = client
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def get(self, key):
+        try:
+            return self.client.get(self.prefix + key)
+        except Exception as e:
+            logging.warn('memcached get failed: %s' % e)
+            return None
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.prefix + key, value, time=self.timeout)
+        except Exception as e:
+            logging.warn('memcached set failed: %s' % e)
+
+    def clear(self):
+        pass  # entries get invalidated via key generation and expire
+
+
+def make_cache(config):
+    """create the render cache backend specified in the (webapp) `config`
+
+    RENDER_CACHE is one of: none (default), memory, fs, memcached
+
+    """
+    backend = config.get('RENDER_CACHE') or 'none'
+    if backend == 'none':
+        return NullCache()
+    elif backend == 'memory':
+        return MemoryCache(int(config.get('RENDER_CACHE_SIZE',
+                                          DEFAULT_SIZE)))
+    elif backend == 'fs':
+        cache_dir = config.get('RENDER_CACHE_DIR') or \
+            os.path.join(config['CACHE_DIR'], 'render')
+        return FileSystemCache(cache_dir)
+    elif backend == 'memcached':
+        import memcache  # python-memcache, only needed by this backend
+        servers = config.get('RENDER_CACHE_SERVERS', '127.0.0.1:11211')
+        return MemcachedCache(memcache.Client(servers.split()),
+                              timeout=int(config.get('RENDER_CACHE_TIMEOUT',
+                                                     DEFAULT_TIMEOUT)))
+    else:
+        raise ValueError('unknown render cache backend: %s' % backend)
+
+
+def current_stamps(cache_dir):
+    """return the pair <last update timestamp, render generation> that
+    cached entries must match to be valid
+
+    """
+    last_update = local_info.cached_read_update_ts(
+        os.path.join(cache_dir, 'last-update'))
+    generation = local_info.cached_read_generation(
+        os.path.join(cache_dir, GENERATION_FILE))
+    return (last_update, generation)
@@ -14,6 +14,7 @@ from __future__ import absolute_import
 import six
 from six.moves import range
 
+from debsources import instrument
 from debsources.filetype import get_highlightjs_language
 
 
@@ -90,7 +91,7 @@ class SourceCodeIterator(object):
         if self.number_of_lines is not None:
             return self.number_of_lines
         self.number_of_lines = 0
-        with open(self.filepath) as sfile:
+        with instrument.section('fs'), open(self.filepath) as sfile:
             for line in sfile:
                 self.number_of_lines += 1
         return self.number_of_lines
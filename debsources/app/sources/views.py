@@ -147,9 +147,8 @@ class SourceView(GeneralView):
         """
         file_ = SourceFile(location)
         checksum = file_.get_sha256sum(session)
-        number_of_duplicates = (qry.count_files_checksum(session, checksum)
-                                .first()[0]
-                                )
+        stats = qry.get_checksum_stats(session, checksum)
+        number_of_duplicates = stats.file_count if stats is not None else 0
         pkg_infos = Infobox(session,
                             location.get_package(),
                             location.get_version()).get_infos()
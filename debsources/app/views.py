@@ -16,8 +16,6 @@ from __future__ import absolute_import
 import os
 import six
 
-from debian.debian_support import version_compare
-
 from flask import (
     current_app, jsonify, render_template, request, url_for, redirect)
 from flask.views import View
@@ -28,9 +26,12 @@ from debsources.excepts import (
 from debsources.models import Package, SuiteAlias
 import debsources.query as qry
 from debsources.sqla_session import _close_session
+from debsources import bloom
+from debsources import instrument
 from debsources import local_info
 from debsources.consts import SUITES
 
+from .render_cache import cache_key, current_stamps
 from .forms import SearchForm
 from .pagination import Pagination
 from .infobox import Infobox
@@ -39,6 +40,7 @@ from .helper import (format_big_num, url_for_other_page,
 from . import app_wrapper
 app = app_wrapper.app
 session = app_wrapper.session
+render_cache = app_wrapper.render_cache
 
 
 # static file serving
@@ -62,18 +64,20 @@ def shutdown_session(exception=None):
 # variables needed by "base.html" skeleton
 # packages_prefixes and search form (for the left menu),
 # last_update (for the footer)
+# file-based variables come from the shared local_info cache; the search form
+# is bound to the current request, hence created each time
 # TODO the context need a little bit modification
 @app.context_processor
 def skeleton_variables():
     update_ts_file = os.path.join(app.config['CACHE_DIR'], 'last-update')
     # TODO, this part should be moved to per blueprint context processor
-    last_update = local_info.read_update_ts(update_ts_file)
+    last_update = local_info.cached_read_update_ts(update_ts_file)
 
     packages_prefixes = qry.pkg_names_get_packages_prefixes(
         app.config["CACHE_DIR"])
 
     credits_file = os.path.join(app.config["LOCAL_DIR"], "credits.html")
-    credits = local_info.read_html(credits_file)
+    credits = local_info.cached_read_html(credits_file)
 
     return dict(packages_prefixes=packages_prefixes,
                 searchform=SearchForm(),
@@ -191,8 +195,12 @@ class GeneralView(View):
         the http error code (404 or 500)
         """
         try:
-            context = self.get_objects(**kwargs)
-            return self.render_func(**context)
+            if render_cache.enabled and request.method == 'GET':
+                return self._cached_render(**kwargs)
+            with instrument.section('view'):
+                context = self.get_objects(**kwargs)
+            with instrument.section('render'):
+                return self.render_func(**context)
         except Http403Error as e:
             return self.err_func(e, http=403)
         except Http404Error as e:
@@ -203,6 +211,32 @@ class GeneralView(View):
         except Exception as e:
             return self.err_func(e, http=500)
 
+    def _cached_render(self, **kwargs):
+        """
+        renders the view through the render cache. Only successful responses
+        are stored; errors propagate to dispatch_request as usual
+        """
+        (last_update, generation) = current_stamps(
+            current_app.config['CACHE_DIR'])
+        key = cache_key(request.endpoint, kwargs, request.args,
+                        last_update, generation)
+        cached = render_cache.get(key)
+        if cached is not None:
+            (status, headers, body) = cached
+            return current_app.response_class(body, status=status,
+                                              headers=headers)
+
+        with instrument.section('view'):
+            context = self.get_objects(**kwargs)
+        with instrument.section('render'):
+            response = current_app.make_response(self.render_func(**context))
+        if response.status_code == 200 and not response.is_streamed \
+           and not response.direct_passthrough:
+            render_cache.set(key, (response.status_code,
+                                   list(response.headers.items()),
+                                   response.get_data()))
+        return response
+
     def _redirect_to_url(self, endpoint, redirect_url, redirect_code=301):
         if endpoint == '.versions':
             self.render_func = bind_redirect(url_for(endpoint,
@@ -219,14 +253,9 @@ class GeneralView(View):
         redirects to the latest version for the requested page,
         when 'latest' is provided instead of a version number
         """
-        try:
-            versions = qry.pkg_names_list_versions(session, package)
-        except InvalidPackageOrVersionError:
+        version = qry.get_latest_version(session, package)
+        if version is None:
             raise Http404Error("%s not found" % package)
-        # the latest version is the latest item in the
-        # sorted list (by debian_support.version_compare)
-        version = sorted([v.version for v in versions],
-                         cmp=version_compare)[-1]
 
         # avoids extra '/' at the end
         if path == "":
@@ -251,9 +280,9 @@ class GeneralView(View):
         except InvalidPackageOrVersionError:
                 raise Http404Error("%s not found" % package)
 
-        versions = sorted([v['version'] for v in versions_w_suites
-                          if version in v['suites']],
-                          cmp=version_compare)
+        # versions_w_suites is already sorted by version
+        versions = [v['version'] for v in versions_w_suites
+                    if version in v['suites']]
         return versions
 
 
@@ -265,14 +294,15 @@ class Ping(View):
     def dispatch_request(self):
         update_ts_file = os.path.join(
             current_app.config['CACHE_DIR'], 'last-update')
-        last_update = local_info.read_update_ts(update_ts_file)
+        last_update = local_info.cached_read_update_ts(update_ts_file)
         try:
             session.query(Package).first().id  # database check
         except:
             return jsonify(dict(status="db error", http_status_code=500)), 500
         return jsonify(dict(status="ok",
                             http_status_code=200,
-                            last_update=last_update))
+                            last_update=last_update,
+                            db_pool=app_wrapper.pool_metrics()))
 
 
 # for '/'
@@ -281,7 +311,7 @@ class IndexView(GeneralView):
     def get_objects(self, **kwargs):
         news_file = os.path.join(current_app.config["LOCAL_DIR"],
                                  self.d['news_html'])
-        news = local_info.read_html(news_file)
+        news = local_info.cached_read_html(news_file)
         return dict(news=news)
 
 
@@ -358,6 +388,19 @@ class SearchView(GeneralView):
             return self.render_func(searchform=searchform)
 
 
+def checksum_may_exist(checksum):
+    """return False if no file has `checksum` (a hex SHA256), as per the
+    filter of known checksums built by the updater, True if some file
+    probably does (or if there is no filter, or it is stale)
+
+    """
+    path = os.path.join(current_app.config['CACHE_DIR'], bloom.SHA256_FILTER)
+    if local_info.cache.get(bloom.stale_marker(path), os.path.exists):
+        return True
+    sha256_filter = local_info.cache.get(path, bloom.load)
+    return sha256_filter is None or checksum in sha256_filter
+
+
 class ChecksumView(GeneralView):
 
     @staticmethod
@@ -389,8 +432,14 @@ class ChecksumView(GeneralView):
         package = request.args.get("package") or None
 
         # we count the number of results:
-        count = qry.count_files_checksum(session, checksum, package)
-        count = count.first()[0]
+        if not checksum_may_exist(checksum):
+            count = 0
+        elif package is None:
+            stats = qry.get_checksum_stats(session, checksum)
+            count = stats.file_count if stats is not None else 0
+        else:
+            count = qry.count_files_checksum(session, checksum, package)
+            count = count.first()[0]
 
         # pagination:
         if self.d.get('pagination'):
@@ -404,8 +453,10 @@ class ChecksumView(GeneralView):
             slice_ = None
 
         # finally we get the files list
-        results = self._files_with_sum(
-            checksum, slice_=slice_, package=package)
+        results = []
+        if count:
+            results = self._files_with_sum(
+                checksum, slice_=slice_, package=package)
 
         return dict(results=results,
                     sha256=checksum,
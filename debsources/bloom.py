@@ -0,0 +1,202 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""Bloom filter of SHA256 checksums, to answer "definitely not in Debsources"
+without querying the DB
+
+The filter of all known checksums is built by the updater (cache stage) into
+cache_dir/SHA256_FILTER, and memory-mapped by web app processes, which share
+its pages. As SHA256 digests are uniformly distributed, filter positions are
+derived from the digest itself (double hashing on its first 16 bytes), rather
+than by hashing it again.
+
+The filter is only as fresh as its last build. Checksums added to the DB
+outside of update runs (by job queue workers, or bulk loads) mark it as stale
+(see mark_stale), and lookups then fall through to the DB until the next run
+of the cache stage rebuilds it.
+
+File format: MAGIC, then the number of bits, of hash functions and of items
+(little endian, 64 bits each), then the bit array.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import binascii
+import math
+import mmap
+import os
+import struct
+
+import six
+
+from debsources.models import ChecksumStats
+
+SHA256_FILTER = 'sha256.bloom'
+STALE_EXT = '.stale'
+DEFAULT_ERROR_RATE = 0.01
+
+MAGIC = b'DSBLOOM1'
+_HEADER = struct.Struct('<QQQ')
+_HEADER_SIZE = len(MAGIC) + _HEADER.size
+_DIGEST_PREFIX = struct.Struct('<QQ')
+
+
+def _positions(hexdigest, num_bits, num_hashes):
+    """return the bit positions of `hexdigest`, or None if it is not a valid
+    hex digest
+
+    """
+    try:
+        digest = binascii.unhexlify(hexdigest)
+    except (TypeError, ValueError, binascii.Error):
+        return None
+    if len(digest) != 32:
+        return None
+    (h1, h2) = _DIGEST_PREFIX.unpack(digest[:16])
+    h2 |= 1  # never 0, so that positions differ
+    return [(h1 + i * h2) % num_bits for i in range(num_hashes)]
+
+
+def parameters(count, error_rate=DEFAULT_ERROR_RATE):
+    """return the optimal <number of bits, number of hash functions> of a
+    filter holding `count` items with the given false positive rate
+
+    """
+    count = max(count, 1)
+    num_bits = int(math.ceil(-count * math.log(error_rate) /
+                             math.log(2) ** 2))
+    num_bits = max(64, (num_bits + 7) // 8 * 8)
+    num_hashes = max(1, int(round(num_bits / count * math.log(2))))
+    return (num_bits, num_hashes)
+
+
+class BloomFilter(object):
+    """Bloom filter of hex SHA256 digests, over a bytearray (when built) or a
+    read-only mmap (when loaded)
+
+    """
+
+    def __init__(self, num_bits, num_hashes, bits=None, count=0, offset=0):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.count = count
+        if bits is None:
+            bits = bytearray(num_bits // 8)
+        self.bits = bits
+        self._offset = offset  # of the bit array in `bits`
+        if six.PY2 and isinstance(bits, mmap.mmap):
+            self._byte = lambda i: ord(bits[i])  # mmap items are str
+        else:
+            self._byte = bits.__getitem__
+
+    @classmethod
+    def for_count(cls, count, error_rate=DEFAULT_ERROR_RATE):
+        return cls(*parameters(count, error_rate))
+
+    def add(self, hexdigest):
+        positions = _positions(hexdigest, self.num_bits, self.num_hashes)
+        if positions is None:
+            raise ValueError('invalid SHA256 digest: %r' % (hexdigest,))
+        bits = self.bits
+        for pos in positions:
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, hexdigest):
+        """False if `hexdigest` has definitely not been added (or is not a
+        SHA256 hex digest); True if it probably has
+
+        """
+        positions = _positions(hexdigest, self.num_bits, self.num_hashes)
+        if positions is None:
+            return False
+        (byte, offset) = (self._byte, self._offset)
+        for pos in positions:
+            if not byte(offset + (pos >> 3)) & (1 << (pos & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def write(self, path):
+        """(atomically) write the filter to `path`"""
+        with open(path + '.new', 'wb') as out:
+            out.write(MAGIC)
+            out.write(_HEADER.pack(self.num_bits, self.num_hashes,
+                                   self.count))
+            out.write(self.bits)
+        os.rename(path + '.new', path)
+
+    def close(self):
+        if isinstance(self.bits, mmap.mmap):
+            self.bits.close()
+
+
+def load(path):
+    """memory-map the filter stored in `path`; return None if there is no
+    (valid) filter there
+
+    """
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+    with f:
+        header = f.read(_HEADER_SIZE)
+        if len(header) < _HEADER_SIZE or not header.startswith(MAGIC):
+            return None
+        (num_bits, num_hashes, count) = _HEADER.unpack(header[len(MAGIC):])
+        if os.fstat(f.fileno()).st_size != _HEADER_SIZE + num_bits // 8:
+            return None
+        bits = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return BloomFilter(num_bits, num_hashes, bits, count, _HEADER_SIZE)
+
+
+def stale_marker(path):
+    """return the path of the file marking the filter in `path` as stale"""
+    return path + STALE_EXT
+
+
+def mark_stale(path):
+    """mark the filter in `path` as stale, i.e. missing checksums that have
+    been added to the DB since it was built
+
+    to be called once the additions are committed: the marker is removed when
+    a new build starts, before it reads the DB. Nothing is done if there is
+    no filter
+
+    """
+    if os.path.exists(path):
+        with open(stale_marker(path), 'a'):
+            pass
+
+
+def build_sha256_filter(session, path, error_rate=DEFAULT_ERROR_RATE):
+    """build the filter of all checksums in the DB (as listed by the
+    checksum_stats table) and write it to `path`, clearing its stale marker
+
+    return the number of checksums in the filter
+
+    """
+    try:
+        os.unlink(stale_marker(path))
+    except OSError:  # not stale
+        pass
+    count = session.query(ChecksumStats).count()
+    bloom = BloomFilter.for_count(count, error_rate)
+    q = session.query(ChecksumStats.sha256).yield_per(100000)
+    for (sha256,) in q:
+        bloom.add(sha256)
+    bloom.write(path)
+    return len(bloom)
@@ -0,0 +1,238 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""parallel, resumable (re)loading of DB tables from FS storage metadata files
+(e.g. .ctags, .checksums), see bin/debsources-bulk-insert-*
+
+All package IDs are resolved upfront, in one query, as are the packages that
+already have rows in the target table. Metadata files are then loaded by a
+pool of worker processes, each one with its own DB connection, one package
+per transaction, via db_storage.copy_columns (i.e. COPY on PostgreSQL).
+Completed files are recorded in an optional checkpoint file, so that an
+interrupted load can be resumed. Derived tables (e.g. checksum_stats) are
+refreshed once, at the end of the load.
+
+"""
+
+from __future__ import absolute_import
+
+import logging
+import multiprocessing
+import os
+import time
+
+from six.moves import map
+from sqlalchemy import create_engine, distinct
+from sqlalchemy.orm import sessionmaker
+
+from debsources import bloom
+from debsources import db_storage
+from debsources import fs_storage
+from debsources.models import Checksum, Ctag
+from debsources.package_tree import PackageTree
+from debsources.plugins import hook_checksums
+from debsources.plugins import hook_ctags
+
+
+def checksums_batches(path, package_id, file_id):
+    """yield column-wise batches of checksums rows from .checksums file"""
+    batch_size = hook_checksums.BULK_FLUSH_THRESHOLD
+    (sha256s, file_ids) = ([], [])
+    for (sha256, relpath) in hook_checksums.parse_checksums(path):
+        fid = file_id(relpath)
+        if fid is None:
+            continue
+        sha256s.append(sha256)
+        file_ids.append(fid)
+        if len(sha256s) >= batch_size:
+            yield [[package_id] * len(sha256s), sha256s, file_ids]
+            (sha256s, file_ids) = ([], [])
+    if sha256s:
+        yield [[package_id] * len(sha256s), sha256s, file_ids]
+
+
+def ctags_batches(path, package_id, file_id):
+    """yield column-wise batches of ctags rows from .ctags file"""
+    for batch in hook_ctags.parse_ctags_batches(path, file_id):
+        yield batch.columns(package_id)
+
+
+# what can be loaded: name -> (table, metadata file extension, columns,
+# batches function, function refreshing derived tables or None)
+LOADERS = {
+    'checksums': (Checksum.__table__, hook_checksums.MY_EXT,
+                  ['package_id', 'sha256', 'file_id'], checksums_batches,
+                  hook_checksums.refresh_stats),
+    'ctags': (Ctag.__table__, hook_ctags.MY_EXT,
+              ['package_id'] + hook_ctags.CtagsBatch.COLUMNS, ctags_batches,
+              None),
+}
+
+
+def loaded_packages(session, table):
+    """return the set of the IDs of packages that have rows in `table`"""
+    return set(package_id for (package_id,)
+               in session.query(distinct(table.c.package_id)))
+
+
+class Checkpoint(object):
+    """progress of a bulk load, stored in a file with one line per loaded
+    metadata file (relative to the sources dir)
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._out = None
+
+    def done(self):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path) as checkpoint:
+            return set(line.rstrip('\n') for line in checkpoint)
+
+    def record(self, relpath):
+        if self._out is None:
+            self._out = open(self.path, 'a')
+        self._out.write(relpath + '\n')
+        self._out.flush()
+
+    def close(self):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+
+
+# per-process state of workers, see _init_worker
+_worker = {}
+
+
+def _init_worker(db_uri, what):
+    engine = create_engine(db_uri)
+    _worker['Session'] = sessionmaker(bind=engine)
+    _worker['loader'] = LOADERS[what]
+
+
+def _load_file(task):
+    """load metadata file into the DB, in its own transaction
+
+    return a tuple <path, number of rows or None on error, elapsed time>
+
+    """
+    (path, package_id) = task
+    (table, ext, columns, batches, _refresh) = _worker['loader']
+    start = time.time()
+    session = _worker['Session']()
+    try:
+        pkgdir = path[:-len(ext)]
+        file_table = PackageTree.from_db(session, package_id, pkgdir)
+        rows = 0
+        for values in batches(path, package_id, file_table.get):
+            rows += db_storage.copy_columns(session, table, columns, values)
+        session.commit()
+    except:
+        logging.exception('cannot load %s' % path)
+        session.rollback()
+        rows = None
+    finally:
+        session.close()
+    return (path, rows, time.time() - start)
+
+
+def tasks(conf, what, session, paths=None, done=()):
+    """list the <path, package_id> pairs of metadata files still to be loaded
+
+    metadata files are either given as `paths` or looked for in the sources
+    dir. Files listed in `done` (relative to the sources dir), of packages not
+    in the DB, and of packages which already have rows, are skipped
+
+    """
+    (table, ext, _columns, _batches, _refresh) = LOADERS[what]
+    if paths is None:
+        paths = fs_storage.walk(conf['sources_dir'],
+                                test=lambda p: p.endswith(ext))
+    ids = db_storage.package_ids(session)
+    loaded = loaded_packages(session, table)
+    todo = []
+    for path in paths:
+        if os.path.relpath(path, conf['sources_dir']) in done:
+            continue
+        steps = path.split('/')
+        (package, version) = (steps[-2], steps[-1][:-len(ext)])
+        package_id = ids.get((package, version))
+        if package_id is None:
+            logging.warn('skipping %s/%s (does not exist in DB)' %
+                         (package, version))
+        elif package_id in loaded:
+            logging.info('skipping %s/%s (already inserted)' %
+                         (package, version))
+        else:
+            todo.append((path, package_id))
+    return todo
+
+
+def bulk_load(conf, what, paths=None, jobs=1, checkpoint=None):
+    """load `what` (a key of LOADERS) into the DB, from metadata files
+
+    see tasks() for `paths`; `checkpoint` is an optional Checkpoint. Use
+    `jobs` worker processes (0 means one per CPU core; 1 means loading in the
+    current process). Return the pair <loaded files, failed files>
+
+    """
+    engine = create_engine(conf['db_uri'])
+    session = sessionmaker(bind=engine)()
+    try:
+        done = checkpoint.done() if checkpoint else ()
+        todo = tasks(conf, what, session, paths, done)
+    finally:
+        session.close()
+        engine.dispose()  # do not share connections with workers
+    logging.info('%d file(s) to load into %s' % (len(todo), what))
+
+    if jobs == 1:
+        _init_worker(conf['db_uri'], what)
+        results = map(_load_file, todo)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(jobs or None, _init_worker,
+                                    (conf['db_uri'], what))
+        results = pool.imap_unordered(_load_file, todo)
+
+    (loaded, failed) = (0, 0)
+    try:
+        for (path, rows, elapsed) in results:
+            if rows is None:
+                failed += 1
+                continue
+            loaded += 1
+            logging.debug('loaded %s: %d row(s) in %.2fs' %
+                          (path, rows, elapsed))
+            if checkpoint:
+                checkpoint.record(os.path.relpath(path, conf['sources_dir']))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if checkpoint:
+            checkpoint.close()
+
+    refresh = LOADERS[what][4]
+    if loaded and refresh is not None:
+        logging.info('refreshing tables derived from %s...' % what)
+        session = sessionmaker(bind=engine)()
+        try:
+            refresh(session)
+            session.commit()
+        finally:
+            session.close()
+    if loaded and what == 'checksums':
+        bloom.mark_stale(os.path.join(conf['cache_dir'], bloom.SHA256_FILTER))
+    return (loaded, failed)
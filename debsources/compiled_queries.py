@@ -0,0 +1,128 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""precompiled SQL statements for the hottest lookups of the web app
+
+Statements are built once, as SQLAlchemy Core constructs with bind
+parameters, and their compiled form is cached per dialect, so that each
+lookup only costs a DB round trip (no ORM query building, compilation, or
+object instantiation). Results are returned as plain namedtuples.
+
+"""
+
+from __future__ import absolute_import
+
+from collections import namedtuple
+
+from sqlalchemy import bindparam, select
+
+from debsources.models import Checksum, File, Package, PackageName, Suite
+
+_packages = Package.__table__
+_package_names = PackageName.__table__
+_files = File.__table__
+_checksums = Checksum.__table__
+_suites = Suite.__table__
+
+# compiled forms of the statements below, shared by all connections
+_compiled_cache = {}
+
+
+class PackageRow(namedtuple('PackageRow',
+                            ['id', 'name', 'version', 'area', 'vcs_type',
+                             'vcs_url', 'vcs_browser', 'sticky'])):
+    """a (versioned) source package, as the Package model"""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        return dict(version=self.version, area=self.area)
+
+
+FileRow = namedtuple('FileRow', ['id', 'package_id', 'path'])
+
+
+_package_q = (
+    select([_packages.c.id, _package_names.c.name, _packages.c.version,
+            _packages.c.area, _packages.c.vcs_type, _packages.c.vcs_url,
+            _packages.c.vcs_browser, _packages.c.sticky])
+    .where(_packages.c.name_id == _package_names.c.id)
+    .where(_package_names.c.name == bindparam('name'))
+    .where(_packages.c.version == bindparam('version'))
+    .limit(1))
+
+_file_q = (
+    select([_files.c.id, _files.c.package_id, _files.c.path])
+    .where(_files.c.package_id == _packages.c.id)
+    .where(_packages.c.name_id == _package_names.c.id)
+    .where(_package_names.c.name == bindparam('name'))
+    .where(_packages.c.version == bindparam('version'))
+    .where(_files.c.path == bindparam('path'))
+    .limit(1))
+
+_sha256_q = (
+    select([_checksums.c.sha256])
+    .where(_checksums.c.file_id == _files.c.id)
+    .where(_files.c.package_id == _packages.c.id)
+    .where(_packages.c.name_id == _package_names.c.id)
+    .where(_package_names.c.name == bindparam('name'))
+    .where(_packages.c.version == bindparam('version'))
+    .where(_files.c.path == bindparam('path'))
+    .limit(1))
+
+# suites are looked up for a variable number of packages: the statement is
+# built per call with a plain IN list (expanding bind parameters, which could
+# be compiled once, need SQLAlchemy >= 1.2), and is not compiled-cached
+_suites_q = select([_suites.c.package_id, _suites.c.suite])
+
+
+def _execute(session, stmt, **params):
+    conn = session.connection().execution_options(
+        compiled_cache=_compiled_cache)
+    return conn.execute(stmt, **params)
+
+
+def package(session, name, version):
+    """return the PackageRow of package `name` at `version`, or None"""
+    row = _execute(session, _package_q, name=name, version=version).first()
+    return PackageRow(*row) if row is not None else None
+
+
+def file_(session, name, version, path):
+    """return the FileRow of file `path` in package `name`/`version`, or None
+
+    `path` is relative to the package root, as a byte string
+    """
+    row = _execute(session, _file_q, name=name, version=version,
+                   path=path).first()
+    return FileRow(*row) if row is not None else None
+
+
+def file_sha256(session, name, version, path):
+    """return the SHA256 checksum of file `path` in package `name`/`version`,
+    or None if unknown
+
+    """
+    return _execute(session, _sha256_q, name=name, version=version,
+                    path=path).scalar()
+
+
+def suites(session, package_ids):
+    """return a dictionary mapping each of `package_ids` to the (unsorted)
+    list of names of the suites it belongs to
+
+    """
+    result = dict((package_id, []) for package_id in package_ids)
+    if result:
+        q = _suites_q.where(_suites.c.package_id.in_(list(result)))
+        for (package_id, suite) in session.connection().execute(q):
+            result[package_id].append(suite)
+    return result
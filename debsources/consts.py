@@ -122,3 +122,10 @@ SUITES['all'].append('experimental')
 DPKG_EXTRACT_UMASK = 0o022
 
 COPYRIGHT_ORACLES = ['debian']
+
+# granularities of rolled up history samples, see statistics.compact_history
+HISTORY_GRANULARITIES = ['day', 'week', 'month']
+
+# update jobs, see debsources/jobqueue.py
+JOB_ACTIONS = ['add-package', 'rm-package', 'hook']
+JOB_STATES = ['pending', 'running', 'done', 'failed']
@@ -0,0 +1,121 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""management of DB indexes
+
+Compare the indexes declared in debsources.models with those actually
+present in a DB, and create missing ones / drop stale ones. Indexes backing
+primary keys and unique constraints are part of table definitions and are
+left alone.
+
+"""
+
+from __future__ import absolute_import
+
+import logging
+import re
+
+from collections import namedtuple
+
+import sqlalchemy
+from sqlalchemy.schema import CreateIndex
+
+from debsources.models import Base
+
+IndexSpec = namedtuple('IndexSpec', ['table', 'name', 'columns', 'unique'])
+
+
+def _spec_of_index(index):
+    return IndexSpec(index.table.name, index.name,
+                     tuple(c.name for c in index.columns), bool(index.unique))
+
+
+def expected_indexes(metadata=Base.metadata):
+    """return the Index objects declared in `metadata`, by name"""
+    return dict((index.name, index)
+                for table in metadata.sorted_tables
+                for index in table.indexes)
+
+
+def actual_indexes(bind, tables):
+    """return the IndexSpec-s of the indexes on `tables` found in the DB
+    `bind` is connected to, by name
+
+    """
+    inspector = sqlalchemy.inspect(bind)
+    known_tables = set(inspector.get_table_names())
+    indexes = {}
+    for table in tables:
+        if table not in known_tables:
+            continue
+        for index in inspector.get_indexes(table):
+            if index.get('duplicates_constraint'):
+                continue
+            indexes[index['name']] = IndexSpec(table, index['name'],
+                                               tuple(index['column_names']),
+                                               bool(index['unique']))
+    return indexes
+
+
+def diff_indexes(bind, metadata=Base.metadata):
+    """compare the indexes declared in `metadata` with those in the DB
+
+    return a pair <missing, stale>, where missing is a list of Index objects
+    declared in `metadata` but not found (or found with a different
+    definition) in the DB, and stale a list of IndexSpec-s of indexes found
+    in the DB but not (or differently) declared in `metadata`. Only tables
+    declared in `metadata` are considered
+
+    """
+    expected = expected_indexes(metadata)
+    actual = actual_indexes(bind, [t.name for t in metadata.sorted_tables])
+    missing, stale = [], []
+    for name, index in sorted(expected.items()):
+        if actual.get(name) != _spec_of_index(index):
+            missing.append(index)
+    for name, spec in sorted(actual.items()):
+        if name not in expected or _spec_of_index(expected[name]) != spec:
+            stale.append(spec)
+    return missing, stale
+
+
+def _execute_ddl(bind, ddl, concurrently):
+    logging.info('%s' % ddl)
+    if concurrently:
+        # CONCURRENTLY cannot run inside a transaction block
+        with bind.connect() as conn:
+            conn.execution_options(isolation_level='AUTOCOMMIT').execute(ddl)
+    else:
+        bind.execute(ddl)
+
+
+def create_indexes(bind, indexes, concurrently=False):
+    """create `indexes` (Index objects) in the DB
+
+    `concurrently` requires PostgreSQL; it avoids locking tables against
+    writes for the duration of the index build
+
+    """
+    for index in indexes:
+        ddl = str(CreateIndex(index).compile(dialect=bind.dialect))
+        if concurrently:
+            ddl = re.sub(r'^CREATE (UNIQUE )?INDEX ',
+                         r'CREATE \1INDEX CONCURRENTLY ', ddl)
+        _execute_ddl(bind, ddl, concurrently)
+
+
+def drop_indexes(bind, specs, concurrently=False):
+    """drop the indexes described by `specs` (IndexSpec-s) from the DB"""
+    quote = bind.dialect.identifier_preparer.quote
+    for spec in specs:
+        ddl = 'DROP INDEX %s%s' % ('CONCURRENTLY ' if concurrently else '',
+                                   quote(spec.name))
+        _execute_ddl(bind, ddl, concurrently)
@@ -0,0 +1,157 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""optional partitioned layout of the biggest per-package tables
+
+Tables like ctags and checksums can be hash-partitioned on package_id
+(requires PostgreSQL >= 11). Each partition then has its own, smaller
+indexes, which makes per-package removals (see the rm_package hooks) touch
+less index pages, lets autovacuum process partitions independently, and
+allows partition-wise parallel scans of lookups like query.find_ctag.
+
+The layout is transparent to the code: table, index, and sequence names are
+unchanged. Only tables that are not referenced by foreign keys can be
+partitioned (PostgreSQL requires unique keys of partitioned tables to
+include the partition key), which rules out e.g. files.
+
+"""
+
+from __future__ import absolute_import
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from debsources.models import Base
+
+PARTITION_KEY = 'package_id'
+PARTITIONABLE_TABLES = ['ctags', 'checksums']
+DEFAULT_PARTITIONS = 16
+MIN_SERVER_VERSION = 110000  # as in server_version_num
+
+
+def partition_name(table, remainder):
+    return '%s_p%d' % (table, remainder)
+
+
+def check_partitionable(table, metadata=Base.metadata):
+    """raise ValueError if `table` cannot be partitioned on PARTITION_KEY"""
+    t = metadata.tables[table]
+    if PARTITION_KEY not in t.c:
+        raise ValueError('table %s has no %s column' % (table, PARTITION_KEY))
+    for other in metadata.sorted_tables:
+        for fk in other.foreign_keys:
+            if fk.column.table is t:
+                raise ValueError('table %s is referenced by %s.%s'
+                                 % (table, other.name, fk.parent.name))
+    for constraint in t.constraints:
+        cols = [c.name for c in getattr(constraint, 'columns', [])]
+        if constraint.__visit_name__ == 'unique_constraint' \
+           and PARTITION_KEY not in cols:
+            raise ValueError('unique constraint on %s(%s) lacks %s'
+                             % (table, ', '.join(cols), PARTITION_KEY))
+
+
+def _keys_and_indexes_ddl(t, primary_key):
+    """SQL statements (re)creating the keys, foreign keys, and indexes of
+    table `t`, once its content is in place
+
+    """
+    dialect = postgresql.dialect()
+    quote = dialect.identifier_preparer.quote
+    stmts = ['ALTER TABLE %s ADD PRIMARY KEY (%s)'
+             % (t.name, ', '.join(primary_key))]
+    for constraint in sorted(t.constraints, key=lambda c: c.__visit_name__):
+        cols = ', '.join(quote(c.name) for c in constraint.columns)
+        if constraint.__visit_name__ == 'unique_constraint':
+            stmts.append('ALTER TABLE %s ADD UNIQUE (%s)' % (t.name, cols))
+        elif constraint.__visit_name__ == 'foreign_key_constraint':
+            fk = list(constraint.elements)[0]
+            ondelete = ''
+            if constraint.ondelete:
+                ondelete = ' ON DELETE %s' % constraint.ondelete
+            stmts.append('ALTER TABLE %s ADD FOREIGN KEY (%s) '
+                         'REFERENCES %s (%s)%s'
+                         % (t.name, cols, fk.column.table.name,
+                            quote(fk.column.name), ondelete))
+    for index in sorted(t.indexes, key=lambda i: i.name):
+        stmts.append(str(CreateIndex(index).compile(dialect=dialect)))
+    stmts.append('ANALYZE %s' % t.name)
+    return stmts
+
+
+def _swap_table_ddl(table, new):
+    """SQL statements replacing `table` with the (filled) table `new`, while
+    preserving the id sequence of `table`
+
+    """
+    seq = '%s_id_seq' % table
+    return ['ALTER SEQUENCE %s OWNED BY NONE' % seq,
+            'DROP TABLE %s' % table,  # partitions, if any, are dropped along
+            'ALTER TABLE %s RENAME TO %s' % (new, table),
+            'ALTER SEQUENCE %s OWNED BY %s.id' % (seq, table)]
+
+
+def partition_ddl(table, partitions=DEFAULT_PARTITIONS,
+                  metadata=Base.metadata):
+    """return the list of SQL statements converting `table` to a
+    hash-partitioned table with `partitions` partitions, preserving its
+    content, indexes, constraints, and id sequence
+
+    statements should be run in a single transaction; the table is locked
+    (and copied) for its whole duration
+
+    """
+    check_partitionable(table, metadata)
+    new = table + '_partitioned'
+    stmts = [
+        'CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS) PARTITION BY HASH (%s)'
+        % (new, table, PARTITION_KEY),
+    ]
+    for i in range(partitions):
+        stmts.append('CREATE TABLE %s PARTITION OF %s '
+                     'FOR VALUES WITH (MODULUS %d, REMAINDER %d)'
+                     % (partition_name(table, i), new, partitions, i))
+    stmts.append('INSERT INTO %s SELECT * FROM %s' % (new, table))
+    stmts.extend(_swap_table_ddl(table, new))
+    # primary and unique keys must include the partition key
+    stmts.extend(_keys_and_indexes_ddl(metadata.tables[table],
+                                       ['id', PARTITION_KEY]))
+    return stmts
+
+
+def unpartition_ddl(table, metadata=Base.metadata):
+    """return the list of SQL statements reverting partition_ddl(table)"""
+    new = table + '_unpartitioned'
+    stmts = [
+        'CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS)' % (new, table),
+        'INSERT INTO %s SELECT * FROM %s' % (new, table),
+    ]
+    stmts.extend(_swap_table_ddl(table, new))
+    stmts.extend(_keys_and_indexes_ddl(metadata.tables[table], ['id']))
+    return stmts
+
+
+def is_partitioned(bind, table):
+    """return True if `table` is a partitioned table in the DB"""
+    return bool(bind.execute(
+        "SELECT count(*) FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = %(table)s "
+        "AND pg_table_is_visible(c.oid)", {'table': table}).scalar())
+
+
+def check_server(bind):
+    """raise RuntimeError if the DB server does not support hash
+    partitioning"""
+    version = int(bind.execute('SHOW server_version_num').scalar())
+    if version < MIN_SERVER_VERSION:
+        raise RuntimeError('hash partitioning requires PostgreSQL >= 11 '
+                           '(server_version_num: %d)' % version)
@@ -11,11 +11,20 @@
 
 from __future__ import absolute_import
 
+import io
 import logging
+import re
+
+from array import array
+
+import six
+
+from sqlalchemy import sql
 
-from debsources import fs_storage
 from debsources.models import File, Package, PackageName, SuiteInfo, Suite
 from debsources.models import VCS_TYPES
+from debsources.package_tree import PackageTree
+from debsources.version_key import version_key
 
 
 def add_package(session, pkg, pkgdir, sticky=False):
@@ -23,9 +32,10 @@ def add_package(session, pkg, pkgdir, sticky=False):
 
     If `sticky` is set, also set the corresponding bit in the versions table.
 
-    Return the package file table, which maps relative (file) path within the
-    extracted package to file identifiers pointing into the `models.File`
-    table.  Suitable usages of the file table include:
+    Return the package file table, a `package_tree.PackageTree` which maps
+    relative (file) path within the extracted package to file identifiers
+    pointing into the `models.File` table.  Suitable usages of the file table
+    include:
 
     - DB cache to avoid re-fetching all file IDs
     - FS cache to avoid re-scanning package dir to iterate over file names
@@ -43,29 +53,31 @@ def add_package(session, pkg, pkgdir, sticky=False):
                         .filter_by(version=pkg['version'],
                                    name_id=package_name.id) \
                         .first()
-    if not db_package:
-        db_package = Package(pkg['version'], package_name, sticky)
-        db_package.area = pkg.archive_area()
-        if 'vcs-browser' in pkg:
-            db_package.vcs_browser = pkg['vcs-browser']
-        for vcs_type in VCS_TYPES:
-            vcs_key = 'vcs-' + vcs_type
-            if vcs_key in pkg:
-                db_package.vcs_type = vcs_type
-                db_package.vcs_url = pkg[vcs_key]
-        package_name.versions.append(db_package)
-        session.add(db_package)
-        session.flush()  # to get a version.id, needed by File below
-
-        # add individual source files to the File table
-        file_table = {}
-        for (relpath, _abspath) in fs_storage.walk_pkg_files(pkgdir):
-            file_ = File(db_package, relpath)
-            session.add(file_)
-            session.flush()
-            file_table[relpath] = file_.id
-
-        return file_table
+    if db_package:
+        return PackageTree.from_db(session, db_package.id, pkgdir)
+
+    db_package = Package(pkg['version'], package_name, sticky)
+    db_package.area = pkg.archive_area()
+    if 'vcs-browser' in pkg:
+        db_package.vcs_browser = pkg['vcs-browser']
+    for vcs_type in VCS_TYPES:
+        vcs_key = 'vcs-' + vcs_type
+        if vcs_key in pkg:
+            db_package.vcs_type = vcs_type
+            db_package.vcs_url = pkg[vcs_key]
+    package_name.versions.append(db_package)
+    session.add(db_package)
+    session.flush()  # to get a version.id, needed by File below
+
+    # add individual source files to the File table
+    file_table = PackageTree.from_fs(pkgdir)
+    files = [File(db_package, relpath) for relpath in sorted(file_table)]
+    session.add_all(files)
+    session.flush()
+    for file_ in files:
+        file_table[file_.path] = file_.id
+
+    return file_table
 
 
 def rm_package(session, pkg, db_package):
@@ -88,6 +100,38 @@ def lookup_package(session, package, version):
                   .first()
 
 
+def package_ids(session):
+    """return a dictionary mapping all <package, version> pairs in the DB to
+    package IDs, using a single query
+
+    """
+    q = session.query(PackageName.name, Package.version, Package.id) \
+               .join(Package)
+    return dict(((name, version), package_id)
+                for (name, version, package_id) in q)
+
+
+def fill_version_keys(session, all_packages=False, batch_size=10000):
+    """compute the version_key of packages that lack one (or of all
+    packages), e.g. after a migration or a change of the key format
+
+    return the number of updated packages
+
+    """
+    q = session.query(Package.id, Package.version)
+    if not all_packages:
+        q = q.filter(Package.version_key.is_(None))
+    params = [{'package_id': package_id, 'key': version_key(version)}
+              for (package_id, version) in q]
+    packages = Package.__table__
+    update_q = packages.update() \
+                       .where(packages.c.id == sql.bindparam('package_id')) \
+                       .values(version_key=sql.bindparam('key'))
+    for i in range(0, len(params), batch_size):
+        session.execute(update_q, params[i:i + batch_size])
+    return len(params)
+
+
 def lookup_db_suite(session, suite, sticky=False):
     return session.query(SuiteInfo) \
                   .filter_by(name=suite, sticky=sticky) \
@@ -119,8 +163,8 @@ def pkg_prefixes(session):
 
 
 def rm_file(session, package, relpath, file_table=None):
-    if file_table:
-        file_id = file_table[relpath]
+    file_id = file_table.get(relpath) if file_table else None
+    if file_id is not None:
         file_ = session.query(File).filter_by(id=file_id).first()
     else:
         file_ = session.query(File) \
@@ -128,4 +172,104 @@ def rm_file(session, package, relpath, file_table=None):
                        .join(PackageName) \
                        .filter_by(name=package, path=relpath) \
                        .first()
-    session.delete(file_)
+    if file_ is not None:
+        session.delete(file_)
+
+
+# characters to be escaped in the text format of COPY, see COPY(7)
+_COPY_ESCAPES = {b'\\': b'\\\\', b'\t': b'\\t', b'\n': b'\\n', b'\r': b'\\r'}
+_COPY_SPECIAL_RE = re.compile(b'[\\\\\t\n\r]')
+_COPY_NULL = b'\\N'
+if six.PY2:
+    _copy_int = str  # much faster than formatting
+else:
+    def _copy_int(value):
+        return b'%d' % value
+
+
+def _copy_escape(value):
+    return _COPY_SPECIAL_RE.sub(lambda m: _COPY_ESCAPES[m.group()], value)
+
+
+def _copy_value(value):
+    """encode `value` as a field of COPY text format"""
+    if value is None:
+        return _COPY_NULL
+    if isinstance(value, six.text_type):
+        value = value.encode('utf-8')
+    elif not isinstance(value, bytes):
+        return six.text_type(value).encode('ascii')  # ints, mostly
+    return _copy_escape(value)
+
+
+def _copy_column(values):
+    """encode a sequence of values as COPY text format fields
+
+    values of a column are (mostly) of the same type, which allows to encode
+    them with a few list comprehensions rather than a function call each
+
+    """
+    if isinstance(values, array):
+        return list(map(_copy_int, values))
+    types = set(map(type, values))
+    nullable = type(None) in types
+    types.discard(type(None))
+    if not nullable and types <= set(six.integer_types):
+        return list(map(_copy_int, values))
+    if not types <= set([six.text_type, bytes]):
+        return [_copy_value(v) for v in values]
+    if six.text_type in types:
+        values = [v.encode('utf-8') if type(v) is six.text_type else v
+                  for v in values]
+    non_null = [v for v in values if v is not None] if nullable else values
+    if _COPY_SPECIAL_RE.search(b''.join(non_null)):
+        values = [_copy_escape(v) if v is not None else v for v in values]
+    if nullable:
+        values = [_COPY_NULL if v is None else v for v in values]
+    return values
+
+
+def copy_columns(session, table, columns, values):
+    """bulk insert rows into `table`, given column-wise: `values` is a list of
+    sequences (lists, arrays, etc.) of the same length, one for each column
+    name in `columns`
+
+    With PostgreSQL (via psycopg2) rows are streamed with COPY FROM STDIN,
+    which avoids building a parameter dictionary per row and is several times
+    faster than INSERT; with other DBs an executemany() INSERT is used
+    instead. Rows are sent within the current transaction of `session`, which
+    should have been flushed if they refer to pending objects. Byte strings
+    are sent as they are, i.e. as text: bytea columns are not supported.
+
+    return the number of inserted rows
+
+    """
+    count = len(values[0]) if values else 0
+    if not count:
+        return 0
+    conn = session.connection()
+    if conn.dialect.driver != 'psycopg2':
+        conn.execute(sql.insert(table),
+                     [dict(zip(columns, row)) for row in zip(*values)])
+        return count
+
+    fields = [_copy_column(column) for column in values]
+    buf = io.BytesIO()
+    buf.write(b'\n'.join(map(b'\t'.join, zip(*fields))))
+    buf.write(b'\n')
+    buf.seek(0)
+    stmt = 'COPY %s (%s) FROM STDIN' % (table.name, ', '.join(columns))
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(stmt, buf)
+    finally:
+        cursor.close()
+    return count
+
+
+def copy_rows(session, table, columns, rows):
+    """like copy_columns, but for rows given as an iterable of tuples of
+    values for `columns`
+
+    """
+    return copy_columns(session, table, columns, list(zip(*rows)))
@@ -163,7 +163,9 @@ class SourceMirror(object):
         """
         self.mirror_root = path
         self._suites = None    # dict: suite name -> [<package, version>]
-        self._packages = None  # set(<package, version>)
+        # dict: <package, version> -> itself, used as a set whose elements
+        # are shared with _suites, rather than duplicated for each suite
+        self._packages = None
         self._dists_dir = os.path.join(path, 'dists')
 
     @property
@@ -181,7 +183,8 @@ class SourceMirror(object):
 
     @property
     def packages(self):
-        """return the mirror packages as a set of <package, version> paris
+        """return the mirror packages as a set-like collection (supporting
+        membership tests and iteration) of <package, version> pairs
 
         Note: for efficient use, this property is best accessed after having
         used the ls() method
@@ -234,7 +237,7 @@ class SourceMirror(object):
 
         """
         self._suites = {}
-        self._packages = set()
+        self._packages = {}
 
         for cursuite, src_index in self.__find_Sources_gz():
             if suite is not None and cursuite != suite:
@@ -242,13 +245,14 @@ class SourceMirror(object):
             with open(src_index) as i:
                 for pkg in SourcePackage.iter_paragraphs(i):
                     pkg_id = (pkg['package'], pkg['version'])
+                    known_id = self._packages.get(pkg_id)
 
                     if cursuite not in self._suites:
                         self._suites[cursuite] = []
-                    self._suites[cursuite].append(pkg_id)
+                    self._suites[cursuite].append(known_id or pkg_id)
 
-                    if pkg_id not in self._packages:
-                        self._packages.add(pkg_id)
+                    if known_id is None:
+                        self._packages[pkg_id] = pkg_id
                         pkg['x-debsources-mirror-root'] = self.mirror_root
                         yield pkg
 
@@ -0,0 +1,181 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""run commands in unpacked source package dirs, see bin/debsources-foreach
+and doc/sources-cache.txt
+
+"""
+
+from __future__ import absolute_import
+
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from debsources.subprocess_workaround import subprocess_setup
+
+# an entry of the sources.txt cache; dsc and dir are relative to the mirror
+# and sources dirs, respectively; suites is a list
+SourceEntry = namedtuple('SourceEntry', ['package', 'version', 'area', 'dsc',
+                                         'dir', 'suites'])
+
+# outcome of running a command on a package
+Result = namedtuple('Result', ['entry', 'returncode', 'elapsed', 'output'])
+
+
+def read_sources_txt(path):
+    """parse the sources.txt cache at `path`, yielding SourceEntry-s"""
+    with open(path) as srclist:
+        for line in srclist:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 6:
+                fields.extend([''] * (6 - len(fields)))
+            suites = [s for s in fields[5].split(',') if s]
+            yield SourceEntry(*(fields[:5] + [suites]))
+
+
+def filter_entries(entries, suites=None, areas=None, done=None):
+    """filter SourceEntry-s, keeping those belonging to any of `suites` and
+    `areas` (if given) and not in `done` (a set of <package, version> pairs)
+
+    """
+    for entry in entries:
+        if suites and not set(suites).intersection(entry.suites):
+            continue
+        if areas and entry.area not in areas:
+            continue
+        if done and (entry.package, entry.version) in done:
+            continue
+        yield entry
+
+
+def package_env(entry, mirror_dir, sources_dir, base_env=None):
+    """return the environment to run commands on package `entry` with"""
+    env = dict(os.environ if base_env is None else base_env)
+    env.update({
+        'DEBSOURCES_PACKAGE': entry.package,
+        'DEBSOURCES_VERSION': entry.version,
+        'DEBSOURCES_AREA': entry.area,
+        'DEBSOURCES_DSC': os.path.join(mirror_dir, entry.dsc),
+        'DEBSOURCES_DIR': os.path.join(sources_dir, entry.dir),
+        'DEBSOURCES_SUITES': ','.join(entry.suites),
+    })
+    return env
+
+
+class ProgressState(object):
+    """resumable progress state, stored in a tab-separated file with one line
+    per processed package: PACKAGE VERSION RETURNCODE ELAPSED
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._out = None
+
+    def done(self):
+        """return the set of <package, version> pairs already processed
+        successfully
+
+        """
+        done = set()
+        if os.path.exists(self.path):
+            with open(self.path) as state:
+                for line in state:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) >= 3 and fields[2] == '0':
+                        done.add((fields[0], fields[1]))
+        return done
+
+    def record(self, result):
+        with self._lock:
+            if self._out is None:
+                self._out = open(self.path, 'a')
+            self._out.write('%s\t%s\t%d\t%.3f\n'
+                            % (result.entry.package, result.entry.version,
+                               result.returncode, result.elapsed))
+            self._out.flush()
+
+    def close(self):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+
+
+def run_command(command, entry, mirror_dir, sources_dir, capture=False):
+    """run shell `command` in the unpacked dir of package `entry`
+
+    return a Result, or None if the package dir does not exist. If `capture`
+    is set, command output (stdout and stderr) is returned in the Result
+    rather than being inherited
+
+    """
+    pkgdir = os.path.join(sources_dir, entry.dir)
+    if not os.path.isdir(pkgdir):
+        logging.warn('directory for %s/%s does not exist, skipping.'
+                     % (entry.package, entry.version))
+        return None
+    env = package_env(entry, mirror_dir, sources_dir)
+    start = time.time()
+    proc = subprocess.Popen(command, shell=True, executable='/bin/bash',
+                            cwd=pkgdir, env=env, preexec_fn=subprocess_setup,
+                            stdout=subprocess.PIPE if capture else None,
+                            stderr=subprocess.STDOUT if capture else None)
+    output = proc.communicate()[0]
+    return Result(entry, proc.returncode, time.time() - start, output)
+
+
+def foreach(command, entries, mirror_dir, sources_dir, jobs=1, state=None,
+            callback=None):
+    """run shell `command` on all SourceEntry-s `entries`, `jobs` at a time
+
+    results are recorded in `state` (a ProgressState), if given, and passed
+    to `callback`, in completion order. Output of commands is inherited if
+    `jobs` is 1; otherwise it is captured, and it is up to `callback` to show
+    it (if desired) as a whole, without interleaving with other commands.
+
+    return the number of failed commands
+
+    """
+    failures = [0]
+
+    def run(entry):
+        return run_command(command, entry, mirror_dir, sources_dir,
+                           capture=jobs > 1)
+
+    def handle(result):
+        if result is None:
+            return
+        if result.returncode != 0:
+            failures[0] += 1
+        if state is not None:
+            state.record(result)
+        if callback is not None:
+            callback(result)
+
+    if jobs <= 1:
+        for entry in entries:
+            handle(run(entry))
+    else:
+        pool = ThreadPool(jobs)  # the actual work is done by subprocesses
+        try:
+            for result in pool.imap_unordered(run, list(entries)):
+                handle(result)
+        finally:
+            pool.terminate()
+            pool.join()
+    return failures[0]
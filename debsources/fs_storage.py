@@ -18,6 +18,7 @@ import subprocess
 
 import six
 
+from debsources import instrument
 from debsources.consts import DPKG_EXTRACT_UMASK
 from debsources.subprocess_workaround import subprocess_setup
 
@@ -39,7 +40,8 @@ def extract_package(pkg, destdir):
     cmd = ['dpkg-source', '--no-copy', '--no-check', '-x', dsc, destdir]
     logfile = destdir + '.log'
     donefile = destdir + '.done'
-    with open(logfile, 'w') as log:
+    with open(logfile, 'w') as log, \
+            instrument.timed('extract', 'dpkg-source'):
         subprocess.check_call(cmd, stdout=log, stderr=subprocess.STDOUT,
                               preexec_fn=preexec_fn)
     open(donefile, 'w').close()
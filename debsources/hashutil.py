@@ -12,15 +12,27 @@
 from __future__ import absolute_import
 
 import hashlib
+import mmap
+import multiprocessing
+import os
+
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
 # should be a multiple of 64 (sha1/sha256's block size)
 # FWIW coreutils' sha1sum uses 32768
 HASH_BLOCK_SIZE = 32768
 
+# files at least this big are mmap()-ed and hashed in one go, rather than
+# read block by block
+MMAP_THRESHOLD = 1024 * 1024
+
+FileHashes = namedtuple('FileHashes', ['sha1', 'sha256', 'size'])
+
 
 def sha1sum(path):
     m = hashlib.sha1()
-    with open(path) as f:
+    with open(path, 'rb') as f:
         while True:
             chunk = f.read(HASH_BLOCK_SIZE)
             if not chunk:
@@ -31,10 +43,72 @@ def sha1sum(path):
 
 def sha256sum(path):
     m = hashlib.sha256()
-    with open(path) as f:
+    with open(path, 'rb') as f:
         while True:
             chunk = f.read(HASH_BLOCK_SIZE)
             if not chunk:
                 break
             m.update(chunk)
     return m.hexdigest()
+
+
+def hash_file(path):
+    """compute sha1 and sha256 of file at `path`, reading it only once
+
+    return a FileHashes triple <sha1, sha256, size>. Big files are mmap()-ed;
+    hashlib releases the GIL while hashing, so that several files can be
+    hashed in parallel by different threads
+
+    """
+    sha1 = hashlib.sha1()
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                sha1.update(m)
+                sha256.update(m)
+            finally:
+                m.close()
+        else:
+            while True:
+                chunk = f.read(HASH_BLOCK_SIZE)
+                if not chunk:
+                    break
+                sha1.update(chunk)
+                sha256.update(chunk)
+    return FileHashes(sha1.hexdigest(), sha256.hexdigest(), size)
+
+
+def _hash_pair(pair):
+    (relpath, abspath) = pair
+    return (relpath, hash_file(abspath))
+
+
+def hash_files(files, jobs=None):
+    """hash files given as pairs <relpath, abspath>, using `jobs` threads
+    (default: number of CPUs)
+
+    yield pairs <relpath, FileHashes>, in the same order as `files`
+
+    """
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    if jobs <= 1:
+        for pair in files:
+            yield _hash_pair(pair)
+        return
+
+    # list beforehand: errors raised by an iterator consumed by the pool
+    # would be swallowed by its task handler thread
+    files = list(files)
+    pool = ThreadPool(jobs)
+    try:
+        # imap() preserves the walk order; chunks amortize the queueing
+        # overhead on small files
+        for result in pool.imap(_hash_pair, files, chunksize=16):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
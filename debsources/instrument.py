@@ -0,0 +1,366 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""timing instrumentation of update runs
+
+Code sections are timed with
+
+    with instrument.timed('hook', 'add-package/ctags'):
+        ...
+
+(or, for whole functions, with the @instrument.instrumented decorator) which
+accumulates, per <category, name> pair: number of runs, wall clock
+and CPU time (including that of child processes, e.g. dpkg-source or ctags),
+a histogram of wall clock times, the peak RSS of the process as of the end of
+the section, and the number and duration of the DB statements executed by
+engines passed to instrument_engine(). Timings are accumulated in a global
+Recorder, which can be dumped as a JSON report or as a Prometheus textfile (for
+node_exporter's textfile collector).
+
+Web requests are profiled separately, one RequestProfile per request: between
+start_profile() and stop_profile() the current thread accumulates the DB
+statements executed by engines passed to profile_engine(), and the time spent
+in code sections marked with
+
+    with instrument.section('magic'):
+        ...
+
+Outside of a profiled request, section() does nothing.
+
+"""
+
+from __future__ import absolute_import
+
+import functools
+import json
+import os
+import resource
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# upper bounds (in seconds) of histogram buckets; the last one is implicit
+# and catches all
+HISTOGRAM_BUCKETS = [0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800]
+
+
+def _cpu_time():
+    t = os.times()
+    return t[0] + t[1] + t[2] + t[3]  # user + system, self + children
+
+
+def _max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB
+
+
+class Stats(object):
+    """accumulated timings of a code section"""
+
+    def __init__(self):
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+        self.db_statements = 0
+        self.db_time = 0.0
+        self.max_rss = 0
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+
+    def add(self, wall, cpu, db_statements=0, db_time=0.0, max_rss=0):
+        self.count += 1
+        self.wall += wall
+        self.cpu += cpu
+        self.max_wall = max(self.max_wall, wall)
+        self.db_statements += db_statements
+        self.db_time += db_time
+        self.max_rss = max(self.max_rss, max_rss)
+        for (i, bound) in enumerate(HISTOGRAM_BUCKETS):
+            if wall <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def to_dict(self):
+        return dict(count=self.count, wall=self.wall, cpu=self.cpu,
+                    max_wall=self.max_wall, db_statements=self.db_statements,
+                    db_time=self.db_time, max_rss=self.max_rss,
+                    histogram=list(zip(HISTOGRAM_BUCKETS + ['+Inf'],
+                                       self.buckets)))
+
+
+class _Frame(object):
+    __slots__ = ['db_statements', 'db_time']
+
+    def __init__(self):
+        self.db_statements = 0
+        self.db_time = 0.0
+
+
+class Recorder(object):
+    """accumulator of timings, by category and name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.stats = {}  # category -> name -> Stats
+            self.db_statements = 0
+            self.db_time = 0.0
+
+    def _frames(self):
+        try:
+            return self._local.frames
+        except AttributeError:
+            frames = self._local.frames = []
+            return frames
+
+    @contextmanager
+    def timed(self, category, name):
+        frame = _Frame()
+        frames = self._frames()
+        frames.append(frame)
+        (wall, cpu) = (time.time(), _cpu_time())
+        try:
+            yield
+        finally:
+            (wall, cpu) = (time.time() - wall, _cpu_time() - cpu)
+            frames.pop()
+            with self._lock:
+                stats = self.stats.setdefault(category, {}) \
+                                  .setdefault(name, Stats())
+                stats.add(wall, cpu, frame.db_statements, frame.db_time,
+                          _max_rss())
+
+    def add_db_statement(self, duration):
+        """account a DB statement to the whole run and to all running timers
+        of the current thread
+
+        """
+        with self._lock:
+            self.db_statements += 1
+            self.db_time += duration
+        for frame in self._frames():
+            frame.db_statements += 1
+            frame.db_time += duration
+
+    def report(self):
+        with self._lock:
+            return {
+                'started': self.started,
+                'elapsed': time.time() - self.started,
+                'db_statements': self.db_statements,
+                'db_time': self.db_time,
+                'timings': dict((category, dict((name, stats.to_dict())
+                                                for (name, stats)
+                                                in names.items()))
+                                for (category, names) in self.stats.items()),
+            }
+
+    def write_report(self, path):
+        """(atomically) write the JSON report to `path`"""
+        with open(path + '.new', 'w') as out:
+            json.dump(self.report(), out, indent=2, sort_keys=True)
+            out.write('\n')
+        os.rename(path + '.new', path)
+
+    def write_prometheus(self, path, prefix='debsources_update'):
+        """(atomically) write timings in Prometheus text format to `path`"""
+        report = self.report()
+        lines = ['# TYPE %s_last_run_timestamp_seconds gauge' % prefix,
+                 '%s_last_run_timestamp_seconds %f' %
+                 (prefix, report['started']),
+                 '# TYPE %s_duration_seconds gauge' % prefix,
+                 '%s_duration_seconds %f' % (prefix, report['elapsed']),
+                 '# TYPE %s_db_statements gauge' % prefix,
+                 '%s_db_statements %d' % (prefix, report['db_statements'])]
+        metrics = [('wall_seconds', 'wall', '%f'),
+                   ('cpu_seconds', 'cpu', '%f'),
+                   ('runs', 'count', '%d'),
+                   ('db_statements', 'db_statements', '%d'),
+                   ('db_seconds', 'db_time', '%f')]
+        for (suffix, key, fmt) in metrics:
+            metric = '%s_%s' % (prefix, suffix)
+            lines.append('# TYPE %s gauge' % metric)
+            for (category, names) in sorted(report['timings'].items()):
+                for (name, stats) in sorted(names.items()):
+                    lines.append(('%s{category="%s",name="%s"} ' + fmt) %
+                                 (metric, category, name, stats[key]))
+        metric = '%s_wall_seconds_histogram' % prefix
+        lines.append('# TYPE %s histogram' % metric)
+        for (category, names) in sorted(report['timings'].items()):
+            for (name, stats) in sorted(names.items()):
+                labels = 'category="%s",name="%s"' % (category, name)
+                cumulative = 0
+                for (bound, count) in stats['histogram']:
+                    cumulative += count
+                    lines.append('%s_bucket{%s,le="%s"} %d' %
+                                 (metric, labels, bound, cumulative))
+                lines.append('%s_sum{%s} %f' % (metric, labels, stats['wall']))
+                lines.append('%s_count{%s} %d' %
+                             (metric, labels, stats['count']))
+        with open(path + '.new', 'w') as out:
+            out.write('\n'.join(lines) + '\n')
+        os.rename(path + '.new', path)
+
+
+recorder = Recorder()
+timed = recorder.timed
+
+
+def instrumented(category, name):
+    """decorator timing all calls of a function in the global recorder"""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with recorder.timed(category, name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_engine(engine):
+    """count statements executed by `engine` (and their duration) in the
+    global recorder; idempotent
+
+    """
+    if getattr(engine, '_debsources_instrumented', False):
+        return
+    engine._debsources_instrumented = True
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_execute(conn, cursor, statement, parameters, context,
+                       executemany):
+        conn.info.setdefault('debsources_query_start', []).append(time.time())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_execute(conn, cursor, statement, parameters, context,
+                      executemany):
+        start = conn.info['debsources_query_start'].pop()
+        recorder.add_db_statement(time.time() - start)
+
+
+class RequestProfile(object):
+    """DB statements and timed sections of a single web request"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.db_statements = 0
+        self.db_time = 0.0
+        self.queries = {}  # statement -> [count, total time]
+        self.sections = OrderedDict()  # name -> total time
+
+    def elapsed(self):
+        return time.time() - self.started
+
+    def add_statement(self, statement, duration):
+        self.db_statements += 1
+        self.db_time += duration
+        query = self.queries.setdefault(statement, [0, 0.0])
+        query[0] += 1
+        query[1] += duration
+
+    def add_section(self, name, duration):
+        self.sections[name] = self.sections.get(name, 0.0) + duration
+
+    def top_queries(self, n=5):
+        """return the `n` statements that took the most time, as (statement,
+        count, total time) triples
+
+        """
+        queries = sorted(self.queries.items(), key=lambda q: -q[1][1])
+        return [(stmt, count, duration)
+                for (stmt, (count, duration)) in queries[:n]]
+
+    def server_timing(self):
+        """return the value of a Server-Timing HTTP header"""
+        metrics = ['db;dur=%.1f;desc="%d queries"' %
+                   (self.db_time * 1000, self.db_statements)]
+        for (name, duration) in self.sections.items():
+            metrics.append('%s;dur=%.1f' % (name, duration * 1000))
+        metrics.append('total;dur=%.1f' % (self.elapsed() * 1000))
+        return ', '.join(metrics)
+
+    def to_dict(self, top=5):
+        return dict(duration=self.elapsed(),
+                    db_statements=self.db_statements,
+                    db_time=self.db_time,
+                    sections=dict(self.sections),
+                    top_queries=[dict(statement=stmt, count=count, time=t)
+                                 for (stmt, count, t)
+                                 in self.top_queries(top)])
+
+
+_profiles = threading.local()
+
+
+def start_profile():
+    """start profiling the request handled by the current thread"""
+    _profiles.current = RequestProfile()
+    return _profiles.current
+
+
+def current_profile():
+    """return the RequestProfile of the current thread, if any"""
+    return getattr(_profiles, 'current', None)
+
+
+def stop_profile():
+    profile = current_profile()
+    _profiles.current = None
+    return profile
+
+
+@contextmanager
+def section(name):
+    """time a code section in the current request profile, if any"""
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        profile.add_section(name, time.time() - start)
+
+
+def profile_engine(engine):
+    """account statements executed by `engine` to the request profile of the
+    thread executing them; idempotent
+
+    """
+    if getattr(engine, '_debsources_profiled', False):
+        return
+    engine._debsources_profiled = True
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_execute(conn, cursor, statement, parameters, context,
+                       executemany):
+        if current_profile() is not None:
+            conn.info.setdefault('debsources_profile_start',
+                                 []).append(time.time())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_execute(conn, cursor, statement, parameters, context,
+                      executemany):
+        profile = current_profile()
+        starts = conn.info.get('debsources_profile_start')
+        if profile is not None and starts:
+            profile.add_statement(statement, time.time() - starts.pop())
@@ -0,0 +1,327 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""queue of update jobs, processed by (possibly many) worker processes
+
+Jobs are stored in the "jobs" DB table (see models.Job) and are keyed by
+<action, package, version, hook>; actions are "add-package", "rm-package" and
+"hook" (re-running a single hook on a package). All actions are idempotent, so
+that jobs can be retried, independently from each other, until they succeed.
+
+Workers claim pending jobs one at a time, with SELECT ... FOR UPDATE SKIP
+LOCKED on PostgreSQL; on other DBs (e.g. SQLite, for local use) claims are
+optimistic updates of the job state. Workers can run on several hosts, as
+long as they share the DB and the FS storage. See bin/debsources-worker and
+doc/jobqueue.txt.
+
+"""
+
+from __future__ import absolute_import
+
+import logging
+import os
+import socket
+import time
+import traceback
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, not_, text
+from sqlalchemy.exc import IntegrityError
+
+from debsources import bloom
+from debsources import db_storage
+from debsources import updater
+from debsources.debmirror import SourcePackage
+from debsources.models import Job, Package
+from debsources.package_tree import PackageTree
+
+# default number of attempts after which a job is considered failed
+MAX_ATTEMPTS = 3
+
+# next pending job, locked for the claim, on PostgreSQL (>= 9.5). Spelled out
+# in SQL, as Query.with_for_update(skip_locked=True) needs SQLAlchemy >= 1.1
+_CLAIM_PG_Q = text("""
+    SELECT id FROM jobs
+    WHERE state = 'pending'
+    ORDER BY attempts, id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED""")
+
+
+class JobError(Exception):
+    pass
+
+
+def worker_name():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def enqueue(session, action, package, version, hook='', payload=None):
+    """add a job to the queue, unless an equivalent one is already pending or
+    running; jobs that are done or failed are rescheduled
+
+    return True if the job has been (re)scheduled, False otherwise
+
+    """
+    job = session.query(Job).filter_by(action=action, package=package,
+                                       version=version, hook=hook).first()
+    if job is None:
+        try:
+            with session.begin_nested():
+                session.add(Job(action, package, version, hook, payload))
+            return True
+        except IntegrityError:  # concurrently added
+            return False
+    if job.state in ['pending', 'running']:
+        return False
+    job.state = 'pending'
+    job.attempts = 0
+    job.error = None
+    if payload is not None:
+        job.payload = payload
+    return True
+
+
+def enqueue_updates(conf, session, mirror):
+    """enqueue the package additions and removals needed to bring the DB in
+    sync with `mirror`, i.e. what the extract_new and garbage_collect update
+    stages would do
+
+    return the pair <additions, removals> of scheduled jobs
+
+    """
+    (added, removed) = (0, 0)
+    known = db_storage.package_ids(session)
+    for pkg in mirror.ls():
+        pkg_id = (pkg['package'], pkg['version'])
+        if pkg_id in known or \
+           updater.is_excluded_package(pkg, conf['exclude']):
+            continue
+        if enqueue(session, 'add-package', pkg['package'], pkg['version'],
+                   payload=pkg.dump()):
+            added += 1
+    for db_package in session.query(Package).filter(not_(Package.sticky)):
+        pkg = SourcePackage.from_db_model(db_package)
+        pkg_id = (pkg['package'], pkg['version'])
+        if pkg_id in mirror.packages or \
+           not updater.is_expired(conf, pkg.extraction_dir(
+               conf['sources_dir'])):
+            continue
+        if enqueue(session, 'rm-package', pkg['package'], pkg['version']):
+            removed += 1
+    return (added, removed)
+
+
+def enqueue_hook(conf, session, hook, packages=None):
+    """enqueue the recomputation of `hook` on `packages` (a list of <package,
+    version> pairs; default: all packages)
+
+    return the number of scheduled jobs
+
+    """
+    if hook not in [title for (title, _action)
+                    in conf['observers']['add-package']]:
+        raise ValueError('unknown hook %s' % hook)
+    if packages is None:
+        packages = sorted(db_storage.package_ids(session))
+    return sum(enqueue(session, 'hook', package, version, hook=hook)
+               for (package, version) in packages)
+
+
+def claim(session, worker):
+    """claim the next pending job for `worker`, committing the claim
+
+    return the claimed Job, or None if there are no pending jobs
+
+    """
+    while True:
+        if session.get_bind().dialect.name == 'postgresql':
+            job_id = session.execute(_CLAIM_PG_Q).scalar()
+        else:
+            job_id = session.query(Job.id) \
+                            .filter(Job.state == 'pending') \
+                            .order_by(Job.attempts, Job.id) \
+                            .limit(1).scalar()
+        if job_id is None:
+            session.rollback()
+            return None
+        claimed = session.query(Job) \
+                         .filter(Job.id == job_id, Job.state == 'pending') \
+                         .update({'state': 'running',
+                                  'worker': worker,
+                                  'attempts': Job.attempts + 1,
+                                  'started': datetime.now(),
+                                  'finished': None},
+                                 synchronize_session=False)
+        session.commit()
+        if claimed:
+            return session.query(Job).get(job_id)
+        # lost the race for the job to another worker, try the next one
+
+
+def finish(session, job, error=None, max_attempts=MAX_ATTEMPTS):
+    """mark `job` as done or, if `error` is given, as either failed or pending
+    (to be retried), depending on attempts; commit
+
+    """
+    job.finished = datetime.now()
+    if error is None:
+        job.state = 'done'
+        job.error = None
+    else:
+        job.state = 'failed' if job.attempts >= max_attempts else 'pending'
+        job.error = error
+    session.commit()
+
+
+def _source_package(conf, session, job):
+    if job.payload:
+        pkg = SourcePackage(job.payload)
+        pkg['x-debsources-mirror-root'] = conf['mirror_dir']
+        return (pkg, None)
+    db_package = db_storage.lookup_package(session, job.package, job.version)
+    if db_package is None:
+        return (None, None)
+    return (SourcePackage.from_db_model(db_package), db_package)
+
+
+def run_job(conf, session, job):
+    """perform `job`, within the current transaction of `session`
+
+    raise JobError on failure
+
+    """
+    logging.info('run job %s' % job)
+    (pkg, db_package) = _source_package(conf, session, job)
+    if pkg is None:
+        if job.action == 'add-package':
+            raise JobError('no package information for %s' % job)
+        logging.info('%s/%s is not in the DB anymore, nothing to do'
+                     % (job.package, job.version))
+        return
+
+    if job.action == 'add-package':
+        # the DB is used as completion marker, as in updater.extract_new
+        if db_storage.lookup_package(session, job.package, job.version):
+            return
+        if not updater._add_package(pkg, conf, session):
+            raise JobError('cannot add %s, see log' % pkg)
+    elif job.action == 'rm-package':
+        if not updater._rm_package(pkg, conf, session, db_package=db_package):
+            raise JobError('cannot remove %s, see log' % pkg)
+    elif job.action == 'hook':
+        pkgdir = pkg.extraction_dir(conf['sources_dir'])
+        workdir = os.getcwd()
+        try:
+            os.chdir(pkgdir)  # as hooks expect, see updater._add_package
+            with session.begin_nested():
+                for event in ['rm-package', 'add-package']:
+                    file_table = None
+                    if event == 'add-package':
+                        file_table = PackageTree.from_db(session,
+                                                         db_package.id,
+                                                         pkgdir)
+                    updater.notify_plugins(conf['observers'], event, session,
+                                           pkg, pkgdir,
+                                           triggers=[(event, job.hook)],
+                                           dry=conf['dry_run'],
+                                           file_table=file_table)
+        finally:
+            os.chdir(workdir)
+    else:
+        raise JobError('unknown job action %s' % job.action)
+
+
+def requeue_stale(session, timeout):
+    """reschedule jobs that have been running for more than `timeout` (a
+    timedelta), e.g. because their worker died; commit
+
+    return the number of rescheduled jobs
+
+    """
+    count = session.query(Job) \
+                   .filter(Job.state == 'running',
+                           Job.started < datetime.now() - timeout) \
+                   .update({'state': 'pending'}, synchronize_session=False)
+    session.commit()
+    return count
+
+
+def retry_failed(session):
+    """reschedule all failed jobs; commit
+
+    return the number of rescheduled jobs
+
+    """
+    count = session.query(Job) \
+                   .filter(Job.state == 'failed') \
+                   .update({'state': 'pending', 'attempts': 0},
+                           synchronize_session=False)
+    session.commit()
+    return count
+
+
+def purge_done(session, older_than=timedelta(0)):
+    """delete jobs done for more than `older_than`; commit"""
+    count = session.query(Job) \
+                   .filter(Job.state == 'done',
+                           Job.finished <= datetime.now() - older_than) \
+                   .delete(synchronize_session=False)
+    session.commit()
+    return count
+
+
+def counts(session):
+    """return a dictionary mapping job states to number of jobs"""
+    return dict(session.query(Job.state, func.count(Job.id))
+                       .group_by(Job.state))
+
+
+def work(conf, session, worker=None, max_attempts=MAX_ATTEMPTS,
+         exit_when_empty=False, poll_interval=10):
+    """process jobs, one at a time, until the queue is empty (if
+    `exit_when_empty`) or forever, polling for new jobs every `poll_interval`
+    seconds
+
+    return the pair <done, failed> of processed jobs
+
+    """
+    worker = worker or worker_name()
+    (done, failed) = (0, 0)
+    while True:
+        job = claim(session, worker)
+        if job is None:
+            if exit_when_empty:
+                break
+            time.sleep(poll_interval)
+            continue
+        start = time.time()
+        try:
+            run_job(conf, session, job)
+            session.flush()
+        except:
+            logging.exception('job %s failed' % job)
+            error = traceback.format_exc()
+            session.rollback()
+            finish(session, job, error=error, max_attempts=max_attempts)
+            failed += 1
+        else:
+            finish(session, job)
+            done += 1
+            if not conf['dry_run'] and \
+               (job.action == 'add-package' or job.hook == 'checksums'):
+                # committed checksums are not in the web app filter yet
+                bloom.mark_stale(os.path.join(conf['cache_dir'],
+                                              bloom.SHA256_FILTER))
+        logging.info('job %s: %s in %.2fs' % (job, job.state,
+                                              time.time() - start))
+    return (done, failed)
@@ -12,6 +12,12 @@
 from __future__ import absolute_import
 
 import os
+import threading
+import time
+
+# default number of seconds during which cached local info is trusted
+# without checking the file again
+CHECK_INTERVAL = 5
 
 
 def read_html(fname):
@@ -36,3 +42,79 @@ def read_update_ts(fname):
     except IOError:
         last_update = "unknown"
     return last_update
+
+
+def read_generation(fname):
+    """read the integer generation counter stored in `fname`. Return 0 if
+    the file doesn't exist or is corrupted
+
+    """
+    try:
+        with open(fname) as f:
+            return int(f.readline().strip() or 0)
+    except (IOError, ValueError):
+        return 0
+
+
+class LocalInfoCache(object):
+    """in-process cache of the content of local info files
+
+    Content is obtained by calling loader(fname) and kept until the file
+    changes, as detected by comparing its mtime, size and inode (the updater
+    replaces files via rename). Files are stat()-ed at most once every
+    `check_interval` seconds, so that in steady state no I/O is performed.
+
+    """
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._entries = {}  # (fname, loader) -> [checked_at, stamp, value]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(fname):
+        try:
+            st = os.stat(fname)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size, st.st_ino)
+
+    def get(self, fname, loader):
+        key = (fname, loader)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[0] < self.check_interval:
+            return entry[2]
+
+        stamp = self._stamp(fname)
+        if entry is not None and entry[1] == stamp:
+            entry[0] = now
+            return entry[2]
+
+        value = loader(fname)
+        with self._lock:
+            self._entries[key] = [now, stamp, value]
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# cache shared by all users (e.g., web app blueprints) in the same process
+cache = LocalInfoCache()
+
+
+def cached_read_html(fname):
+    """like read_html, but cached in the shared LocalInfoCache"""
+    return cache.get(fname, read_html)
+
+
+def cached_read_update_ts(fname):
+    """like read_update_ts, but cached in the shared LocalInfoCache"""
+    return cache.get(fname, read_update_ts)
+
+
+def cached_read_generation(fname):
+    """like read_generation, but cached in the shared LocalInfoCache"""
+    return cache.get(fname, read_generation)
@@ -31,7 +31,7 @@ DEFAULT_CONFIG.update({
     'infra': {
         'dry_run':     'false',
         'backends':    'db fs hooks hooks.db hooks.fs',
-        'stages':      'extract suites gc stats cache charts',
+        'stages':      'extract suites gc stats compact cache charts',
         'log_level':   'info',
         'expire_days': '0',
         'force_triggers': [],
@@ -112,6 +112,12 @@ def parse_conf_infra(items):
         elif key == 'single_transaction':
             assert value in ['true', 'false']
             value = (value == 'true')
+        elif key in ['db_pool_size', 'db_max_overflow', 'db_pool_recycle',
+                     'hash_jobs', 'history_retention_days']:
+            value = int(value)
+        elif key == 'db_pool_pre_ping':
+            assert value in ['true', 'false']
+            value = (value == 'true')
         typed[key] = value
     return typed
 
@@ -128,6 +134,21 @@ def parse_conf_webapp(items):
     return typed
 
 
+def db_engine_options(conf):
+    """extract from (infra) `conf` the keyword arguments of
+    sqla_session._get_engine, for DB connection pooling
+
+    """
+    opts = {}
+    for (key, opt) in [('db_pool_size', 'pool_size'),
+                       ('db_max_overflow', 'max_overflow'),
+                       ('db_pool_recycle', 'pool_recycle'),
+                       ('db_pool_pre_ping', 'pool_pre_ping')]:
+        if key in conf:
+            opts[opt] = conf[key]
+    return opts
+
+
 def load_conf(conffile, section="infra"):
     """
     load configuration from `conffile` and return it as a (typed) dictionary,
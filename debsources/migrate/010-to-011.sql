@@ -0,0 +1,19 @@
+-- composite indexes for the hot lookups of the web app; they supersede the
+-- single-column indexes on their leading column, which are dropped.
+--
+-- On large DBs, creating indexes within this (transactional) script locks
+-- the tables for a long time; consider running instead:
+--   bin/debsources-dbadmin --create-indexes --concurrently DBURI
+-- followed by the DROP INDEX statements below.
+
+CREATE INDEX ix_ctags_tag_package_id_file_id
+  ON ctags (tag, package_id, file_id) ;
+DROP INDEX ix_ctags_tag ;
+
+CREATE INDEX ix_checksums_sha256_package_id_file_id
+  ON checksums (sha256, package_id, file_id) ;
+DROP INDEX ix_checksums_sha256 ;
+
+CREATE INDEX ix_suites_suite_package_id
+  ON suites (suite, package_id) ;
+DROP INDEX ix_suites_suite ;
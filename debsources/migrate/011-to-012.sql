@@ -0,0 +1,35 @@
+-- queue of update jobs, see debsources/jobqueue.py and bin/debsources-worker
+
+CREATE TYPE job_actions AS ENUM (
+  'add-package',
+  'rm-package',
+  'hook'
+);
+
+CREATE TYPE job_states AS ENUM (
+  'pending',
+  'running',
+  'done',
+  'failed'
+);
+
+CREATE TABLE jobs (
+  id SERIAL NOT NULL,
+  action job_actions NOT NULL,
+  package VARCHAR NOT NULL,
+  version VARCHAR NOT NULL,
+  hook VARCHAR NOT NULL,
+  payload VARCHAR,
+  state job_states NOT NULL,
+  attempts INTEGER NOT NULL,
+  worker VARCHAR,
+  error VARCHAR,
+  created TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+  started TIMESTAMP WITHOUT TIME ZONE,
+  finished TIMESTAMP WITHOUT TIME ZONE,
+  PRIMARY KEY (id),
+  CONSTRAINT jobs_action_package_version_hook_key
+    UNIQUE (action, package, version, hook)
+);
+
+CREATE INDEX ix_jobs_state ON jobs (state);
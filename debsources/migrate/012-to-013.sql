@@ -0,0 +1,14 @@
+-- precomputed number of files/packages per checksum, see
+-- debsources/plugins/hook_checksums.py
+
+CREATE TABLE checksum_stats (
+  sha256 VARCHAR(64) NOT NULL,
+  file_count INTEGER NOT NULL,
+  package_count INTEGER NOT NULL,
+  PRIMARY KEY (sha256)
+);
+
+INSERT INTO checksum_stats (sha256, file_count, package_count)
+  SELECT sha256, count(*), count(DISTINCT package_id)
+  FROM checksums
+  GROUP BY sha256;
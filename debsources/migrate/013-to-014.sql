@@ -0,0 +1,9 @@
+-- dpkg-ordered sort key of package versions, see debsources/version_key.py
+--
+-- Keys can only be computed in Python: after this script, run
+-- debsources/migrate/backfill-version-keys, which fills them in and then
+-- makes the column NOT NULL.
+
+ALTER TABLE packages ADD COLUMN version_key BYTEA;
+
+CREATE INDEX ix_packages_name_id_version_key ON packages (name_id, version_key);
@@ -0,0 +1,72 @@
+-- rolled up samples of history tables, see statistics.compact_history
+
+CREATE TYPE history_granularities AS ENUM (
+  'day',
+  'week',
+  'month'
+);
+
+CREATE TABLE history_size_rollup (
+  granularity history_granularities NOT NULL,
+  bucket TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+  timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+  suite VARCHAR NOT NULL,
+  source_packages INTEGER,
+  binary_packages INTEGER,
+  disk_usage INTEGER,
+  source_files INTEGER,
+  ctags INTEGER,
+  PRIMARY KEY (granularity, suite, bucket)
+);
+
+CREATE TABLE history_sloccount_rollup (
+  granularity history_granularities NOT NULL,
+  bucket TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+  timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+  suite VARCHAR NOT NULL,
+  lang_ada INTEGER,
+  lang_ansic INTEGER,
+  lang_asm INTEGER,
+  lang_awk INTEGER,
+  lang_cobol INTEGER,
+  lang_cpp INTEGER,
+  lang_cs INTEGER,
+  lang_csh INTEGER,
+  lang_erlang INTEGER,
+  lang_exp INTEGER,
+  lang_f90 INTEGER,
+  lang_fortran INTEGER,
+  lang_haskell INTEGER,
+  lang_java INTEGER,
+  lang_jsp INTEGER,
+  lang_lex INTEGER,
+  lang_lisp INTEGER,
+  lang_makefile INTEGER,
+  lang_ml INTEGER,
+  lang_modula3 INTEGER,
+  lang_objc INTEGER,
+  lang_pascal INTEGER,
+  lang_perl INTEGER,
+  lang_php INTEGER,
+  lang_python INTEGER,
+  lang_ruby INTEGER,
+  lang_sed INTEGER,
+  lang_sh INTEGER,
+  lang_sql INTEGER,
+  lang_tcl INTEGER,
+  lang_vhdl INTEGER,
+  lang_xml INTEGER,
+  lang_yacc INTEGER,
+  PRIMARY KEY (granularity, suite, bucket)
+);
+
+CREATE TABLE history_copyright_rollup (
+  granularity history_granularities NOT NULL,
+  bucket TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+  timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+  suite VARCHAR NOT NULL,
+  license VARCHAR,
+  files INTEGER
+);
+
+CREATE INDEX ix_history_copyright_rollup_granularity_suite_bucket ON history_copyright_rollup (granularity, suite, bucket);
@@ -11,22 +11,26 @@
 
 from __future__ import absolute_import
 
+from datetime import datetime
+
 from sqlalchemy import Column, ForeignKey
 from sqlalchemy import UniqueConstraint, PrimaryKeyConstraint
-from sqlalchemy import Index
+from sqlalchemy import Index, Table
 from sqlalchemy import Boolean, Date, DateTime, Integer, LargeBinary, String
 from sqlalchemy import Enum
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
 from debsources.consts import VCS_TYPES, SLOCCOUNT_LANGUAGES, \
-    CTAGS_LANGUAGES, METRIC_TYPES, COPYRIGHT_ORACLES
+    CTAGS_LANGUAGES, METRIC_TYPES, COPYRIGHT_ORACLES, JOB_ACTIONS, \
+    JOB_STATES, HISTORY_GRANULARITIES
+from debsources.version_key import version_key
 
 Base = declarative_base()
 
 
 # used for migrations, see scripts under debsources/migrate/
-DB_SCHEMA_VERSION = 10
+DB_SCHEMA_VERSION = 15
 
 
 class PackageName(Base):
@@ -59,6 +63,8 @@ class Package(Base):
 
     id = Column(Integer, primary_key=True)
     version = Column(String, index=True)
+    # sorts as version does according to dpkg, see debsources.version_key
+    version_key = Column(LargeBinary, nullable=False)
     name_id = Column(Integer,
                      ForeignKey('package_names.id', ondelete="CASCADE"),
                      index=True, nullable=False)
@@ -72,6 +78,7 @@ class Package(Base):
 
     def __init__(self, version, package, sticky=False):
         self.version = version
+        self.version_key = version_key(version)
         self.name_id = package.id
         self.sticky = sticky
 
@@ -86,6 +93,8 @@ class Package(Base):
         return dict(version=self.version, area=self.area)
 
 Index('ix_packages_name_id_version', Package.name_id, Package.version)
+# versions of a package in dpkg order, e.g. for the latest version
+Index('ix_packages_name_id_version_key', Package.name_id, Package.version_key)
 
 
 class Suite(Base):
@@ -99,12 +108,15 @@ class Suite(Base):
     package_id = Column(Integer,
                         ForeignKey('packages.id', ondelete="CASCADE"),
                         index=True, nullable=False)
-    suite = Column(String, index=True)
+    suite = Column(String)
 
     def __init__(self, package, suite):
         self.package_id = package.id
         self.suite = suite
 
+# lookups by suite, e.g., to list all packages of a suite
+Index('ix_suites_suite_package_id', Suite.suite, Suite.package_id)
+
 
 class SuiteInfo(Base):
     """static information about known suites
@@ -170,13 +182,30 @@ class Checksum(Base):
     file_id = Column(Integer,
                      ForeignKey('files.id', ondelete="CASCADE"),
                      index=True, nullable=False)
-    sha256 = Column(String(64), nullable=False, index=True)
+    sha256 = Column(String(64), nullable=False)
 
     def __init__(self, version, file_id, sha256):
         self.package_id = version.id
         self.file_id = file_id
         self.sha256 = sha256
 
+# lookups by checksum, covering the joins to packages and files
+Index('ix_checksums_sha256_package_id_file_id',
+      Checksum.sha256, Checksum.package_id, Checksum.file_id)
+
+
+class ChecksumStats(Base):
+    """number of files, and of packages, having a given SHA256 checksum
+
+    maintained incrementally by the checksums hook
+
+    """
+    __tablename__ = 'checksum_stats'
+
+    sha256 = Column(String(64), primary_key=True)
+    file_count = Column(Integer, nullable=False)
+    package_count = Column(Integer, nullable=False)
+
 
 class BinaryName(Base):
     __tablename__ = 'binary_names'
@@ -239,7 +268,7 @@ class Ctag(Base):
     package_id = Column(Integer,
                         ForeignKey('packages.id', ondelete="CASCADE"),
                         index=True, nullable=False)
-    tag = Column(String, nullable=False, index=True)
+    tag = Column(String, nullable=False)
     file_id = Column(Integer,
                      ForeignKey('files.id', ondelete="CASCADE"),
                      index=True, nullable=False)
@@ -273,6 +302,10 @@ class Ctag(Base):
     #                .filter(Ctag.tag in ctags)
     #                .filter(Ctag
 
+# lookups by tag (see query.find_ctag), returned in package order
+Index('ix_ctags_tag_package_id_file_id',
+      Ctag.tag, Ctag.package_id, Ctag.file_id)
+
 
 class Metric(Base):
     __tablename__ = 'metrics'
@@ -406,3 +439,72 @@ class HistoryCopyright(Base):
     def __init__(self, suite, timestamp):
         self.suite = suite
         self.timestamp = timestamp
+
+
+_history_granularity = Enum(*HISTORY_GRANULARITIES,
+                            name='history_granularities')
+
+
+def _history_rollup(history_table, *args):
+    """table of samples of `history_table`: for each granularity, suite and
+    period ("bucket") the rows of the last timestamp in the period, with the
+    same columns (see statistics.compact_history)
+
+    """
+    columns = [Column(c.name, c.type, nullable=c.nullable)
+               for c in history_table.columns if c.name != 'id']
+    return Table(history_table.name + '_rollup', Base.metadata,
+                 Column('granularity', _history_granularity, nullable=False),
+                 Column('bucket', DateTime(timezone=False), nullable=False),
+                 *(columns + list(args)))
+
+
+history_size_rollup = _history_rollup(
+    HistorySize.__table__,
+    PrimaryKeyConstraint('granularity', 'suite', 'bucket'))
+history_sloccount_rollup = _history_rollup(
+    HistorySlocCount.__table__,
+    PrimaryKeyConstraint('granularity', 'suite', 'bucket'))
+history_copyright_rollup = _history_rollup(
+    HistoryCopyright.__table__,
+    Index('ix_history_copyright_rollup_granularity_suite_bucket',
+          'granularity', 'suite', 'bucket'))
+
+
+class Job(Base):
+    """a unit of update work (adding or removing a package, running a hook on
+    it), see debsources/jobqueue.py
+
+    """
+    __tablename__ = 'jobs'
+    __table_args__ = (UniqueConstraint('action', 'package', 'version',
+                                       'hook'),)
+
+    id = Column(Integer, primary_key=True)
+    action = Column(Enum(*JOB_ACTIONS, name="job_actions"), nullable=False)
+    package = Column(String, nullable=False)
+    version = Column(String, nullable=False)
+    hook = Column(String, nullable=False, default='')  # for action "hook"
+    payload = Column(String)  # Sources paragraph, for action "add-package"
+    state = Column(Enum(*JOB_STATES, name="job_states"), nullable=False,
+                   index=True, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    worker = Column(String)
+    error = Column(String)
+    created = Column(DateTime(timezone=False), nullable=False)
+    started = Column(DateTime(timezone=False))
+    finished = Column(DateTime(timezone=False))
+
+    def __init__(self, action, package, version, hook='', payload=None):
+        self.action = action
+        self.package = package
+        self.version = version
+        self.hook = hook
+        self.payload = payload
+        self.state = 'pending'
+        self.attempts = 0
+        self.created = datetime.now()
+
+    def __repr__(self):
+        return '%s %s/%s%s' % (self.action, self.package, self.version,
+                               ' ' + self.hook if self.hook else '')
@@ -15,11 +15,9 @@ import os
 import magic
 import fnmatch
 
-from sqlalchemy import and_
-
-from debsources.models import (Checksum, File,
-                               Package, PackageName)
+from debsources import compiled_queries
 from debsources import filetype
+from debsources import instrument
 from debsources.consts import AREAS
 from debsources.debmirror import SourcePackage
 from debsources.excepts import FileOrFolderNotFound, \
@@ -43,12 +41,7 @@ class Location(object):
         prefix = SourcePackage.pkg_prefix(package)
 
         try:
-            p_id = session.query(PackageName) \
-                          .filter(PackageName.name == package).first().id
-            varea = session.query(Package) \
-                           .filter(and_(Package.name_id == p_id,
-                                        Package.version == version)) \
-                           .first().area
+            varea = compiled_queries.package(session, package, version).area
         except:
             # the package or version doesn't exist in the database
             # BUT: packages are stored for a longer time in the filesystem
@@ -149,9 +142,11 @@ class Directory(object):
             else:
                 return "file"
         get_stat, join_path = qry.location_get_stat, os.path.join
-        listing = sorted(dict(name=f, type=get_type(f), hidden=False,
-                              stat=get_stat(join_path(self.sources_path, f)))
-                         for f in os.listdir(self.sources_path))
+        with instrument.section('fs'):
+            listing = sorted(dict(name=f, type=get_type(f), hidden=False,
+                                  stat=get_stat(join_path(self.sources_path,
+                                                          f)))
+                             for f in os.listdir(self.sources_path))
 
         for hidden_file in self.hidden_files:
             for f in listing:
@@ -175,14 +170,15 @@ class SourceFile(object):
 
     def _find_mime(self):
         """ returns the mime encoding and type of a file """
-        mime = magic.open(magic.MIME_TYPE)
-        mime.load()
-        type_ = mime.file(self.sources_path)
-        mime.close()
-        mime = magic.open(magic.MIME_ENCODING)
-        mime.load()
-        encoding = mime.file(self.sources_path)
-        mime.close()
+        with instrument.section('magic'):
+            mime = magic.open(magic.MIME_TYPE)
+            mime.load()
+            type_ = mime.file(self.sources_path)
+            mime.close()
+            mime = magic.open(magic.MIME_ENCODING)
+            mime.load()
+            encoding = mime.file(self.sources_path)
+            mime.close()
         return dict(encoding=encoding, type=type_)
 
     def get_mime(self):
@@ -192,20 +188,12 @@ class SourceFile(object):
         """
         Queries the DB and returns the shasum of the file.
         """
-        shasum = session.query(Checksum.sha256) \
-                        .filter(Checksum.package_id == Package.id) \
-                        .filter(Package.name_id == PackageName.id) \
-                        .filter(File.id == Checksum.file_id) \
-                        .filter(PackageName.name == self.location.package) \
-                        .filter(Package.version == self.location.version) \
-                        .filter(File.path == str(self.location.path)) \
-                        .first()
         # WARNING: in the DB path is binary, and here
         # location.path is unicode, because the path comes from
         # the URL. TODO: check with non-unicode paths
-        if shasum:
-            shasum = shasum[0]
-        return shasum
+        return compiled_queries.file_sha256(session, self.location.package,
+                                            self.location.version,
+                                            str(self.location.path))
 
     def istextfile(self):
         """True if self is a text file, False if it's not.
@@ -0,0 +1,347 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""scanner of extracted source packages
+
+A PackageScan derives from the PackageTree of a package (see package_tree),
+i.e. without walking the package directory again, what the metrics and
+sloccount hooks need: disk usage (with du(1) semantics), the list of regular
+files, and per-language source lines of code. Results are computed lazily and
+the last scan is memoized (see scan()), so that hooks run on the same package
+share it, instead of forking du and sloccount each.
+
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import os
+import re
+
+from collections import namedtuple
+
+import six
+
+from debsources.consts import SLOCCOUNT_LANGUAGES
+from debsources.package_tree import PackageTree
+
+FileStat = namedtuple('FileStat', ['relpath', 'abspath', 'stat'])
+
+
+# Source line counting, approximating SLOCCOUNT(1): a line counts if it
+# contains something else than blanks and comments. Unlike sloccount, string
+# literals are not parsed, so comment markers inside strings are honored.
+
+# language -> (line comment markers, block comment delimiters)
+_C_SYNTAX = (('//',), (('/*', '*/'),))
+_HASH_SYNTAX = (('#',), ())
+SLOC_SYNTAX = {
+    'ada': (('--',), ()),
+    'asm': ((';', '#', '//'), (('/*', '*/'),)),
+    'awk': _HASH_SYNTAX,
+    'sh': _HASH_SYNTAX,
+    'ansic': _C_SYNTAX,
+    'cpp': _C_SYNTAX,
+    'cs': _C_SYNTAX,
+    'csh': _HASH_SYNTAX,
+    'cobol': ((), ()),  # see _COL1_COMMENTS
+    'exp': _HASH_SYNTAX,
+    'fortran': (('!',), ()),
+    'f90': (('!',), ()),
+    'haskell': (('--',), (('{-', '-}'),)),
+    'java': _C_SYNTAX,
+    'lex': _C_SYNTAX,
+    'lisp': ((';',), (('#|', '|#'),)),
+    'makefile': _HASH_SYNTAX,
+    'ml': ((), (('(*', '*)'),)),
+    'modula3': ((), (('(*', '*)'),)),
+    'objc': _C_SYNTAX,
+    'pascal': (('//',), (('(*', '*)'), ('{', '}'))),
+    'perl': _HASH_SYNTAX,  # plus POD, see count_sloc
+    'php': (('//', '#'), (('/*', '*/'),)),
+    'python': (('#',), (('"""', '"""'), ("'''", "'''"))),
+    'ruby': _HASH_SYNTAX,
+    'sed': _HASH_SYNTAX,
+    'sql': (('--',), (('/*', '*/'),)),
+    'tcl': _HASH_SYNTAX,
+    'yacc': _C_SYNTAX,
+    'erlang': (('%',), ()),
+    'jsp': (('//',), (('/*', '*/'), ('<%--', '--%>'), ('<!--', '-->'))),
+    'vhdl': (('--',), ()),
+    'xml': ((), (('<!--', '-->'),)),
+}
+
+# languages with comments marked by a character in a fixed column
+_COL1_COMMENTS = {
+    'fortran': (0, b'cC*!'),
+    'cobol': (6, b'*/'),
+}
+
+EXTENSIONS = {
+    '.ada': 'ada', '.ads': 'ada', '.adb': 'ada', '.pad': 'ada',
+    '.s': 'asm', '.S': 'asm', '.asm': 'asm',
+    '.awk': 'awk',
+    '.sh': 'sh', '.bash': 'sh', '.ksh': 'sh',
+    '.c': 'ansic',
+    '.cc': 'cpp', '.cpp': 'cpp', '.cxx': 'cpp', '.c++': 'cpp', '.C': 'cpp',
+    '.hh': 'cpp', '.hpp': 'cpp', '.hxx': 'cpp', '.H': 'cpp',
+    '.cs': 'cs',
+    '.csh': 'csh', '.tcsh': 'csh',
+    '.cbl': 'cobol', '.cob': 'cobol', '.CBL': 'cobol', '.COB': 'cobol',
+    '.exp': 'exp',
+    '.f': 'fortran', '.for': 'fortran', '.F': 'fortran', '.FOR': 'fortran',
+    '.f77': 'fortran',
+    '.f90': 'f90', '.F90': 'f90', '.f95': 'f90', '.F95': 'f90',
+    '.hs': 'haskell', '.lhs': 'haskell',
+    '.java': 'java',
+    '.l': 'lex', '.lex': 'lex',
+    '.el': 'lisp', '.scm': 'lisp', '.lsp': 'lisp', '.lisp': 'lisp',
+    '.jl': 'lisp', '.cl': 'lisp',
+    '.mk': 'makefile', '.mak': 'makefile',
+    '.ml': 'ml', '.mli': 'ml', '.mll': 'ml', '.mly': 'ml',
+    '.m3': 'modula3', '.i3': 'modula3', '.mg': 'modula3', '.ig': 'modula3',
+    '.m': 'objc',
+    '.p': 'pascal', '.pas': 'pascal', '.pp': 'pascal',
+    '.pl': 'perl', '.pm': 'perl', '.perl': 'perl',
+    '.php': 'php', '.php3': 'php', '.php4': 'php', '.php5': 'php',
+    '.py': 'python',
+    '.rb': 'ruby',
+    '.sed': 'sed',
+    '.sql': 'sql',
+    '.tcl': 'tcl', '.tk': 'tcl', '.itk': 'tcl',
+    '.y': 'yacc',
+    '.erl': 'erlang', '.hrl': 'erlang',
+    '.jsp': 'jsp',
+    '.vhd': 'vhdl', '.vhdl': 'vhdl',
+    '.xml': 'xml',
+}
+
+FILENAMES = {
+    'makefile': 'makefile', 'Makefile': 'makefile',
+    'GNUmakefile': 'makefile',
+}
+
+# interpreter (basename of #! line) -> language
+_SHEBANG_RE = re.compile(br'^#!\s*(?:\S*/)?(?:env\s+)?([A-Za-z]+)')
+SHEBANGS = {
+    'python': 'python', 'perl': 'perl', 'ruby': 'ruby', 'php': 'php',
+    'sh': 'sh', 'bash': 'sh', 'dash': 'sh', 'ksh': 'sh', 'zsh': 'sh',
+    'csh': 'csh', 'tcsh': 'csh', 'tclsh': 'tcl', 'wish': 'tcl',
+    'expect': 'exp', 'awk': 'awk', 'gawk': 'awk', 'mawk': 'awk',
+    'nawk': 'awk', 'sed': 'sed',
+}
+
+# as sloccount, ignore automatically generated files
+_GENERATED_RE = re.compile(br'generated automatically|automatically generated|'
+                           br'this is a generated file|do not edit',
+                           re.IGNORECASE)
+_GENERATED_HEAD = 1024  # bytes to look for _GENERATED_RE into
+_SHEBANG_HEAD = 256
+
+assert set(SLOC_SYNTAX) == set(SLOCCOUNT_LANGUAGES)
+assert set(SLOC_SYNTAX) >= set(EXTENSIONS.values()) | set(SHEBANGS.values())
+
+
+def guess_language(relpath, head):
+    """guess the SLOCCOUNT_LANGUAGES language of file `relpath`, given its
+    first bytes `head`; return None for non source code files
+
+    '.h' files are returned as 'h', to be decided by the caller between C and
+    C++
+
+    """
+    name = os.path.basename(relpath)
+    if name in FILENAMES:
+        return FILENAMES[name]
+    ext = os.path.splitext(name)[1]
+    if ext == '.h':
+        return 'h'
+    lang = EXTENSIONS.get(ext) or EXTENSIONS.get(ext.lower())
+    if lang is None and head.startswith(b'#!'):
+        m = _SHEBANG_RE.match(head)
+        if m:
+            lang = SHEBANGS.get(m.group(1).decode('ascii'))
+    return lang
+
+
+def count_sloc(data, lang):
+    """count source lines of code in `data` (a byte string) written in
+    language `lang`
+
+    """
+    (line_markers, blocks) = SLOC_SYNTAX[lang]
+    line_markers = [m.encode('ascii') for m in line_markers]
+    blocks = [(s.encode('ascii'), e.encode('ascii')) for (s, e) in blocks]
+    col1 = _COL1_COMMENTS.get(lang)
+    pod = (lang == 'perl')
+    sloc = 0
+    block_end = None  # end delimiter of the block comment we are in, if any
+    in_pod = False
+    for line in data.splitlines():
+        if in_pod:
+            in_pod = not line.startswith(b'=cut')
+            continue
+        if pod and line[:1] == b'=' and line[1:2].isalpha():
+            in_pod = not line.startswith(b'=cut')
+            continue
+        if col1 and block_end is None:
+            char = line[col1[0]:col1[0] + 1]
+            if char and char in col1[1]:
+                continue
+        code = False
+        while line:
+            if block_end is not None:
+                pos = line.find(block_end)
+                if pos < 0:
+                    break
+                line = line[pos + len(block_end):]
+                block_end = None
+                continue
+            # earliest comment marker on the line
+            (first, marker_end) = (len(line), None)
+            for marker in line_markers:
+                pos = line.find(marker)
+                if 0 <= pos < first:
+                    (first, marker_end) = (pos, None)
+            for (start, end) in blocks:
+                pos = line.find(start)
+                if 0 <= pos < first:
+                    (first, marker_end) = (pos, (start, end))
+            if line[:first].strip():
+                code = True
+            if marker_end is None:  # line comment, or no comment at all
+                break
+            line = line[first + len(marker_end[0]):]
+            block_end = marker_end[1]
+        if code:
+            sloc += 1
+    return sloc
+
+
+def format_sloccount(slocs):
+    """format a mapping from languages to SLOC like SLOCCOUNT(1) output, so
+    that hook_sloccount.parse_sloccount can parse it back
+
+    """
+    total = sum(six.itervalues(slocs))
+    if not total:
+        return 'SLOC total is zero, no further analysis performed.\n'
+    lines = ['Totals grouped by language (dominant language first):']
+    for (lang, locs) in sorted(six.iteritems(slocs),
+                               key=lambda item: (-item[1], item[0])):
+        if locs:
+            lines.append('%-11s %10d (%.2f%%)'
+                         % (lang + ':', locs, 100.0 * locs / total))
+    lines.append('')
+    lines.append('Total Physical Source Lines of Code (SLOC) = %d' % total)
+    return '\n'.join(lines) + '\n'
+
+
+class PackageScan(object):
+    """scan of an extracted package directory, see module documentation
+
+    `files` (list of FileStat-s of regular files) and `disk_usage` come from
+    the PackageTree `tree`; `slocs` reads source files on first access
+
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.pkgdir = tree.pkgdir
+        self._files = None
+        self._slocs = None
+
+    @property
+    def files(self):
+        """list of FileStat-s of the regular files of the package (i.e. no
+        directories, no symlinks, no special files), in path order
+
+        """
+        if self._files is None:
+            self._files = [FileStat(relpath, abspath, self.tree.stat(relpath))
+                           for (relpath, abspath)
+                           in self.tree.regular_files()]
+        return self._files
+
+    @property
+    def disk_usage(self):
+        """disk usage of the package directory, in KiB, as reported by
+        `du --summarize`
+
+        """
+        return self.tree.disk_usage()
+
+    @property
+    def slocs(self):
+        """mapping from SLOCCOUNT_LANGUAGES to source lines of code; languages
+        without any code are omitted
+
+        As sloccount, files with identical content are counted once, and
+        automatically generated files are ignored. '.h' files are counted as
+        C++ if the package has C++ files, as C otherwise.
+
+        """
+        if self._slocs is None:
+            self._slocs = self._count_slocs()
+        return self._slocs
+
+    def _count_slocs(self):
+        slocs = {}
+        headers = []
+        digests = set()
+        for f in self.files:
+            with open(f.abspath, 'rb') as fileobj:
+                head = fileobj.read(_SHEBANG_HEAD)
+                lang = guess_language(f.relpath, head)
+                if lang is None:
+                    continue
+                data = head + fileobj.read()
+            if b'\0' in data:  # binary file
+                continue
+            digest = hashlib.md5(data).digest()
+            if digest in digests:
+                continue
+            digests.add(digest)
+            if _GENERATED_RE.search(data[:_GENERATED_HEAD]):
+                continue
+            if lang == 'h':
+                headers.append(data)
+                continue
+            slocs[lang] = slocs.get(lang, 0) + count_sloc(data, lang)
+        header_lang = 'cpp' if 'cpp' in slocs else 'ansic'
+        for data in headers:
+            slocs[header_lang] = slocs.get(header_lang, 0) + \
+                count_sloc(data, header_lang)
+        return dict((lang, locs) for (lang, locs) in six.iteritems(slocs)
+                    if locs)
+
+
+_last_scan = (None, None)  # <key, PackageScan>
+
+
+def scan(pkgdir, file_table=None):
+    """return a PackageScan of `pkgdir`, built from its PackageTree
+    `file_table` (as passed to hooks) or, if None, walking `pkgdir`
+
+    the last scan is memoized, as long as the package directory has not been
+    replaced or modified since then
+
+    """
+    global _last_scan
+    st = os.stat(pkgdir)
+    key = (pkgdir, st.st_ino, st.st_mtime)
+    (last_key, last_scan) = _last_scan
+    if last_key != key:
+        if file_table is None:
+            file_table = PackageTree.from_fs(pkgdir)
+        last_scan = PackageScan(file_table)
+        _last_scan = (key, last_scan)
+    return last_scan
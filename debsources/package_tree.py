@@ -0,0 +1,179 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""inventory of the files of an extracted source package
+
+A PackageTree is built once per package, either while adding the package
+(see db_storage.add_package) or from the DB (e.g. when re-running hooks with
+force_triggers), and is then passed to all hooks as their `file_table`
+argument. It saves them both walking the package directory and looking up
+file IDs in the DB one by one: hooks needing file metadata or disk usage get
+them from the tree too (see package_scan).
+
+"""
+
+from __future__ import absolute_import
+
+import itertools
+import os
+import stat
+
+import six
+
+from debsources.models import File
+
+try:
+    from os import scandir
+except ImportError:  # Python < 3.5
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+class PackageTree(dict):
+    """mapping from file paths (relative to the package directory) to DB file
+    IDs, plus file metadata
+
+    Files are the non-directory entries of the package directory, as listed
+    by os.walk() (i.e. including symlinks to files and special files, but not
+    symlinks to directories). File IDs are None if the tree has not been
+    associated to the DB. File metadata (lstat() results) are gathered while
+    walking the package directory or, for trees loaded from the DB, on demand.
+    The walk also records the metadata of directories, for disk_usage().
+
+    """
+
+    def __init__(self, pkgdir, entries=()):
+        """`entries` is an iterable of triples <relpath, file_id, st>, where
+        st is the lstat() result of the file, or None if unknown yet
+
+        """
+        super(PackageTree, self).__init__()
+        if isinstance(pkgdir, six.text_type):
+            pkgdir = str(pkgdir)  # see fs_storage.walk_pkg_files
+        self.pkgdir = pkgdir
+        self._stats = {}
+        # lstat() results of the package directory and of the entries below
+        # it which are not files (directories, symlinks to directories);
+        # None if the tree has not been built walking the package directory
+        self._dir_stats = None
+        self._disk_usage = None
+        for (relpath, file_id, st) in entries:
+            self[relpath] = file_id
+            if st is not None:
+                self._stats[relpath] = st
+
+    def __delitem__(self, relpath):
+        super(PackageTree, self).__delitem__(relpath)
+        self._stats.pop(relpath, None)
+        self._disk_usage = None
+
+    @classmethod
+    def from_fs(cls, pkgdir):
+        """build a tree (without file IDs) walking `pkgdir`"""
+        tree = cls(pkgdir)
+        tree._dir_stats = [os.lstat(tree.pkgdir)]
+        todo = ['']
+        while todo:
+            reldir = todo.pop()
+            absdir = os.path.join(tree.pkgdir, reldir)
+            if scandir is not None:
+                for entry in scandir(absdir):
+                    relpath = os.path.join(reldir, entry.name)
+                    if entry.is_dir():  # follows symlinks, as os.walk()
+                        if not entry.is_symlink():
+                            todo.append(relpath)
+                        tree._dir_stats.append(
+                            entry.stat(follow_symlinks=False))
+                    else:
+                        tree[relpath] = None
+                        tree._stats[relpath] = \
+                            entry.stat(follow_symlinks=False)
+            else:
+                for name in os.listdir(absdir):
+                    relpath = os.path.join(reldir, name)
+                    abspath = os.path.join(absdir, name)
+                    if os.path.isdir(abspath):
+                        if not os.path.islink(abspath):
+                            todo.append(relpath)
+                        tree._dir_stats.append(os.lstat(abspath))
+                    else:
+                        tree[relpath] = None
+                        tree._stats[relpath] = os.lstat(abspath)
+        return tree
+
+    @classmethod
+    def from_db(cls, session, package_id, pkgdir):
+        """load the tree of package `package_id` from the DB, in one query"""
+        rows = session.query(File.path, File.id) \
+                      .filter(File.package_id == package_id)
+        return cls(pkgdir, ((path, file_id, None) for (path, file_id) in rows))
+
+    def abspath(self, relpath):
+        return os.path.join(self.pkgdir, relpath)
+
+    def stat(self, relpath):
+        """return the lstat() result of file `relpath`, or None if it does not
+        exist (anymore) on disk
+
+        """
+        try:
+            return self._stats[relpath]
+        except KeyError:
+            try:
+                st = os.lstat(self.abspath(relpath))
+            except OSError:
+                st = None
+            self._stats[relpath] = st
+            return st
+
+    def is_regular(self, relpath):
+        """whether `relpath` is a regular file, i.e. not a symlink nor a
+        special file
+
+        """
+        st = self.stat(relpath)
+        return st is not None and stat.S_ISREG(st.st_mode)
+
+    def regular_files(self):
+        """return the list of pairs <relpath, abspath> of regular files, in
+        path order
+
+        """
+        return [(relpath, self.abspath(relpath))
+                for relpath in sorted(self) if self.is_regular(relpath)]
+
+    def disk_usage(self):
+        """disk usage of the package directory, in KiB, as reported by
+        `du --summarize`
+
+        trees loaded from the DB walk the package directory to compute it
+
+        """
+        if self._disk_usage is None:
+            tree = self
+            if tree._dir_stats is None:
+                tree = PackageTree.from_fs(self.pkgdir)
+            blocks = 0
+            seen = set()  # <st_dev, st_ino> of multiply linked inodes
+            for st in itertools.chain(tree._dir_stats,
+                                      six.itervalues(tree._stats)):
+                if st is None:  # gone from disk
+                    continue
+                if st.st_nlink > 1 and not stat.S_ISDIR(st.st_mode):
+                    if (st.st_dev, st.st_ino) in seen:
+                        continue
+                    seen.add((st.st_dev, st.st_ino))
+                blocks += st.st_blocks
+            # du(1) counts 512-byte blocks, and rounds up to 1 KiB ones
+            self._disk_usage = (blocks + 1) // 2
+        return self._disk_usage
@@ -17,10 +17,9 @@ import os
 from sqlalchemy import sql
 
 from debsources import db_storage
-from debsources import fs_storage
 from debsources import hashutil
 
-from debsources.models import Checksum, File
+from debsources.models import Checksum, ChecksumStats
 
 
 conf = None
@@ -51,6 +50,68 @@ def parse_checksums(path):
             yield (sha256, path)
 
 
+# maintenance of checksum_stats, from the checksums rows of a package
+_STATS_UPDATE_Q = """
+    UPDATE checksum_stats
+    SET file_count = file_count %(op)s
+          (SELECT count(*) FROM checksums
+           WHERE checksums.package_id = :package_id
+           AND checksums.sha256 = checksum_stats.sha256),
+        package_count = package_count %(op)s 1
+    WHERE sha256 IN (SELECT sha256 FROM checksums
+                     WHERE package_id = :package_id)
+    """
+_STATS_INSERT_Q = """
+    INSERT INTO checksum_stats (sha256, file_count, package_count)
+    SELECT sha256, count(*), 1
+    FROM checksums
+    WHERE package_id = :package_id
+    AND NOT EXISTS (SELECT 1 FROM checksum_stats
+                    WHERE checksum_stats.sha256 = checksums.sha256)
+    GROUP BY sha256
+    """
+_STATS_DELETE_Q = """
+    DELETE FROM checksum_stats
+    WHERE file_count <= 0
+    AND sha256 IN (SELECT sha256 FROM checksums
+                   WHERE package_id = :package_id)
+    """
+
+
+def add_stats(session, package_id):
+    """account the checksums of package `package_id`, which must already be
+    in the checksums table, in checksum_stats
+
+    Concurrent additions of the same new checksum conflict on its primary
+    key: one of them fails and should be retried.
+
+    """
+    params = {'package_id': package_id}
+    session.execute(_STATS_UPDATE_Q % {'op': '+'}, params)
+    session.execute(_STATS_INSERT_Q, params)
+
+
+def rm_stats(session, package_id):
+    """remove the checksums of package `package_id`, which must still be in
+    the checksums table, from checksum_stats
+
+    """
+    params = {'package_id': package_id}
+    session.execute(_STATS_UPDATE_Q % {'op': '-'}, params)
+    session.execute(_STATS_DELETE_Q, params)
+
+
+def refresh_stats(session):
+    """recompute checksum_stats from scratch, e.g. after a bulk load"""
+    session.execute(ChecksumStats.__table__.delete())
+    session.execute("""
+        INSERT INTO checksum_stats (sha256, file_count, package_count)
+        SELECT sha256, count(*), count(DISTINCT package_id)
+        FROM checksums
+        GROUP BY sha256
+        """)
+
+
 def add_package(session, pkg, pkgdir, file_table):
     global conf
     logging.debug('add-package %s' % pkg)
@@ -58,22 +119,17 @@ def add_package(session, pkg, pkgdir, file_table):
     sumsfile = sums_path(pkgdir)
     sumsfile_tmp = sumsfile + '.new'
 
-    def emit_checksum(out, relpath, abspath):
-        if os.path.islink(abspath) or not os.path.isfile(abspath):
-            # Do not checksum symlinks, if they are not dangling / external we
-            # will checksum their target anyhow. Do not check special files
-            # either; they shouldn't be there per policy, but they might be
-            # (and they are in old releases)
-            return
-        sha256 = hashutil.sha256sum(abspath)
-        out.write('%s  %s\n' % (sha256, relpath))
-
     if 'hooks.fs' in conf['backends']:
         if not os.path.exists(sumsfile):  # compute checksums only if needed
+            # Symlinks are not checksummed: if they are not dangling /
+            # external we will checksum their target anyhow. Special files
+            # are not checksummed either; they shouldn't be there per
+            # policy, but they might be (and they are in old releases)
             with open(sumsfile_tmp, 'w') as out:
-                for (relpath, abspath) in \
-                        fs_storage.walk_pkg_files(pkgdir, file_table):
-                    emit_checksum(out, relpath, abspath)
+                for (relpath, hashes) in \
+                        hashutil.hash_files(file_table.regular_files(),
+                                            conf.get('hash_jobs')):
+                    out.write('%s  %s\n' % (hashes.sha256, relpath))
             os.rename(sumsfile_tmp, sumsfile)
 
     if 'hooks.db' in conf['backends']:
@@ -88,23 +144,12 @@ def add_package(session, pkg, pkgdir, file_table):
             # been added to the db in the past, then *all* of them have,
             # as additions are part of the same transaction
             for (sha256, relpath) in parse_checksums(sumsfile):
-                params = {'package_id': db_package.id,
-                          'sha256': sha256}
-                if file_table:
-                    try:
-                        file_id = file_table[relpath]
-                        params['file_id'] = file_id
-                    except KeyError:
-                        continue
-                else:
-                    file_ = session.query(File) \
-                                   .filter_by(package_id=db_package.id,
-                                              path=relpath) \
-                                   .first()
-                    if not file_:
-                        continue
-                    params['file_id'] = file_.id
-                insert_params.append(params)
+                file_id = file_table.get(relpath)
+                if file_id is None:
+                    continue
+                insert_params.append({'package_id': db_package.id,
+                                      'sha256': sha256,
+                                      'file_id': file_id})
                 if len(insert_params) >= BULK_FLUSH_THRESHOLD:
                     session.execute(insert_q, insert_params)
                     session.flush()
@@ -112,6 +157,7 @@ def add_package(session, pkg, pkgdir, file_table):
             if insert_params:  # source packages shouldn't be empty but...
                 session.execute(insert_q, insert_params)
                 session.flush()
+            add_stats(session, db_package.id)
 
 
 def rm_package(session, pkg, pkgdir, file_table):
@@ -126,6 +172,7 @@ def rm_package(session, pkg, pkgdir, file_table):
     if 'hooks.db' in conf['backends']:
         db_package = db_storage.lookup_package(session, pkg['package'],
                                                pkg['version'])
+        rm_stats(session, db_package.id)
         session.query(Checksum) \
                .filter_by(package_id=db_package.id) \
                .delete()
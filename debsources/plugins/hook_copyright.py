@@ -15,7 +15,7 @@ import io
 import logging
 import os
 
-from debsources import db_storage, fs_storage
+from debsources import db_storage
 from debsources.models import FileCopyright, File
 from debsources import license_helper as helper
 
@@ -38,6 +38,37 @@ def parse_license_file(path):
     return license_list
 
 
+# removal of the licenses of all files of a package, in a single statement
+# (rather than one DELETE per license); equivalent to DELETE ... USING files,
+# but also understood by SQLite
+_RM_LICENSES_Q = """
+    DELETE FROM copyright
+    WHERE file_id IN (SELECT id FROM files WHERE package_id = :package_id)
+    """
+
+
+def add_licenses(session, licenses, file_table):
+    """bulk insert the (synopsis, path) pairs `licenses` of a package into the
+    copyright table; paths are mapped to file IDs via `file_table`, unknown
+    paths are skipped
+
+    return the number of inserted licenses
+
+    """
+    rows = []
+    for (synopsis, path) in licenses:
+        file_id = file_table.get(path)
+        if file_id is not None:
+            rows.append((file_id, 'debian', synopsis))
+    return db_storage.copy_rows(session, FileCopyright.__table__,
+                                ['file_id', 'oracle', 'license'], rows)
+
+
+def rm_licenses(session, package_id):
+    """remove the licenses of all files of package `package_id`"""
+    session.execute(_RM_LICENSES_Q, {'package_id': package_id})
+
+
 def add_package(session, pkg, pkgdir, file_table):
     global conf
     logging.debug('add-package %s' % pkg)
@@ -61,8 +92,7 @@ def add_package(session, pkg, pkgdir, file_table):
     if 'hooks.fs' in conf['backends']:
         if not os.path.exists(license_file):  # run license only if needed
             with io.open(license_file_tmp, 'w', encoding='utf-8') as out:
-                for (relpath, abspath) in \
-                        fs_storage.walk_pkg_files(pkgdir, file_table):
+                for relpath in sorted(file_table):
                     emit_license(out, session, pkg['package'], pkg['version'],
                                  relpath, pkgdir)
             os.rename(license_file_tmp, license_file)
@@ -71,30 +101,12 @@ def add_package(session, pkg, pkgdir, file_table):
         licenses = parse_license_file(license_file)
         db_package = db_storage.lookup_package(session, pkg['package'],
                                                pkg['version'])
-        session.query(FileCopyright) \
-               .join(File) \
-               .filter(File.package_id == db_package.id)
-        if not session.query(FileCopyright).join(File)\
+        if not session.query(FileCopyright.id).join(File) \
                       .filter(File.package_id == db_package.id).first():
             # ASSUMPTION: if *a* license of this package has already been
             # added to the db in the past, then *all* of them have, as
             # additions are part of the same transaction
-            for (synopsis, path) in licenses:
-                if file_table:
-                    try:
-                        file_id = file_table[path]
-                    except KeyError:
-                        continue
-                else:
-                    file_ = session.query(File) \
-                                   .filter_by(package_id=db_package.id,
-                                              path=path) \
-                                   .first()
-                    if not file_:
-                        continue
-                    file_id = file_.id
-                license = FileCopyright(file_id, 'debian', synopsis)
-                session.add(license)
+            add_licenses(session, licenses, file_table)
 
 
 def rm_package(session, pkg, pkgdir, file_table):
@@ -109,12 +121,7 @@ def rm_package(session, pkg, pkgdir, file_table):
     if 'hooks.db' in conf['backends']:
         db_package = db_storage.lookup_package(session, pkg['package'],
                                                pkg['version'])
-        files = (session.query(FileCopyright.id)
-                 .join(File)
-                 .filter(File.package_id == db_package.id)).all()
-        for f in files:
-            session.query(FileCopyright) \
-                   .filter(FileCopyright.id == f).delete()
+        rm_licenses(session, db_package.id)
 
 
 def init_plugin(debsources):
@@ -13,13 +13,14 @@ from __future__ import absolute_import
 
 import logging
 import os
+import re
 import subprocess
 
-from sqlalchemy import sql
+from array import array
 
 from debsources import db_storage
 
-from debsources.models import Ctag, File
+from debsources.models import Ctag
 from debsources.consts import MAX_KEY_LENGTH
 
 
@@ -103,6 +104,141 @@ def parse_ctags(path):
                          (bad_tags - BAD_TAGS_THRESHOLD))
 
 
+class CtagsBatch(object):
+    """a batch of parsed tags, stored column-wise: one list (or array, for
+    integer columns) per attribute, all of the same length
+
+    """
+
+    COLUMNS = ['tag', 'file_id', 'line', 'kind', 'language']
+
+    __slots__ = COLUMNS
+
+    def __init__(self, tag=None, file_id=None, line=None, kind=None,
+                 language=None):
+        self.tag = tag if tag is not None else []
+        self.file_id = file_id if file_id is not None else array('l')
+        self.line = line if line is not None else array('l')
+        self.kind = kind if kind is not None else []
+        self.language = language if language is not None else []
+
+    def __len__(self):
+        return len(self.tag)
+
+    def columns(self, package_id):
+        """return batch content as a list of columns, for the ctags table
+        columns ['package_id'] + COLUMNS (see db_storage.copy_columns)
+
+        """
+        return [[package_id] * len(self), self.tag, self.file_id, self.line,
+                self.kind, self.language]
+
+    def rows(self, package_id):
+        """iterate over batch content as tuples of values for the ctags table
+        columns ['package_id'] + COLUMNS
+
+        """
+        return zip(*self.columns(package_id))
+
+
+# fast path for the usual layout of tag lines, given CTAGS_FLAGS: extension
+# fields kind, line, and language come first and in this order
+_TAG_LINE_RE = re.compile(r'([^\t]*)\t([^\t]*)\t[^\t]*'
+                          r'\tkind:([^\t\n]*)\tline:(\d+)'
+                          r'(?:\tlanguage:([^\t\n]*))?')
+
+
+def _parse_tag_fields(line):
+    """parse a tag line in any layout, return a tuple <tag, path, kind, line,
+    language>
+
+    """
+    fields = line.rstrip().split('\t')
+    kind, lineno, language = None, None, None
+    for ext in fields[3:]:  # note: ignore fields[2], ex_cmd
+        k, v = ext.split(':', 1)
+        if k == 'kind':
+            kind = v
+        elif k == 'line':
+            lineno = v
+        elif k == 'language':
+            language = v
+    return (fields[0], fields[1], kind, lineno, language)
+
+
+def parse_ctags_batches(path, file_id, batch_size=BULK_FLUSH_THRESHOLD):
+    """parse exuberant ctags tags file, like parse_ctags, but column-wise
+
+    `file_id` is a callable mapping the path of a tag (relative to the package
+    dir) to a file ID; tags for which it returns None are skipped. It is
+    called once per sequence of tags belonging to the same file.
+
+    yield CtagsBatch objects of (at most) `batch_size` tags. Parsing avoids
+    per-tag dictionaries and interns repeated values (file IDs, kinds,
+    languages), which matters a lot on packages with millions of tags
+
+    """
+    languages = {None: None}  # cache of lowercased language names
+    kinds = {}  # interned kinds
+    cur_path, cur_file_id = None, None
+    bad_tags = 0
+    match_line = _TAG_LINE_RE.match
+
+    def new_batch():
+        batch = CtagsBatch()
+        return (batch, batch.tag.append, batch.file_id.append,
+                batch.line.append, batch.kind.append, batch.language.append)
+
+    (batch, add_tag, add_file_id, add_line, add_kind, add_language) = \
+        new_batch()
+    with open(path) as ctags:
+        for line in ctags:
+            # e.g. 'music\tsound.c\t13;"\tkind:v\tline:13\tlanguage:C\tfile:\n'
+            # see CTAGS(1), section "TAG FILE FORMAT"
+            if line.startswith('!_TAG'):  # skip ctags metadata
+                continue
+            try:
+                m = match_line(line)
+                if m:
+                    (tag, relpath, kind, lineno, language) = m.groups()
+                else:
+                    (tag, relpath, kind, lineno, language) = \
+                        _parse_tag_fields(line)
+                # will fail when encountering encoding issues; that is intended
+                tag = tag.decode()
+                assert len(tag) <= MAX_KEY_LENGTH
+                lineno = int(lineno)
+            except:
+                bad_tags += 1
+                if bad_tags <= BAD_TAGS_THRESHOLD:
+                    logging.warn('ignore malformed tag "%s"' % line.rstrip())
+                continue
+
+            if relpath != cur_path:
+                cur_path, cur_file_id = relpath, file_id(relpath)
+            if cur_file_id is None:
+                continue
+            try:
+                language = languages[language]
+            except KeyError:
+                language = languages.setdefault(language, language.lower())
+            add_tag(tag)
+            add_file_id(cur_file_id)
+            add_line(lineno)
+            add_kind(kinds.setdefault(kind, kind))
+            add_language(language)
+            if len(batch.tag) >= batch_size:
+                yield batch
+                (batch, add_tag, add_file_id, add_line, add_kind,
+                 add_language) = new_batch()
+
+    if len(batch):
+        yield batch
+    if bad_tags > BAD_TAGS_THRESHOLD:
+        logging.warn('%d extra malformed tag(s) ignored' %
+                     (bad_tags - BAD_TAGS_THRESHOLD))
+
+
 def add_package(session, pkg, pkgdir, file_table):
     global conf
     logging.debug('add-package %s' % pkg)
@@ -123,48 +259,15 @@ def add_package(session, pkg, pkgdir, file_table):
     if 'hooks.db' in conf['backends']:
         db_package = db_storage.lookup_package(session, pkg['package'],
                                                pkg['version'])
-        # poor man's cache for last <relpath, file_id>;
-        # rely on the fact that ctags file are path-sorted
-        curfile = {None: None}
-        insert_q = sql.insert(Ctag.__table__)
-        insert_params = []
         if not session.query(Ctag).filter_by(package_id=db_package.id).first():
             # ASSUMPTION: if *a* ctag of this package has already been added to
             # the db in the past, then *all* of them have, as additions are
             # part of the same transaction
-            for tag in parse_ctags(ctagsfile):
-                params = ({'package_id': db_package.id,
-                           'tag': tag['tag'],
-                           # 'file_id': 	# will be filled below
-                           'line': tag['line'],
-                           'kind': tag['kind'],
-                           'language': tag['language']})
-                relpath = tag['path']
-                if file_table:
-                    try:
-                        params['file_id'] = file_table[relpath]
-                    except KeyError:
-                        continue
-                else:
-                    try:
-                        params['file_id'] = curfile[relpath]
-                    except KeyError:
-                        file_ = session.query(File) \
-                                       .filter_by(package_id=db_package.id,
-                                                  path=relpath) \
-                                       .first()
-                        if not file_:
-                            continue
-                        curfile = {relpath: file_.id}
-                        params['file_id'] = file_.id
-                insert_params.append(params)
-                if len(insert_params) >= BULK_FLUSH_THRESHOLD:
-                    session.execute(insert_q, insert_params)
-                    session.flush()
-                    insert_params = []
-            if insert_params:  # might be empty if there are no ctags at all!
-                session.execute(insert_q, insert_params)
-                session.flush()
+            session.flush()
+            columns = ['package_id'] + CtagsBatch.COLUMNS
+            for batch in parse_ctags_batches(ctagsfile, file_table.get):
+                db_storage.copy_columns(session, Ctag.__table__, columns,
+                                        batch.columns(db_package.id))
 
 
 def rm_package(session, pkg, pkgdir, file_table):
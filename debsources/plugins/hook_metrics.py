@@ -13,9 +13,9 @@ from __future__ import absolute_import
 
 import logging
 import os
-import subprocess
 
 from debsources import db_storage
+from debsources import package_scan
 
 from debsources.models import Metric
 
@@ -49,9 +49,9 @@ def add_package(session, pkg, pkgdir, file_table):
     metricsfile_tmp = metricsfile + '.new'
 
     if 'hooks.fs' in conf['backends']:
-        if not os.path.exists(metricsfile):  # run du only if needed
-            cmd = ['du', '--summarize', pkgdir]
-            metric_value = int(subprocess.check_output(cmd).split()[0])
+        if not os.path.exists(metricsfile):  # compute size only if needed
+            # same value as `du --summarize pkgdir`
+            metric_value = package_scan.scan(pkgdir, file_table).disk_usage
             with open(metricsfile_tmp, 'w') as out:
                 out.write('%s\t%d\n' % (metric_type, metric_value))
             os.rename(metricsfile_tmp, metricsfile)
@@ -0,0 +1,50 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import logging
+import os
+
+from debsources import quilt
+
+
+conf = None
+
+MY_NAME = 'patches'
+MY_EXT = quilt.SIDECAR_EXT
+
+
+def add_package(session, pkg, pkgdir, file_table):
+    global conf
+    logging.debug('add-package %s' % pkg)
+
+    if 'hooks.fs' in conf['backends']:
+        if not os.path.exists(quilt.sidecar_path(pkgdir)):
+            quilt.write_sidecar(pkgdir, quilt.patches_info(pkgdir))
+
+
+def rm_package(session, pkg, pkgdir, file_table):
+    global conf
+    logging.debug('rm-package %s' % pkg)
+
+    if 'hooks.fs' in conf['backends']:
+        patchesfile = quilt.sidecar_path(pkgdir)
+        if os.path.exists(patchesfile):
+            os.unlink(patchesfile)
+
+
+def init_plugin(debsources):
+    global conf
+    conf = debsources['config']
+    debsources['subscribe']('add-package', add_package, title=MY_NAME)
+    debsources['subscribe']('rm-package',  rm_package,  title=MY_NAME)
+    debsources['declare_ext'](MY_EXT, MY_NAME)
@@ -19,6 +19,7 @@ import subprocess
 import six
 
 from debsources import db_storage
+from debsources import package_scan
 from debsources.models import SlocCount
 
 
@@ -71,6 +72,21 @@ def parse_sloccount(path):
     return slocs
 
 
+def run_sloccount(pkgdir, slocfile):
+    """run SLOCCOUNT(1) on `pkgdir`, storing its output in `slocfile`"""
+    slocfile_tmp = slocfile + '.new'
+    try:
+        cmd = ['sloccount'] + SLOCCOUNT_FLAGS + [pkgdir]
+        with open(slocfile_tmp, 'w') as out:
+            subprocess.check_call(cmd, stdout=out, stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError:
+        if not grep(['^SLOC total is zero,', slocfile_tmp]):
+            # rationale: sloccount fails when it can't find source code
+            raise
+    finally:
+        os.rename(slocfile_tmp, slocfile)
+
+
 def add_package(session, pkg, pkgdir, file_table):
     global conf
     logging.debug('add-package %s' % pkg)
@@ -79,18 +95,14 @@ def add_package(session, pkg, pkgdir, file_table):
     slocfile_tmp = slocfile + '.new'
 
     if 'hooks.fs' in conf['backends']:
-        if not os.path.exists(slocfile):  # run sloccount only if needed
-            try:
-                cmd = ['sloccount'] + SLOCCOUNT_FLAGS + [pkgdir]
+        if not os.path.exists(slocfile):  # count slocs only if needed
+            if conf.get('sloccount_backend', 'sloccount') == 'internal':
+                slocs = package_scan.scan(pkgdir, file_table).slocs
                 with open(slocfile_tmp, 'w') as out:
-                    subprocess.check_call(cmd, stdout=out,
-                                          stderr=subprocess.STDOUT)
-            except subprocess.CalledProcessError:
-                if not grep(['^SLOC total is zero,', slocfile_tmp]):
-                    # rationale: sloccount fails when it can't find source code
-                    raise
-            finally:
+                    out.write(package_scan.format_sloccount(slocs))
                 os.rename(slocfile_tmp, slocfile)
+            else:
+                run_sloccount(pkgdir, slocfile)
 
     if 'hooks.db' in conf['backends']:
         slocs = parse_sloccount(slocfile)
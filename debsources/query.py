@@ -17,13 +17,14 @@ import stat
 from sqlalchemy import func as sql_func, not_
 from collections import namedtuple
 
-from debian.debian_support import version_compare
+from debsources import compiled_queries
+from debsources import local_info
 from debsources.consts import PREFIXES_DEFAULT
 from debsources.consts import SUITES
 from debsources.excepts import InvalidPackageOrVersionError
 from debsources.models import (
-    Checksum, Ctag, File, Package, PackageName, Suite, SuiteInfo,
-    FileCopyright)
+    Checksum, ChecksumStats, Ctag, File, Package, PackageName, Suite,
+    SuiteInfo, FileCopyright)
 
 
 LongFMT = namedtuple("LongFMT", ["type", "perms", "size", "symlink_dest"])
@@ -31,19 +32,26 @@ LongFMT = namedtuple("LongFMT", ["type", "perms", "size", "symlink_dest"])
 ''' ORM queries '''
 
 
-def pkg_names_get_packages_prefixes(cache_dir):
-    """
-    returns the packages prefixes (a, b, ..., liba, libb, ..., y, z)
-    cache_dir: the cache directory, usually comes from the app config
-    """
+def _read_packages_prefixes(fname):
     try:
-        with open(os.path.join(cache_dir, 'pkg-prefixes')) as f:
+        with open(fname) as f:
             prefixes = [l.rstrip() for l in f]
     except IOError:
         prefixes = PREFIXES_DEFAULT
     return prefixes
 
 
+def pkg_names_get_packages_prefixes(cache_dir):
+    """
+    returns the packages prefixes (a, b, ..., liba, libb, ..., y, z)
+    cache_dir: the cache directory, usually comes from the app config
+    the list is cached in memory (see local_info.LocalInfoCache), don't modify
+    it in place
+    """
+    return local_info.cache.get(os.path.join(cache_dir, 'pkg-prefixes'),
+                                _read_packages_prefixes)
+
+
 def pkg_names_list_versions(session, packagename, suite=""):
     """
     return all versions of a packagename. if suite is specified, only
@@ -56,43 +64,49 @@ def pkg_names_list_versions(session, packagename, suite=""):
     except Exception:
         raise InvalidPackageOrVersionError(packagename)
     try:
-        if not suite:
-            versions = session.query(Package) \
-                              .filter(Package.name_id == name_id).all()
-        else:
-            versions = (session.query(Package)
-                               .filter(Package.name_id == name_id)
-                               .filter(sql_func.lower(Suite.suite) == suite)
-                               .filter(Suite.package_id == Package.id)
-                               .all())
+        # sorted according to debian versions rules, see models.Package
+        versions = session.query(Package) \
+                          .filter(Package.name_id == name_id) \
+                          .order_by(Package.version_key)
+        if suite:
+            versions = (versions
+                        .filter(sql_func.lower(Suite.suite) == suite)
+                        .filter(Suite.package_id == Package.id))
+        versions = versions.all()
     except Exception:
         raise InvalidPackageOrVersionError(packagename)
-    # we sort the versions according to debian versions rules
-    versions = sorted(versions, cmp=version_compare)
     return versions
 
 
+def get_latest_version(session, packagename):
+    """
+    return the latest version (according to debian versions rules) of a
+    packagename, or None if there is no such package
+    """
+    latest = session.query(Package.version) \
+                    .join(PackageName) \
+                    .filter(PackageName.name == packagename) \
+                    .order_by(Package.version_key.desc()) \
+                    .first()
+    return latest[0] if latest is not None else None
+
+
 def pkg_names_list_versions_w_suites(session, packagename,
                                      suite="", reverse=False):
     """
     return versions with suites. if suite is provided, then only return
     versions contained in that suite.
     """
-    # FIXME a left outer join on (Package, Suite) is more preferred.
-    # However, per https://stackoverflow.com/a/997467, custom aggregation
-    # function to concatenate the suite names for the group_by should be
-    # defined on database connection level.
+    # suites of all versions are retrieved at once, with a single query
     versions = pkg_names_list_versions(session, packagename, suite)
     versions_w_suites = []
     try:
+        suites_of = compiled_queries.suites(session, [v.id for v in versions])
         for v in versions:
-            suites = session.query(Suite) \
-                            .filter(Suite.package_id == v.id) \
-                            .all()
             # sort the suites according to debsources.consts.SUITES
             # use keyfunc to make it py3 compatible
-            suites.sort(key=lambda s: SUITES['all'].index(s.suite))
-            suites = [s.suite for s in suites]
+            suites = sorted(suites_of[v.id],
+                            key=lambda s: SUITES['all'].index(s))
             v = v.to_dict()
             v['suites'] = suites
             versions_w_suites.append(v)
@@ -234,6 +248,28 @@ def count_files_checksum(session, checksum, pkg=None, suite=None):
     return result
 
 
+def get_checksum_stats(session, checksum):
+    '''Return the ChecksumStats (number of files and packages) of `checksum`,
+    or None if no file has it
+
+    '''
+    if checksum is None:
+        return None
+    return session.query(ChecksumStats).get(checksum)
+
+
+def get_checksums_stats(session, checksums):
+    '''Return a dictionary mapping those of `checksums` that some files have
+    to their ChecksumStats
+
+    '''
+    if not checksums:
+        return {}
+    return dict((stats.sha256, stats)
+                for stats in session.query(ChecksumStats)
+                .filter(ChecksumStats.sha256.in_(checksums)))
+
+
 def get_pkg_by_name(session, pkg, suite=None):
     ''' Returns the package filtered by name `pkg`
         Filter by `suite`
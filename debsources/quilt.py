@@ -0,0 +1,250 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""metadata of the quilt patches of source packages
+
+Patch metadata (file deltas, description, bug) is extracted from the patches
+listed in debian/patches/series. It is precomputed by the patches hook into a
+JSON sidecar file (see patches_info()) which is read by the patches web app;
+file deltas are computed in pure Python, in the format of `diffstat -p1 -f0`.
+
+"""
+
+from __future__ import absolute_import
+
+import io
+import json
+import os
+import re
+
+import six
+
+ACCEPTED_FORMATS = ['3.0 (quilt)',
+                    '3.0 (native)']
+
+FORMAT_FILE = 'debian/source/format'
+PATCHES_DIR = 'debian/patches'
+SERIES_FILE = PATCHES_DIR + '/series'
+
+SIDECAR_EXT = '.patches'
+
+_HUNK_RE = re.compile(r'@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+
+
+def _to_text(s):
+    if isinstance(s, six.binary_type):
+        return s.decode('utf-8', 'replace')
+    return s
+
+
+def get_patch_details(path):
+    """ Parse a patch to extract the description and or bug if it exists
+    """
+    with open(path, 'r') as content_file:
+        patch = content_file.read()
+    # check if subject exists
+    keywords = ['description:', 'subject:']
+    if not any(key in patch.lower() for key in keywords):
+        return ('---', '')
+    else:
+        # split by --- or +++ (file deltas) and then parse as a tag/value
+        # document to extract description or subject or bug
+        contents = re.split(r'---|\+\+\+', patch)[0]
+        dsc = "---"
+        bug = ""
+        in_description = False
+        # possible fields besides description and subject
+        # used to extract multiline descriptions
+        fields = ['origin:', 'forwarded:', 'author:', 'from:',
+                  'reviewed-by:', 'acked-by:', 'last-update:',
+                  'applied-upstream:', 'index:', 'diff', 'change-id']
+        for line in contents.split('\n'):
+            if 'description:' in line.lower() or \
+               'subject:' in line.lower():
+                dsc = re.split(r'description:|subject:', line.lower())[1] \
+                    + '\n'
+                in_description = True
+            elif 'bug: #' in line.lower():
+                bug = line.lower().split('bug: #')[1]
+                in_description = False
+            elif any(key in line.lower() for key in fields):
+                in_description = False
+            elif in_description:
+                dsc += line + '\n'
+        return (dsc, bug)
+
+
+def _diff_name(header, strip):
+    """extract the file name from a ---/+++ header line, removing `strip`
+    leading path components (as patch -p does)
+
+    """
+    name = header[4:].split('\t')[0].rstrip('\r\n')
+    if name == '/dev/null':
+        return None
+    parts = name.split('/', strip)
+    return parts[-1] if len(parts) > strip else name
+
+
+def diffstat(lines, strip=1):
+    """count inserted and deleted lines, per file, in the unified diff
+    `lines`
+
+    return a dict mapping file names (with `strip` leading path components
+    removed) to [insertions, deletions] lists
+
+    """
+    stats = {}
+    (old_name, counts) = (None, None)
+    (old_left, new_left) = (0, 0)  # lines remaining in the current hunk
+    for line in lines:
+        if old_left > 0 or new_left > 0:
+            if line.startswith('+'):
+                counts[0] += 1
+                new_left -= 1
+            elif line.startswith('-'):
+                counts[1] += 1
+                old_left -= 1
+            elif not line.startswith('\\'):  # "\ No newline at end of file"
+                old_left -= 1
+                new_left -= 1
+            continue
+        if line.startswith('--- '):
+            old_name = _diff_name(line, strip)
+        elif line.startswith('+++ '):
+            name = _diff_name(line, strip) or old_name
+            counts = stats.setdefault(name, [0, 0]) if name else None
+        elif line.startswith('@@') and counts is not None:
+            m = _HUNK_RE.match(line)
+            if m:
+                (old_len, new_len) = m.groups()
+                old_left = int(old_len) if old_len is not None else 1
+                new_left = int(new_len) if new_len is not None else 1
+    return stats
+
+
+def format_diffstat(stats):
+    """format diffstat() results like `diffstat -f0` does: one line per file
+    (sorted by name), then a summary line
+
+    """
+    names = sorted(stats)
+    width = max([len(name) for name in names] or [0])
+    lines = []
+    (insertions, deletions) = (0, 0)
+    for name in names:
+        (ins, dels) = stats[name]
+        lines.append(' %-*s |%5d \t%d +\t%d -\t0 !' %
+                     (width, name, ins + dels, ins, dels))
+        insertions += ins
+        deletions += dels
+    summary = ' %d file%s changed' % (len(names),
+                                      '' if len(names) == 1 else 's')
+    if insertions:
+        summary += ', %d insertion%s(+)' % (insertions,
+                                            '' if insertions == 1 else 's')
+    if deletions:
+        summary += ', %d deletion%s(-)' % (deletions,
+                                           '' if deletions == 1 else 's')
+    lines.append(summary)
+    return '\n'.join(lines) + '\n'
+
+
+def get_file_deltas(path):
+    """return the file deltas of the patch in `path`, as `diffstat -p1 -f0`
+    would
+
+    """
+    with open(path, 'r') as patch:
+        return format_diffstat(diffstat(patch))
+
+
+def parse_series(lines):
+    """parse the lines of a quilt series file, return a list of <series
+    entry, patch name> pairs; the series entry is the stripped line, which may
+    contain patch options after the name
+
+    """
+    series = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            series.append((line, line.split(' ')[0]))
+    return series
+
+
+def _read_text(path):
+    with io.open(path, mode='r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def patches_info(pkgdir):
+    """compute the patch metadata of the package extracted in `pkgdir`
+
+    return a JSON-serializable dict, with keys:
+
+    - format: content of debian/source/format, or None if missing
+    - series: None if there is no series file (or the format is not
+      supported), else one dict per series entry, with keys 'series', 'name'
+      and either 'missing': True (the patch does not exist) or 'description',
+      'bug', 'file_deltas'
+
+    """
+    info = dict(format=None, series=None)
+    format_file = os.path.join(pkgdir, FORMAT_FILE)
+    if not os.path.isfile(format_file):
+        return info
+    info['format'] = _read_text(format_file)
+    series_file = os.path.join(pkgdir, SERIES_FILE)
+    if info['format'].rstrip() not in ACCEPTED_FORMATS \
+       or not os.path.isfile(series_file):
+        return info
+
+    # do not follow paths (or symlinks) out of the package
+    top = os.path.realpath(pkgdir) + os.sep
+    info['series'] = []
+    for (serie, name) in parse_series(_read_text(series_file).splitlines()):
+        patch_file = os.path.join(pkgdir, PATCHES_DIR, name)
+        entry = dict(series=serie, name=name)
+        if not os.path.realpath(patch_file).startswith(top) \
+           or not os.path.isfile(patch_file):
+            entry['missing'] = True
+        else:
+            (description, bug) = get_patch_details(patch_file)
+            entry.update(description=_to_text(description),
+                         bug=_to_text(bug),
+                         file_deltas=_to_text(get_file_deltas(patch_file)))
+        info['series'].append(entry)
+    return info
+
+
+def sidecar_path(pkgdir):
+    return pkgdir + SIDECAR_EXT
+
+
+def write_sidecar(pkgdir, info):
+    """(atomically) write patch metadata `info` to the sidecar of `pkgdir`"""
+    path = sidecar_path(pkgdir)
+    with open(path + '.new', 'w') as out:
+        json.dump(info, out)
+    os.rename(path + '.new', path)
+
+
+def read_sidecar(pkgdir):
+    """return the patch metadata stored in the sidecar of `pkgdir`, or None
+    if there is no (valid) sidecar
+
+    """
+    try:
+        with open(sidecar_path(pkgdir)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
@@ -11,16 +11,188 @@
 
 from __future__ import absolute_import
 
+import threading
+import time
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import Session, sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import UpdateBase
 
 
-def _get_engine_session(url, verbose=True):
-    engine = create_engine(url, echo=verbose)
-    session = scoped_session(sessionmaker(bind=engine))
+class PoolMetrics(object):
+    """usage counters of a connection pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.connects = 0     # new DB connections
+        self.checkouts = 0    # connections handed out by the pool
+        self.checkins = 0     # connections given back to the pool
+        self.wait_time = 0.0  # total time spent waiting for a connection
+        self.max_wait_time = 0.0
+
+    def add_wait(self, seconds):
+        with self._lock:
+            self.wait_time += seconds
+            self.max_wait_time = max(self.max_wait_time, seconds)
+
+    def to_dict(self):
+        return dict(connects=self.connects,
+                    checkouts=self.checkouts,
+                    checkins=self.checkins,
+                    wait_time=self.wait_time,
+                    max_wait_time=self.max_wait_time)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that measures the time spent obtaining connections (either
+    waiting for a free one, or opening a new one), in self.metrics
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.metrics = kwargs.pop('metrics', None) or PoolMetrics()
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            self.metrics.add_wait(time.time() - start)
+
+    def recreate(self):
+        # happens upon engine.dispose(); keep counting in the same metrics
+        pool = super(TimedQueuePool, self).recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def _count_pool_events(engine):
+    def metrics():
+        return engine.pool.metrics
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_conn, conn_record):
+        metrics().connects += 1
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_conn, conn_record, conn_proxy):
+        metrics().checkouts += 1
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_conn, conn_record):
+        metrics().checkins += 1
+
+
+def _ping_on_checkout(engine):
+    """pessimistic disconnect handling: test connections with a trivial
+    query when they leave the pool, so that stale ones (e.g., after a DB
+    restart) are transparently replaced
+
+    """
+    @event.listens_for(engine, 'checkout')
+    def ping(dbapi_conn, conn_record, conn_proxy):
+        cursor = dbapi_conn.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        except Exception:
+            # the pool will retry the checkout with a new connection
+            raise exc.DisconnectionError()
+        finally:
+            cursor.close()
+
+
+def _sqlite_transactions(engine):
+    """let SQLAlchemy, rather than pysqlite, begin transactions, which is
+    needed for SAVEPOINTs (i.e. session.begin_nested()) to work on SQLite
+
+    """
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_conn, conn_record):
+        dbapi_conn.isolation_level = None  # no implicit BEGIN from pysqlite
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(conn):
+        conn.execute('BEGIN')
+
+
+def _get_engine(url, verbose=True, pool_size=None, max_overflow=None,
+                pool_recycle=None, pool_pre_ping=False):
+    """create an engine for `url`, with a metered connection pool
+
+    pool_size, max_overflow and pool_recycle are passed as-is to
+    create_engine, when given. Pool metrics are available as
+    engine.pool.metrics
+
+    SQLite engines keep the pool chosen by SQLAlchemy (which, unlike a
+    QueuePool, works with in-memory DBs), without metrics; pool_size and
+    max_overflow do not apply to it and are ignored
+
+    """
+    kwargs = {'echo': verbose}
+    if not make_url(url).drivername.startswith('sqlite'):
+        kwargs['poolclass'] = TimedQueuePool
+        if pool_size is not None:
+            kwargs['pool_size'] = pool_size
+        if max_overflow is not None:
+            kwargs['max_overflow'] = max_overflow
+    if pool_recycle is not None:
+        kwargs['pool_recycle'] = pool_recycle
+    engine = create_engine(url, **kwargs)
+    if isinstance(engine.pool, TimedQueuePool):
+        _count_pool_events(engine)
+    if engine.dialect.name == 'sqlite':
+        _sqlite_transactions(engine)
+    if pool_pre_ping:
+        _ping_on_checkout(engine)
+    return engine
+
+
+class RoutingSession(Session):
+    """session that sends read queries to a replica engine, if any, and
+    writes (flushes and DML statements) to its main bind
+
+    """
+
+    def __init__(self, replica=None, **kwargs):
+        self.replica = replica
+        super(RoutingSession, self).__init__(**kwargs)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.replica is not None and not self._flushing \
+           and not isinstance(clause, UpdateBase):
+            return self.replica
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+def _get_engine_session(url, verbose=True, replica_url=None, **pool_opts):
+    """create an engine and a scoped session for `url`
+
+    if `replica_url` is given, session queries that do not write are routed
+    to it (see RoutingSession); its engine is available as session.replica
+    (None otherwise). pool_opts are passed to _get_engine
+
+    """
+    engine = _get_engine(url, verbose=verbose, **pool_opts)
+    replica = None
+    if replica_url:
+        replica = _get_engine(replica_url, verbose=verbose, **pool_opts)
+    session = scoped_session(sessionmaker(bind=engine, class_=RoutingSession,
+                                          replica=replica))
+    session.replica = replica
     return engine, session
 
 
+def _pool_metrics(engine):
+    """return the metrics of the connection pool of `engine`, as a dict"""
+    metrics = getattr(engine.pool, 'metrics', None)
+    return metrics.to_dict() if metrics is not None else {}
+
+
 def _close_session(session):
     session.remove()
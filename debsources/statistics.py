@@ -19,14 +19,19 @@ import logging
 import os
 import re
 
+from datetime import datetime
+
 import six
 
 from sqlalchemy import distinct
 from sqlalchemy import func as sql_func
 
-from debsources.consts import SLOCCOUNT_LANGUAGES, SUITES
+from debsources.consts import HISTORY_GRANULARITIES, SLOCCOUNT_LANGUAGES, \
+    SUITES
 from debsources.models import Checksum, Ctag, Metric, SlocCount, \
-    Suite, SuiteInfo, Package, PackageName, FileCopyright, File
+    Suite, SuiteInfo, Package, PackageName, FileCopyright, File, \
+    HistoryCopyright, HistorySize, HistorySlocCount, history_size_rollup, \
+    history_sloccount_rollup, history_copyright_rollup
 from debsources.license_helper import Licenses
 
 
@@ -37,10 +42,6 @@ def _count(query):
     return count
 
 
-def _time_series(query):
-    return [(row['timestamp'], row['value']) for row in query]
-
-
 def suites(session, suites='release'):
     """return a list of known suites (both sticky and live) present in the DB,
     sorted by release date
@@ -207,20 +208,141 @@ def ctags(session, suite=None, areas=None):
     return _count(q)
 
 
-def _hist_size_sample(session, metric, interval, projection, suite=None):
-    q = "\
-      SELECT DISTINCT ON (%(projection)s) timestamp, %(metric)s AS VALUE \
-      FROM history_size \
-      WHERE timestamp >= now() - interval '%(interval)s' \
-      %(filter)s \
-      ORDER BY %(projection)s DESC, timestamp DESC"
-    kw = {'metric': metric,
-          'projection': projection,
-          'interval': interval,
+# columns of history tables, and the rollup tables storing their samples
+_HISTORY_TABLES = dict(
+    (table.name, (rollup.name, [c.name for c in table.columns
+                                if c.name != 'id']))
+    for (table, rollup) in [(HistorySize.__table__, history_size_rollup),
+                            (HistorySlocCount.__table__,
+                             history_sloccount_rollup),
+                            (HistoryCopyright.__table__,
+                             history_copyright_rollup)])
+
+# rows of the last timestamp of each <suite, period> of a history table,
+# among those matching a WHERE clause
+_HIST_LATEST_Q = """
+    SELECT %(columns)s
+    FROM %(table)s h,
+         (SELECT suite, max(timestamp) AS latest
+          FROM %(table)s
+          WHERE %(where)s
+          GROUP BY suite, date_trunc('%(granularity)s', timestamp)) l
+    WHERE h.suite = l.suite AND h.timestamp = l.latest"""
+
+
+def _hist_latest_q(table, columns, granularity, where):
+    return _HIST_LATEST_Q % {
+        'table': table,
+        'columns': ', '.join('h.' + c for c in columns),
+        'granularity': granularity,
+        'where': where,
+    }
+
+
+def _hist_samples(session, table, columns, interval, granularity,
+                  suite=None):
+    """sample history `table` over the past `interval`, taking for each
+    period of `granularity` (hour, day, week, month) the rows of its last
+    timestamp; return them (`columns` only), most recent first
+
+    Periods that have been rolled up by compact_history are read from the
+    rollup table (the raw rows may be gone), more recent ones from `table`
+
+    """
+    kw = {'interval': interval,
+          'granularity': granularity,
           'filter': ''}
     if suite:
         kw['filter'] = "AND suite = '%s'" % suite
-    return _time_series(session.execute(q % kw))
+    where = "timestamp >= now() - interval '%(interval)s' %(filter)s" % kw
+    if granularity not in HISTORY_GRANULARITIES:  # e.g. hourly: raw only
+        q = _hist_latest_q(table, columns, granularity, where)
+    else:
+        (rollup, _columns) = _HISTORY_TABLES[table]
+        kw.update(rollup=rollup, columns=', '.join(columns))
+        where += """
+            AND date_trunc('%(granularity)s', timestamp) >
+                coalesce((SELECT max(bucket) FROM %(rollup)s
+                          WHERE granularity = '%(granularity)s'
+                          %(filter)s),
+                         '-infinity')""" % kw
+        kw['raw'] = _hist_latest_q(table, columns, granularity, where)
+        q = """
+            %(raw)s
+            UNION ALL
+            SELECT %(columns)s
+            FROM %(rollup)s
+            WHERE granularity = '%(granularity)s'
+            AND timestamp >= now() - interval '%(interval)s'
+            %(filter)s""" % kw
+    return session.execute('SELECT * FROM (%s) samples '
+                           'ORDER BY timestamp DESC' % q)
+
+
+def compact_history(session, retention, now=None):
+    """roll up history samples into rollup tables, and prune old ones
+
+    For each history table, granularity (see HISTORY_GRANULARITIES), suite
+    and *complete* period, the rows of the last timestamp of the period are
+    copied to the rollup table; chart queries then read them from there.
+    Periods are (re)computed starting from the last one already rolled up, so
+    that compaction is idempotent and its cost depends only on what has been
+    added since its last run.
+
+    Then rows older than `retention` (a timedelta) are deleted from history
+    tables, unless they belong to periods that might still be recomputed.
+
+    return the number of deleted history rows
+
+    """
+    if now is None:
+        now = datetime.utcnow()
+    pruned = 0
+    for (table, (rollup, columns)) in sorted(_HISTORY_TABLES.items()):
+        last_buckets = []
+        for granularity in HISTORY_GRANULARITIES:
+            kw = {'rollup': rollup,
+                  'granularity': granularity,
+                  'columns': ', '.join(columns)}
+            params = {'now': now}
+            since = session.execute(
+                "SELECT max(bucket) FROM %(rollup)s "
+                "WHERE granularity = '%(granularity)s'" % kw).scalar()
+            where = "timestamp < date_trunc('%(granularity)s', " \
+                    "CAST(:now AS timestamp))" % kw
+            if since is not None:
+                where += " AND timestamp >= :since"
+                params['since'] = since
+                session.execute(
+                    "DELETE FROM %(rollup)s "
+                    "WHERE granularity = '%(granularity)s' "
+                    "AND bucket >= :since" % kw, params)
+            kw['latest'] = _hist_latest_q(table, columns, granularity, where)
+            session.execute("""
+                INSERT INTO %(rollup)s (granularity, bucket, %(columns)s)
+                SELECT CAST('%(granularity)s' AS history_granularities),
+                       date_trunc('%(granularity)s', timestamp), %(columns)s
+                FROM (%(latest)s) latest""" % kw, params)
+            last_buckets.append(session.execute(
+                "SELECT max(bucket) FROM %(rollup)s "
+                "WHERE granularity = '%(granularity)s'" % kw).scalar())
+        if None in last_buckets:  # nothing rolled up yet
+            continue
+        # rows of (the last) rolled up periods are kept, as they will be
+        # used to recompute them
+        cutoff = min([now - retention] + last_buckets)
+        result = session.execute("DELETE FROM %s WHERE timestamp < :cutoff"
+                                 % table, {'cutoff': cutoff})
+        logging.debug('pruned %d rows of %s older than %s',
+                      result.rowcount, table, cutoff)
+        pruned += result.rowcount
+    return pruned
+
+
+def _hist_size_sample(session, metric, interval, granularity, suite=None):
+    samples = _hist_samples(session, 'history_size', ['timestamp', metric],
+                            interval, granularity, suite)
+    return [(row['timestamp'], row[metric]) for row in samples]
 
 
 def history_size_hourly(session, metric, interval, suite):
@@ -233,7 +355,7 @@ def history_size_hourly(session, metric, interval, suite):
     logging.debug('take hourly %s sample of %s for suite %s'
                   % (metric, interval, suite))
     return _hist_size_sample(session, metric, interval,
-                             projection="date_trunc('hour', timestamp)",
+                             'hour',
                              suite=suite)
 
 
@@ -242,7 +364,7 @@ def history_size_daily(session, metric, interval, suite):
     logging.debug('take daily %s sample of %s for suite %s'
                   % (metric, interval, suite))
     return _hist_size_sample(session, metric, interval,
-                             projection="date_trunc('day', timestamp)",
+                             'day',
                              suite=suite)
 
 
@@ -251,7 +373,7 @@ def history_size_weekly(session, metric, interval, suite):
     logging.debug('take weekly %s sample of %s for suite %s'
                   % (metric, interval, suite))
     return _hist_size_sample(session, metric, interval,
-                             projection="date_trunc('week', timestamp)",
+                             'week',
                              suite=suite)
 
 
@@ -260,25 +382,16 @@ def history_size_monthly(session, metric, interval, suite):
     logging.debug('take monthly %s sample of %s for suite %s'
                   % (metric, interval, suite))
     return _hist_size_sample(session, metric, interval,
-                             projection="date_trunc('month', timestamp)",
+                             'month',
                              suite=suite)
 
 
-def _hist_sloc_sample(session, interval, projection, suite=None):
-    q = "\
-      SELECT DISTINCT ON (%(projection)s) * \
-      FROM history_sloccount \
-      WHERE timestamp >= now() - interval '%(interval)s' \
-      %(filter)s \
-      ORDER BY %(projection)s DESC, timestamp DESC"
-    kw = {'projection': projection,
-          'interval': interval,
-          'filter': ''}
-    if suite:
-        kw['filter'] = "AND suite = '%s'" % suite
+def _hist_sloc_sample(session, interval, granularity, suite=None):
+    columns = ['timestamp'] + ['lang_' + lang for lang in SLOCCOUNT_LANGUAGES]
+    samples = _hist_samples(session, 'history_sloccount', columns, interval,
+                            granularity, suite)
 
     series = dict([(lang, []) for lang in SLOCCOUNT_LANGUAGES])
-    samples = session.execute(q % kw)
     for row in samples:
         for lang in SLOCCOUNT_LANGUAGES:
             series[lang].append((row['timestamp'], row['lang_' + lang]))
@@ -296,7 +409,7 @@ def history_sloc_hourly(session, interval, suite):
     """
     logging.debug('take hourly sloccount sample for suite %s' % suite)
     return _hist_sloc_sample(session, interval,
-                             projection="date_trunc('hour', timestamp)",
+                             'hour',
                              suite=suite)
 
 
@@ -304,7 +417,7 @@ def history_sloc_daily(session, interval, suite):
     """like `history_sloc_full`, but taking daily samples"""
     logging.debug('take daily sloccount sample for suite %s' % suite)
     return _hist_sloc_sample(session, interval,
-                             projection="date_trunc('day', timestamp)",
+                             'day',
                              suite=suite)
 
 
@@ -312,7 +425,7 @@ def history_sloc_weekly(session, interval, suite):
     """like `history_sloc_full`, but taking weekly samples"""
     logging.debug('take weekly sloccount sample for suite %s' % suite)
     return _hist_sloc_sample(session, interval,
-                             projection="date_trunc('week', timestamp)",
+                             'week',
                              suite=suite)
 
 
@@ -320,7 +433,7 @@ def history_sloc_monthly(session, interval, suite):
     """like `history_sloc_full`, but taking monthly samples"""
     logging.debug('take monthly sloccount sample for suite %s' % suite)
     return _hist_sloc_sample(session, interval,
-                             projection="date_trunc('month', timestamp)",
+                             'month',
                              suite=suite)
 
 
@@ -362,12 +475,14 @@ def stats_grouped_by(session, stat, areas=None):
     if stat is 'source_packages':
         q = (session.query(Suite.suite.label("suite"),
                            sql_func.count(Package.id))
+             .select_from(Suite)
              .join(Package)
              .group_by(Suite.suite)
              )
     elif stat is 'source_files':
         q = (session.query(Suite.suite.label("suite"),
                            sql_func.count(Checksum.id))
+             .select_from(Suite)
              .join(Package)
              .join(Checksum)
              .group_by(Suite.suite)
@@ -375,6 +490,7 @@ def stats_grouped_by(session, stat, areas=None):
     elif stat is 'disk_usage':
         q = (session.query(Suite.suite.label("suite"),
                            sql_func.sum(Metric.value))
+             .select_from(Suite)
              .filter(Metric.metric == 'size')
              .join(Package)
              .join(Metric)
@@ -383,6 +499,7 @@ def stats_grouped_by(session, stat, areas=None):
     elif stat is 'ctags':
         q = (session.query(Suite.suite.label('suite'),
                            sql_func.count(Ctag.id))
+             .select_from(Suite)
              .join(Package)
              .join(Ctag)
              .group_by(Suite.suite)
@@ -391,6 +508,7 @@ def stats_grouped_by(session, stat, areas=None):
         q = (session.query(Suite.suite.label('suite'),
                            SlocCount.language.label('language'),
                            sql_func.sum(SlocCount.count))
+             .select_from(Suite)
              .join(Package)
              .join(SlocCount)
              .group_by(Suite.suite, SlocCount.language)
@@ -454,19 +572,10 @@ def get_licenses(session, suite=None):
         return dict(q.all())
 
 
-def _hist_copyright_sample(session, interval, projection, suite=None):
-    q = "\
-      SELECT * \
-      FROM history_copyright \
-      WHERE timestamp >= now() - interval '%(interval)s' \
-      %(filter)s \
-      ORDER BY %(projection)s DESC, timestamp DESC"
-    kw = {'projection': projection,
-          'interval': interval,
-          'filter': ''}
-    if suite:
-        kw['filter'] = "AND suite = '%s'" % suite
-    results = session.execute(q % kw)
+def _hist_copyright_sample(session, interval, granularity, suite=None):
+    results = _hist_samples(session, 'history_copyright',
+                            ['timestamp', 'license', 'files'], interval,
+                            granularity, suite)
     copyright = dict()
     for row in results:
         if row['license'] in copyright.keys():
@@ -483,7 +592,7 @@ def history_copyright_hourly(session, interval, suite):
     logging.debug('take hourly copyright sample of %s for suite %s'
                   % (interval, suite))
     return _hist_copyright_sample(session, interval,
-                                  projection="date_trunc('hour', timestamp)",
+                                  'hour',
                                   suite=suite)
 
 
@@ -492,7 +601,7 @@ def history_copyright_daily(session, interval, suite):
     logging.debug('take daily copyright sample of %s for suite %s'
                   % (interval, suite))
     return _hist_copyright_sample(session, interval,
-                                  projection="date_trunc('day', timestamp)",
+                                  'day',
                                   suite=suite)
 
 
@@ -501,7 +610,7 @@ def history_copyright_weekly(session, interval, suite):
     logging.debug('take weekly copyright sample of %s for suite %s'
                   % (interval, suite))
     return _hist_copyright_sample(session, interval,
-                                  projection="date_trunc('week', timestamp)",
+                                  'week',
                                   suite=suite)
 
 
@@ -510,7 +619,7 @@ def history_copyright_monthly(session, interval, suite):
     logging.debug('take monthly copyright sample of %s for suite %s'
                   % (interval, suite))
     return _hist_copyright_sample(session, interval,
-                                  projection="date_trunc('month', timestamp)",
+                                  'month',
                                   suite=suite)
 
 
@@ -583,3 +692,120 @@ def licenses_summary(results):
             else:
                 summary['unknown'] += results[result]
     return summary
+
+
+def _ratio(files, files_w_license):
+    """same formula as query.get_ratio; 0 if there are no files (e.g. for an
+    unknown suite)
+
+    """
+    if not files:
+        return 0
+    return int((1 - float(files_w_license) / files) * 100)
+
+
+class StatsSnapshot(object):
+    """current aggregate statistics of the DB, shared by the stages (stats,
+    charts) of an update run
+
+    Each aggregate is computed lazily, on first access, with a single query
+    grouped by suite (plus one for the overall value), rather than one query
+    per suite: the number of queries does not depend on the number of suites
+    nor on the number of charts. As values are not recomputed, the snapshot
+    should be discarded if the DB content changes.
+
+    """
+
+    SIZE_STATS = ['disk_usage', 'source_packages', 'source_files', 'ctags']
+    _TOTALS = {'disk_usage': disk_usage,
+               'source_packages': source_packages,
+               'source_files': source_files,
+               'ctags': ctags}
+
+    def __init__(self, session):
+        self._session = session
+        self._cache = {}
+
+    def _get(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def total(self, stat):
+        """overall value of size statistic `stat` (see SIZE_STATS)"""
+        if stat not in self.SIZE_STATS:
+            raise ValueError('unknown statistic: %s' % stat)
+        return self._get(('total', stat),
+                         lambda: self._TOTALS[stat](self._session))
+
+    def by_suite(self, stat):
+        """suite-indexed dictionary of the values of size statistic `stat`;
+        suites without any value are missing
+
+        """
+        if stat not in self.SIZE_STATS:
+            raise ValueError('unknown statistic: %s' % stat)
+        return self._get(('by_suite', stat),
+                         lambda: dict(stats_grouped_by(self._session, stat)))
+
+    def sloccount(self, suite=None):
+        """like sloccount_summary, for `suite` or (if None) overall"""
+        if suite is None:
+            return self._get(('sloccount', None),
+                             lambda: sloccount_summary(self._session))
+
+        def compute():
+            per_suite = {}
+            for (s, language, count) in stats_grouped_by(self._session,
+                                                         'sloccount'):
+                per_suite.setdefault(s, {})[language] = count
+            return per_suite
+        return self._get(('sloccount', 'by_suite'), compute).get(suite, {})
+
+    def licenses(self, suite=None):
+        """license-indexed dictionary of file counts (like get_licenses), for
+        `suite` or (if None) overall
+
+        """
+        if suite is None:
+            return self._get(('licenses', None),
+                             lambda: get_licenses(self._session, 'ALL'))
+
+        def compute():
+            per_suite = {}
+            for (license, s, count) in get_licenses(self._session):
+                per_suite.setdefault(s, {})[license] = count
+            return per_suite
+        return self._get(('licenses', 'by_suite'), compute).get(suite, {})
+
+    def _file_counts(self):
+        """return <files, files with license> counts, overall and per
+        suite
+
+        """
+        session = self._session
+        files = session.query(sql_func.count(File.id)).scalar()
+        files_w_license = session.query(
+            sql_func.count(FileCopyright.file_id)).scalar()
+        suite_files = dict(session.query(Suite.suite,
+                                         sql_func.count(File.id))
+                                  .select_from(Suite)
+                                  .join(Package)
+                                  .join(File)
+                                  .group_by(Suite.suite))
+        suite_files_w_license = dict(
+            session.query(Suite.suite, sql_func.count(FileCopyright.file_id))
+                   .select_from(Suite)
+                   .join(Package)
+                   .join(File)
+                   .join(FileCopyright)
+                   .group_by(Suite.suite))
+        return ((files, files_w_license),
+                dict((s, (count, suite_files_w_license.get(s, 0)))
+                     for (s, count) in suite_files.items()))
+
+    def ratio(self, suite=None):
+        """like query.get_ratio, for `suite` or (if None) overall"""
+        (overall, per_suite) = self._get('file_counts', self._file_counts)
+        counts = overall if suite is None else per_suite.get(suite, (0, 0))
+        return _ratio(*counts)
@@ -15,14 +15,28 @@ import os
 import sqlalchemy
 import sqlalchemy.orm
 import subprocess
+import sys
 
 
+from debsources.models import DB_SCHEMA_VERSION
 from debsources.subprocess_workaround import subprocess_setup
 from debsources.tests.testdata import *  # NOQA
 
 
 TEST_DB_DUMP = os.path.join(TEST_DATA_DIR, 'db/pg-dump-custom')
 
+# schema version of TEST_DB_DUMP; after restoring it, db_setup applies the
+# migrations (see MIGRATE_DIR) up to DB_SCHEMA_VERSION. Update it when
+# regenerating the dump (see doc/testing.txt)
+TEST_DB_DUMP_VERSION = 10
+
+MIGRATE_DIR = os.path.abspath(os.path.join(TEST_DIR, '../migrate'))
+
+# migration scripts to run after the SQL migration to a given version
+POST_MIGRATION_SCRIPTS = {
+    14: 'backfill-version-keys',
+}
+
 # queries to compare two DB schemas (e.g. "public.*" and "ref.*")
 DB_COMPARE_QUERIES = {
     "package_names":
@@ -121,6 +135,34 @@ def pg_dump(dbname, dumpfile):
                           preexec_fn=subprocess_setup)
 
 
+def pg_migrate(dbname, from_version=TEST_DB_DUMP_VERSION,
+               to_version=DB_SCHEMA_VERSION):
+    """apply the migrations of MIGRATE_DIR from schema version
+    `from_version` to `to_version` to DB `dbname`, as an admin would do
+
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.abspath(os.path.join(TEST_DIR, '../..'))] +
+        [p for p in [os.environ.get('PYTHONPATH')] if p])
+    for version in range(from_version, to_version):
+        script = os.path.join(MIGRATE_DIR, '%03d-to-%03d.sql' %
+                              (version, version + 1))
+        subprocess.check_call(['psql', '--quiet', '--no-psqlrc',
+                               '--set', 'ON_ERROR_STOP=1',
+                               '--single-transaction',
+                               '--dbname', dbname, '--file', script],
+                              preexec_fn=subprocess_setup)
+        post_script = POST_MIGRATION_SCRIPTS.get(version + 1)
+        if post_script:
+            with open(os.devnull, 'w') as devnull:
+                subprocess.check_call([sys.executable,
+                                       os.path.join(MIGRATE_DIR, post_script),
+                                       'postgresql:///' + dbname],
+                                      stdout=devnull, env=env,
+                                      preexec_fn=subprocess_setup)
+
+
 def pg_dropdb(dbname):
     subprocess.check_call(['dropdb', dbname],
                           preexec_fn=subprocess_setup)
@@ -149,6 +191,7 @@ def db_setup(test_subj, dbname=TEST_DB_NAME, dbdump=TEST_DB_DUMP, echo=False):
     test_subj.db = sqlalchemy.create_engine(
         'postgresql:///' + dbname, echo=echo)
     pg_restore(dbname, dbdump)
+    pg_migrate(dbname)
     Session = sqlalchemy.orm.sessionmaker()
     test_subj.session = Session(bind=test_subj.db)
 
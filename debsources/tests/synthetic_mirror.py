@@ -0,0 +1,200 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""generate synthetic Debian source mirrors, e.g. for benchmarks
+
+A mirror has dists/SUITE/main/source/Sources.gz indexes and, in pool/, tiny
+native (format 1.0) source packages: a .dsc and a .tar.gz holding a few C
+files and a machine-readable debian/copyright, so that all hooks have some
+work to do.
+
+Mirrors evolve by generation, to benchmark incremental updates: at each
+generation a random fraction (`churn`) of the packages of the first suite
+(unstable-like) get a new version, while the other suites (stable-like) keep
+the versions of generation 0. Packages of former generations are left in
+pool/, as they would until the next archive cleanup. Output only depends on
+the parameters, not on when or how many times the mirror is generated.
+
+"""
+
+from __future__ import absolute_import
+
+import gzip
+import hashlib
+import io
+import os
+import random
+import tarfile
+
+MAINTAINER = 'Debsources Benchmarks <bench@debsources.invalid>'
+
+_C_FUNCTION = """\
+int %(name)s_f%(num)d(int x)
+{
+\treturn x * %(num)d + %(rev)d;
+}
+
+"""
+
+_COPYRIGHT = """\
+Format: http://www.debian.org/doc/packaging-manuals/copyright-format/1.0/
+Upstream-Name: %(name)s
+
+Files: *
+Copyright: 2015 The Debsources developers
+License: %(license)s
+
+Files: debian/*
+Copyright: 2015 The Debsources developers
+License: GPL-2+
+"""
+
+LICENSES = ['GPL-2+', 'GPL-3+', 'BSD-3-clause', 'Apache-2.0', 'MIT']
+
+
+def package_name(num):
+    """name of the `num`-th package; 1 out of 10 is a library, so that pool
+    prefixes are of both kinds (e.g. "s" and "libs")
+
+    """
+    prefix = 'lib' if num % 10 == 0 else ''
+    return '%s%s%05d' % (prefix, chr(ord('a') + num % 26), num)
+
+
+def revisions(packages, churn, generation, seed=0):
+    """return the number of new versions of each package of the first suite,
+    as of `generation`
+
+    """
+    revs = [0] * packages
+    for gen in range(1, generation + 1):
+        rnd = random.Random(seed * 1000003 + gen)
+        for num in rnd.sample(range(packages),
+                              int(round(packages * churn))):
+            revs[num] += 1
+    return revs
+
+
+def package_version(rev):
+    return '1.%d-1' % rev
+
+
+def _tar_add(tar, path, data):
+    info = tarfile.TarInfo(path)
+    info.size = len(data)
+    info.mtime = 1420070400  # 2015-01-01
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(data))
+
+
+def make_tarball(name, version, rev, files, lines):
+    """return the content of the .tar.gz of a source package"""
+    srcdir = '%s-%s' % (name, version.rsplit('-', 1)[0])
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as gz:
+        with tarfile.open(fileobj=gz, mode='w') as tar:
+            for num in range(files):
+                code = ''.join(_C_FUNCTION % dict(name=name, rev=rev,
+                                                  num=num * lines + i)
+                               for i in range(max(lines // 5, 1)))
+                _tar_add(tar, '%s/src/%s_%d.c' % (srcdir, name, num),
+                         code.encode('ascii'))
+            license = LICENSES[sum(map(ord, name)) % len(LICENSES)]
+            _tar_add(tar, srcdir + '/debian/copyright',
+                     (_COPYRIGHT % dict(name=name, license=license))
+                     .encode('ascii'))
+    return buf.getvalue()
+
+
+def _files_entry(filename, data):
+    return ' %s %d %s' % (hashlib.md5(data).hexdigest(), len(data), filename)
+
+
+def write_package(mirror_dir, name, version, rev, files, lines):
+    """write the .dsc and .tar.gz of a package to the pool of `mirror_dir`,
+    if missing; return its Sources.gz paragraph
+
+    """
+    prefix = name[:4] if name.startswith('lib') else name[:1]
+    directory = 'pool/main/%s/%s' % (prefix, name)
+    pooldir = os.path.join(mirror_dir, directory)
+    if not os.path.isdir(pooldir):
+        os.makedirs(pooldir)
+    basename = '%s_%s' % (name, version)
+
+    tarball = make_tarball(name, version, rev, files, lines)
+    dsc = '\n'.join(['Format: 1.0',
+                     'Source: ' + name,
+                     'Binary: ' + name,
+                     'Architecture: any',
+                     'Version: ' + version,
+                     'Maintainer: ' + MAINTAINER,
+                     'Standards-Version: 3.9.6',
+                     'Files:',
+                     _files_entry(basename + '.tar.gz', tarball)]) + '\n'
+    dsc = dsc.encode('ascii')
+    for (filename, data) in [(basename + '.tar.gz', tarball),
+                             (basename + '.dsc', dsc)]:
+        path = os.path.join(pooldir, filename)
+        if not os.path.exists(path):
+            with open(path, 'wb') as out:
+                out.write(data)
+
+    return '\n'.join(['Package: ' + name,
+                      'Binary: ' + name,
+                      'Version: ' + version,
+                      'Maintainer: ' + MAINTAINER,
+                      'Format: 1.0',
+                      'Directory: ' + directory,
+                      'Priority: optional',
+                      'Section: misc',
+                      'Files:',
+                      _files_entry(basename + '.dsc', dsc),
+                      _files_entry(basename + '.tar.gz', tarball)]) + '\n'
+
+
+def generate_mirror(mirror_dir, packages=100, files=10, lines=50,
+                    suites=('sid', 'jessie'), suite_overlap=0.8, churn=0.1,
+                    generation=0, seed=0):
+    """(re)generate a synthetic mirror in `mirror_dir`, as of `generation`
+
+    The first suite has `packages` packages of `files` C files each, of about
+    `lines` lines each; each other suite has a random `suite_overlap` fraction
+    of them. See the module documentation for `churn` and `generation`.
+
+    return a dict mapping suite names to lists of <package, version> pairs
+
+    """
+    revs = revisions(packages, churn, generation, seed)
+    rnd = random.Random(seed)
+    members = [range(packages)] + \
+        [[num for num in range(packages) if rnd.random() < suite_overlap]
+         for _suite in suites[1:]]
+
+    paragraphs = {}  # <num, rev> -> Sources paragraph
+    listing = {}
+    for (i, suite) in enumerate(suites):
+        listing[suite] = []
+        srcdir = os.path.join(mirror_dir, 'dists', suite, 'main', 'source')
+        if not os.path.isdir(srcdir):
+            os.makedirs(srcdir)
+        index = os.path.join(srcdir, 'Sources.gz')
+        with gzip.GzipFile(index + '.new', mode='wb', mtime=0) as out:
+            for num in members[i]:
+                (name, rev) = (package_name(num), revs[num] if i == 0 else 0)
+                if (num, rev) not in paragraphs:
+                    paragraphs[(num, rev)] = write_package(
+                        mirror_dir, name, package_version(rev), rev, files,
+                        lines)
+                out.write((paragraphs[(num, rev)] + '\n').encode('ascii'))
+                listing[suite].append((name, package_version(rev)))
+        os.rename(index + '.new', index)
+    return listing
@@ -0,0 +1,105 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from debsources import bloom
+from debsources.models import Base, ChecksumStats
+
+
+def sha256(i):
+    return hashlib.sha256(str(i).encode('ascii')).hexdigest()
+
+
+@attr('bloom')
+class BloomFilterTests(unittest.TestCase):
+    """ unit tests for debsources.bloom """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='debsources-bloom-')
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, bloom.SHA256_FILTER)
+
+    @istest
+    def noFalseNegatives(self):
+        f = bloom.BloomFilter.for_count(1000)
+        for i in range(1000):
+            f.add(sha256(i))
+        self.assertEqual(len(f), 1000)
+        self.assertTrue(all(sha256(i) in f for i in range(1000)))
+        false_positives = sum(sha256(-i) in f for i in range(1, 10001))
+        self.assertLess(false_positives, 300)  # expected: 1%
+
+    @istest
+    def rejectsInvalidDigests(self):
+        f = bloom.BloomFilter.for_count(10)
+        for digest in [None, '', 'abc', 'z' * 64, sha256(0) + '00']:
+            self.assertFalse(digest in f)
+        self.assertRaises(ValueError, f.add, 'not a digest')
+
+    @istest
+    def buildsAndLoadsFromDb(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine, tables=[ChecksumStats.__table__])
+        session = sessionmaker(bind=engine)()
+        for i in range(100):
+            session.add(ChecksumStats(sha256=sha256(i), file_count=1,
+                                      package_count=1))
+        session.flush()
+        self.assertEqual(bloom.build_sha256_filter(session, self.path), 100)
+        session.close()
+
+        f = bloom.load(self.path)
+        self.addCleanup(f.close)
+        self.assertEqual(len(f), 100)
+        self.assertTrue(all(sha256(i) in f for i in range(100)))
+        self.assertLess(sum(sha256(-i) in f for i in range(1, 1001)), 50)
+        self.assertFalse(os.path.exists(self.path + '.new'))
+
+    @istest
+    def marksStaleUntilRebuilt(self):
+        marker = bloom.stale_marker(self.path)
+        bloom.mark_stale(self.path)
+        self.assertFalse(os.path.exists(marker))  # no filter yet
+
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine, tables=[ChecksumStats.__table__])
+        session = sessionmaker(bind=engine)()
+        self.addCleanup(session.close)
+        bloom.build_sha256_filter(session, self.path)
+        bloom.mark_stale(self.path)
+        bloom.mark_stale(self.path)
+        self.assertTrue(os.path.exists(marker))
+        bloom.build_sha256_filter(session, self.path)
+        self.assertFalse(os.path.exists(marker))
+
+    @istest
+    def ignoresMissingOrCorruptFiles(self):
+        self.assertIsNone(bloom.load(self.path))
+        bloom.BloomFilter.for_count(10).write(self.path)
+        with open(self.path, 'ab') as f:
+            f.write(b'\0')
+        self.assertIsNone(bloom.load(self.path))
+        with open(self.path, 'wb') as f:
+            f.write(b'garbage')
+        self.assertIsNone(bloom.load(self.path))
@@ -0,0 +1,142 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from debsources import bloom
+from debsources import bulkload
+from debsources.models import Base, Checksum, ChecksumStats, Ctag, File, \
+    Package, PackageName
+
+SHA_A = 'a' * 64
+SHA_B = 'b' * 64
+CTAGS = b'''!_TAG_FILE_FORMAT\t2\t/extended format/
+main\teval.c\t10;"\tkind:f\tline:10\tlanguage:C
+eval\teval.c\t20;"\tkind:f\tline:20\tlanguage:C
+orphan\tgone.c\t1;"\tkind:f\tline:1\tlanguage:C
+'''
+
+
+@attr('bulkload')
+class BulkLoadTests(unittest.TestCase):
+    """ unit tests for debsources.bulkload """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='debsources-bulkload-')
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.conf = {
+            'cache_dir': self.tmpdir,
+            'db_uri': 'sqlite:///' + os.path.join(self.tmpdir, 'db.sqlite'),
+            'sources_dir': os.path.join(self.tmpdir, 'sources'),
+        }
+        engine = create_engine(self.conf['db_uri'])
+        Base.metadata.create_all(engine, tables=[
+            PackageName.__table__, Package.__table__, File.__table__,
+            Checksum.__table__, ChecksumStats.__table__, Ctag.__table__])
+        session = sessionmaker(bind=engine)()
+        self.file_ids = {}
+        for (name, version) in [('gnubg', '1.02.000-2'), ('ledger', '2.6-1')]:
+            db_name = PackageName(name)
+            session.add(db_name)
+            session.flush()
+            pkg = Package(version, db_name)
+            pkg.area = 'main'
+            session.add(pkg)
+            session.flush()
+            for path in [b'eval.c', b'README']:
+                f = File(pkg, path)
+                session.add(f)
+                session.flush()
+                self.file_ids[(name, path)] = f.id
+            pkgdir = os.path.join(self.conf['sources_dir'], 'main',
+                                  name[0], name, version)
+            os.makedirs(pkgdir)
+            with open(pkgdir + '.checksums', 'w') as sums:
+                sums.write('%s  eval.c\n%s  README\n%s  gone.c\n'
+                           % (SHA_A, SHA_B, SHA_A))
+            with open(pkgdir + '.ctags', 'wb') as tags:
+                tags.write(CTAGS)
+        # not in the DB
+        os.makedirs(os.path.join(self.conf['sources_dir'], 'main/z/zz/1.0'))
+        with open(os.path.join(self.conf['sources_dir'],
+                               'main/z/zz/1.0.ctags'), 'wb') as tags:
+            tags.write(CTAGS)
+        session.commit()
+        session.close()
+        engine.dispose()
+
+    def query(self, *entities):
+        engine = create_engine(self.conf['db_uri'])
+        session = sessionmaker(bind=engine)()
+        try:
+            return sorted(session.query(*entities).all())
+        finally:
+            session.close()
+            engine.dispose()
+
+    @istest
+    def loadsChecksums(self):
+        sha256_filter = os.path.join(self.tmpdir, bloom.SHA256_FILTER)
+        open(sha256_filter, 'w').close()
+        self.assertEqual(bulkload.bulk_load(self.conf, 'checksums'), (2, 0))
+        self.assertTrue(os.path.exists(bloom.stale_marker(sha256_filter)))
+        ids = self.file_ids
+        self.assertEqual(
+            self.query(Checksum.file_id, Checksum.sha256),
+            sorted([(ids[('gnubg', b'eval.c')], SHA_A),
+                    (ids[('gnubg', b'README')], SHA_B),
+                    (ids[('ledger', b'eval.c')], SHA_A),
+                    (ids[('ledger', b'README')], SHA_B)]))
+        self.assertEqual(
+            self.query(ChecksumStats.sha256, ChecksumStats.file_count,
+                       ChecksumStats.package_count),
+            [(SHA_A, 2, 2), (SHA_B, 2, 2)])
+
+    @istest
+    def loadsCtagsInParallel(self):
+        self.assertEqual(bulkload.bulk_load(self.conf, 'ctags', jobs=2),
+                         (2, 0))
+        rows = self.query(Ctag.tag, Ctag.file_id, Ctag.line)
+        self.assertEqual(len(rows), 4)
+        self.assertIn((u'main', self.file_ids[('ledger', b'eval.c')], 10),
+                      rows)
+
+    @istest
+    def skipsLoadedPackages(self):
+        self.assertEqual(bulkload.bulk_load(self.conf, 'ctags'), (2, 0))
+        self.assertEqual(bulkload.bulk_load(self.conf, 'ctags'), (0, 0))
+        self.assertEqual(len(self.query(Ctag.id)), 4)
+
+    @istest
+    def resumesFromCheckpoint(self):
+        checkpoint = bulkload.Checkpoint(os.path.join(self.tmpdir, 'ckpt'))
+        gnubg = os.path.join(self.conf['sources_dir'],
+                             'main/g/gnubg/1.02.000-2.checksums')
+        self.assertEqual(bulkload.bulk_load(self.conf, 'checksums',
+                                            paths=[gnubg],
+                                            checkpoint=checkpoint), (1, 0))
+        self.assertEqual(checkpoint.done(),
+                         set(['main/g/gnubg/1.02.000-2.checksums']))
+        self.assertEqual(bulkload.bulk_load(self.conf, 'checksums',
+                                            checkpoint=checkpoint), (1, 0))
+        self.assertEqual(len(checkpoint.done()), 2)
+        self.assertEqual(len(self.query(Checksum.id)), 4)
@@ -0,0 +1,118 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from sqlalchemy import create_engine
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+from debsources import query as qry
+from debsources.models import Base, Checksum, ChecksumStats, File, Package, \
+    PackageName
+from debsources.plugins import hook_checksums
+from debsources.tests.db_testing import DbTestFixture
+
+SHA_A = 'a' * 64
+SHA_B = 'b' * 64
+SHA_C = 'c' * 64
+
+
+@attr('checksums')
+class ChecksumStatsTests(unittest.TestCase):
+    """ unit tests for the maintenance of checksum_stats """
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine, tables=[
+            PackageName.__table__, Package.__table__, File.__table__,
+            Checksum.__table__, ChecksumStats.__table__])
+        self.session = sessionmaker(bind=engine)()
+        self.addCleanup(self.session.close)
+
+    def add_package(self, name, sums):
+        db_name = PackageName(name)
+        self.session.add(db_name)
+        self.session.flush()
+        pkg = Package('1.0-1', db_name)
+        self.session.add(pkg)
+        self.session.flush()
+        for (i, sha256) in enumerate(sums):
+            f = File(pkg, b'file%d' % i)
+            self.session.add(f)
+            self.session.flush()
+            self.session.add(Checksum(pkg, f.id, sha256))
+        self.session.flush()
+        hook_checksums.add_stats(self.session, pkg.id)
+        return pkg.id
+
+    def rm_package(self, package_id):
+        hook_checksums.rm_stats(self.session, package_id)
+        self.session.query(Checksum).filter_by(package_id=package_id).delete()
+
+    def stats(self):
+        return sorted((s.sha256, s.file_count, s.package_count)
+                      for s in self.session.query(ChecksumStats))
+
+    @istest
+    def maintainsStatsIncrementally(self):
+        gnubg = self.add_package('gnubg', [SHA_A, SHA_A, SHA_B])
+        self.add_package('ledger', [SHA_A, SHA_C])
+        self.assertEqual(self.stats(), [(SHA_A, 3, 2), (SHA_B, 1, 1),
+                                        (SHA_C, 1, 1)])
+        incremental = self.stats()
+        hook_checksums.refresh_stats(self.session)
+        self.assertEqual(self.stats(), incremental)
+
+        self.rm_package(gnubg)
+        self.assertEqual(self.stats(), [(SHA_A, 1, 1), (SHA_C, 1, 1)])
+
+    @istest
+    def looksUpStats(self):
+        self.add_package('gnubg', [SHA_A, SHA_A, SHA_B])
+        self.assertEqual(qry.get_checksum_stats(self.session,
+                                                SHA_A).file_count, 2)
+        self.assertIsNone(qry.get_checksum_stats(self.session, SHA_C))
+        self.assertIsNone(qry.get_checksum_stats(self.session, None))
+        self.assertEqual(sorted(qry.get_checksums_stats(
+            self.session, [SHA_A, SHA_C])), [SHA_A])
+
+
+@attr('checksums')
+@attr('postgres')
+class ChecksumStatsFixtureTests(unittest.TestCase, DbTestFixture):
+    """ check checksum_stats of the (migrated) test DB """
+
+    def setUp(self):
+        self.db_setup()
+
+    def tearDown(self):
+        self.db_teardown()
+
+    def stats(self):
+        return sorted((s.sha256, s.file_count, s.package_count)
+                      for s in self.session.query(ChecksumStats))
+
+    @istest
+    def fixtureStatsMatchChecksums(self):
+        expected = sorted(
+            self.session.query(Checksum.sha256, func.count(),
+                               func.count(Checksum.package_id.distinct()))
+            .group_by(Checksum.sha256))
+        self.assertTrue(expected)
+        self.assertEqual(self.stats(), expected)
+        hook_checksums.refresh_stats(self.session)
+        self.assertEqual(self.stats(), expected)
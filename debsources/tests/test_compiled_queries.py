@@ -0,0 +1,95 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from debsources import compiled_queries
+from debsources.models import Base, Checksum, File, Package, PackageName, \
+    Suite
+
+TABLES = [PackageName.__table__, Package.__table__, File.__table__,
+          Checksum.__table__, Suite.__table__]
+
+
+@attr('compiled_queries')
+class CompiledQueriesTests(unittest.TestCase):
+    """ unit tests for the precompiled lookups, on an SQLite DB """
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine, tables=TABLES)
+        self.session = session = sessionmaker(bind=engine)()
+
+        name = PackageName('gnubg')
+        session.add(name)
+        session.flush()
+        self.pkgs = []
+        for version in ['0.90+20091206-4', '1.02.000-2']:
+            pkg = Package(version, name)
+            pkg.area = 'main'
+            session.add(pkg)
+            session.flush()
+            self.pkgs.append(pkg)
+        session.add(Suite(self.pkgs[0], 'squeeze'))
+        session.add(Suite(self.pkgs[1], 'jessie'))
+        session.add(Suite(self.pkgs[1], 'sid'))
+        f = File(self.pkgs[1], b'eval.c')
+        session.add(f)
+        session.flush()
+        session.add(Checksum(self.pkgs[1], f.id, 'a' * 64))
+        session.flush()
+        self.file_id = f.id
+
+    def tearDown(self):
+        self.session.close()
+
+    @istest
+    def looksUpPackage(self):
+        pkg = compiled_queries.package(self.session, 'gnubg', '1.02.000-2')
+        self.assertEqual(pkg.id, self.pkgs[1].id)
+        self.assertEqual(pkg.name, 'gnubg')
+        self.assertEqual(pkg.to_dict(), self.pkgs[1].to_dict())
+        self.assertIsNone(
+            compiled_queries.package(self.session, 'gnubg', '9.9'))
+
+    @istest
+    def looksUpFile(self):
+        f = compiled_queries.file_(self.session, 'gnubg', '1.02.000-2',
+                                   b'eval.c')
+        self.assertEqual(f, (self.file_id, self.pkgs[1].id, b'eval.c'))
+        self.assertIsNone(compiled_queries.file_(
+            self.session, 'gnubg', '0.90+20091206-4', b'eval.c'))
+
+    @istest
+    def looksUpSha256(self):
+        self.assertEqual(
+            compiled_queries.file_sha256(self.session, 'gnubg',
+                                         '1.02.000-2', b'eval.c'),
+            'a' * 64)
+        self.assertIsNone(compiled_queries.file_sha256(
+            self.session, 'gnubg', '1.02.000-2', b'nope.c'))
+
+    @istest
+    def looksUpSuites(self):
+        ids = [p.id for p in self.pkgs]
+        suites = compiled_queries.suites(self.session, ids + [42])
+        self.assertEqual(suites[ids[0]], ['squeeze'])
+        self.assertItemsEqual(suites[ids[1]], ['jessie', 'sid'])
+        self.assertEqual(suites[42], [])
+        self.assertEqual(compiled_queries.suites(self.session, []), {})
@@ -0,0 +1,80 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from debsources.models import Base, File, FileCopyright, Package, \
+    PackageName
+from debsources.plugins import hook_copyright
+
+
+@attr('copyright')
+class CopyrightHookTests(unittest.TestCase):
+    """ unit tests for the DB side of the copyright hook """
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine, tables=[
+            PackageName.__table__, Package.__table__, File.__table__,
+            FileCopyright.__table__])
+        self.session = sessionmaker(bind=engine)()
+        self.addCleanup(self.session.close)
+
+    def add_package(self, name, paths):
+        db_name = PackageName(name)
+        self.session.add(db_name)
+        self.session.flush()
+        pkg = Package('1.0-1', db_name)
+        self.session.add(pkg)
+        self.session.flush()
+        file_table = {}
+        for path in paths:
+            f = File(pkg, path)
+            self.session.add(f)
+            self.session.flush()
+            file_table[path] = f.id
+        return (pkg.id, file_table)
+
+    def licenses(self):
+        return sorted((f.path, c.license)
+                      for (c, f) in self.session.query(FileCopyright, File)
+                                                .join(File))
+
+    @istest
+    def addsAndRemovesLicenses(self):
+        (gnubg, gnubg_files) = self.add_package('gnubg', [b'a.c', b'b.c'])
+        (ledger, ledger_files) = self.add_package('ledger', [b'a.c'])
+        self.assertEqual(
+            hook_copyright.add_licenses(self.session,
+                                        [('GPL-3+', b'a.c'),
+                                         ('BSD-3-clause', b'b.c'),
+                                         ('GPL-2', b'unknown.c')],
+                                        gnubg_files),
+            2)
+        hook_copyright.add_licenses(self.session, [('MIT', b'a.c')],
+                                    ledger_files)
+        self.assertEqual(self.licenses(), [(b'a.c', 'GPL-3+'),
+                                           (b'a.c', 'MIT'),
+                                           (b'b.c', 'BSD-3-clause')])
+
+        hook_copyright.rm_licenses(self.session, gnubg)
+        self.assertEqual(self.licenses(), [(b'a.c', 'MIT')])
+        hook_copyright.rm_licenses(self.session, gnubg)  # idempotent
+        hook_copyright.rm_licenses(self.session, ledger)
+        self.assertEqual(self.licenses(), [])
@@ -0,0 +1,152 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import os
+import tempfile
+import unittest
+
+from array import array
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from debsources import db_storage
+from debsources.models import Base, Ctag, File, Package, PackageName
+from debsources.plugins.hook_ctags import CtagsBatch, parse_ctags, \
+    parse_ctags_batches
+
+TAGS = b'''!_TAG_FILE_FORMAT\t2\t/extended format/
+!_TAG_FILE_SORTED\t0\t/0=unsorted, 1=sorted, 2=foldcase/
+music\tsound.c\t13;"\tkind:v\tline:13\tlanguage:C\tfile:
+play\tsound.c\t20;"\tkind:f\tline:20\tlanguage:C\tsignature:(void)
+__RAW_R\tsound.c\t25;"\tkind:t\tline:25\tlanguage:C\ttyperef:struct:__RAW_R
+broken\tsound.c\t30;"\tkind:v\tlanguage:C
+Main\tsrc/Main.java\t3;"\tkind:c\tline:3\tlanguage:Java
+caf\xc3\xa9\tsrc/Main.java\t5;"\tkind:m\tline:5\tlanguage:Java
+orphan\tunknown.py\t1;"\tkind:f\tline:1\tlanguage:Python
+'''
+
+
+@attr('ctags')
+class CtagsParserTests(unittest.TestCase):
+    """ unit tests for the ctags parsers of hook_ctags """
+
+    def setUp(self):
+        (fd, self.path) = tempfile.mkstemp(prefix='debsources-',
+                                           suffix='.ctags')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(TAGS)
+        self.file_ids = {b'sound.c': 1, b'src/Main.java': 2}
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def rows(self, batch_size):
+        rows = []
+        for batch in parse_ctags_batches(self.path, self.file_ids.get,
+                                         batch_size):
+            self.assertLessEqual(len(batch), batch_size)
+            rows.extend(batch.rows(42))
+        return rows
+
+    @istest
+    def batchesMatchTagDicts(self):
+        expected = [(42, t['tag'], self.file_ids[t['path']], t['line'],
+                     t['kind'], t['language'])
+                    for t in parse_ctags(self.path)
+                    if t['path'] in self.file_ids]
+        self.assertEqual(self.rows(2), expected)
+        self.assertEqual(self.rows(1000), expected)
+
+    @istest
+    def batchesSkipMalformedTags(self):
+        tags = [row[1] for row in self.rows(1000)]
+        self.assertEqual(tags, ['music', 'play', '__RAW_R', 'Main'])
+        self.assertEqual([row[5] for row in self.rows(1000)],
+                         ['c', 'c', 'c', 'java'])
+
+    @istest
+    def fileIdsResolvedOncePerFile(self):
+        calls = []
+
+        def file_id(relpath):
+            calls.append(relpath)
+            return self.file_ids.get(relpath)
+
+        list(parse_ctags_batches(self.path, file_id))
+        self.assertEqual(calls, [b'sound.c', b'src/Main.java',
+                                 b'unknown.py'])
+
+
+@attr('ctags')
+class CopyRowsTests(unittest.TestCase):
+    """ unit tests for db_storage.copy_rows """
+
+    @istest
+    def encodesCopyValues(self):
+        self.assertEqual(db_storage._copy_value(None), b'\\N')
+        self.assertEqual(db_storage._copy_value(42), b'42')
+        self.assertEqual(db_storage._copy_value(u'caf\xe9'), b'caf\xc3\xa9')
+        self.assertEqual(db_storage._copy_value(b'a\tb\\c\nd'),
+                         b'a\\tb\\\\c\\nd')
+
+    @istest
+    def encodesCopyColumns(self):
+        self.assertEqual(db_storage._copy_column(array('l', [1, 22])),
+                         [b'1', b'22'])
+        self.assertEqual(db_storage._copy_column([7, 7]), [b'7', b'7'])
+        self.assertEqual(db_storage._copy_column([u'a', None, b'b']),
+                         [b'a', b'\\N', b'b'])
+        self.assertEqual(db_storage._copy_column([u'a\\b', b'c\td', None]),
+                         [b'a\\\\b', b'c\\td', b'\\N'])
+        self.assertEqual(db_storage._copy_column([1, None, u'x']),
+                         [b'1', b'\\N', b'x'])
+
+    @istest
+    def fallsBackToInsert(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine, tables=[
+            PackageName.__table__, Package.__table__, File.__table__,
+            Ctag.__table__])
+        session = sessionmaker(bind=engine)()
+        name = PackageName('gnubg')
+        session.add(name)
+        session.flush()
+        pkg = Package('1.02.000-2', name)
+        pkg.area = 'main'
+        session.add(pkg)
+        session.flush()
+        f = File(pkg, b'eval.c')
+        session.add(f)
+        session.flush()
+
+        batch = CtagsBatch()
+        for (tag, line) in [(u'main', 10), (u'eval', 20)]:
+            batch.tag.append(tag)
+            batch.file_id.append(f.id)
+            batch.line.append(line)
+            batch.kind.append('f')
+            batch.language.append('c')
+        count = db_storage.copy_rows(session, Ctag.__table__,
+                                     ['package_id'] + CtagsBatch.COLUMNS,
+                                     batch.rows(pkg.id))
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            sorted((c.tag, c.line) for c in session.query(Ctag)),
+            [(u'eval', 20), (u'main', 10)])
+        self.assertEqual(db_storage.copy_rows(session, Ctag.__table__,
+                                              ['package_id'], []), 0)
+        session.close()
@@ -0,0 +1,64 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from sqlalchemy import MetaData, create_engine
+
+from debsources import db_indexes
+from debsources.models import Base
+
+TABLES = ['package_names', 'packages', 'files', 'checksums', 'ctags',
+          'suites']
+
+
+@attr('db_indexes')
+class DbIndexesTests(unittest.TestCase):
+    """ unit tests for index management, on an SQLite DB """
+
+    def setUp(self):
+        self.db = create_engine('sqlite://')
+        self.metadata = MetaData()
+        for table in TABLES:
+            Base.metadata.tables[table].tometadata(self.metadata)
+        self.metadata.create_all(self.db)
+
+    @istest
+    def noDiffAfterCreation(self):
+        self.assertEqual(db_indexes.diff_indexes(self.db, self.metadata),
+                         ([], []))
+
+    @istest
+    def findsAndCreatesMissingIndexes(self):
+        self.db.execute('DROP INDEX ix_ctags_tag_package_id_file_id')
+        missing, stale = db_indexes.diff_indexes(self.db, self.metadata)
+        self.assertEqual([i.name for i in missing],
+                         ['ix_ctags_tag_package_id_file_id'])
+        self.assertEqual(stale, [])
+        db_indexes.create_indexes(self.db, missing)
+        self.assertEqual(db_indexes.diff_indexes(self.db, self.metadata),
+                         ([], []))
+
+    @istest
+    def findsAndDropsStaleIndexes(self):
+        self.db.execute('CREATE INDEX ix_ctags_tag ON ctags (tag)')
+        missing, stale = db_indexes.diff_indexes(self.db, self.metadata)
+        self.assertEqual(missing, [])
+        self.assertEqual(stale, [db_indexes.IndexSpec(
+            'ctags', 'ix_ctags_tag', ('tag',), False)])
+        db_indexes.drop_indexes(self.db, stale)
+        self.assertEqual(db_indexes.diff_indexes(self.db, self.metadata),
+                         ([], []))
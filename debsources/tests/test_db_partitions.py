@@ -0,0 +1,57 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from debsources import db_partitions
+
+
+@attr('db_partitions')
+class DbPartitionsTests(unittest.TestCase):
+    """ unit tests for the generation of partitioning DDL """
+
+    @istest
+    def refusesReferencedTables(self):
+        self.assertRaises(ValueError, db_partitions.check_partitionable,
+                          'files')
+        self.assertRaises(ValueError, db_partitions.check_partitionable,
+                          'package_names')  # no package_id column
+
+    @istest
+    def partitionsCtags(self):
+        stmts = db_partitions.partition_ddl('ctags', partitions=4)
+        self.assertIn('CREATE TABLE ctags_p3 PARTITION OF ctags_partitioned '
+                      'FOR VALUES WITH (MODULUS 4, REMAINDER 3)', stmts)
+        self.assertIn('ALTER TABLE ctags ADD PRIMARY KEY (id, package_id)',
+                      stmts)
+        self.assertIn('CREATE INDEX ix_ctags_tag_package_id_file_id '
+                      'ON ctags (tag, package_id, file_id)', stmts)
+        # data is copied before the old table is dropped
+        self.assertLess(
+            stmts.index('INSERT INTO ctags_partitioned SELECT * FROM ctags'),
+            stmts.index('DROP TABLE ctags'))
+        # the id sequence survives
+        self.assertLess(stmts.index('ALTER SEQUENCE ctags_id_seq OWNED BY '
+                                    'NONE'),
+                        stmts.index('DROP TABLE ctags'))
+
+    @istest
+    def unpartitionsChecksums(self):
+        stmts = db_partitions.unpartition_ddl('checksums')
+        self.assertIn('ALTER TABLE checksums ADD PRIMARY KEY (id)', stmts)
+        self.assertIn('ALTER TABLE checksums ADD UNIQUE (package_id, file_id)',
+                      stmts)
+        self.assertFalse([s for s in stmts if 'PARTITION' in s])
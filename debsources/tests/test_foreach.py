@@ -0,0 +1,107 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from debsources import foreach
+
+SOURCES_TXT = [
+    'ledger\t2.6.2-3.1\tmain\tpool/main/l/ledger/ledger_2.6.2-3.1.dsc\t'
+    'main/l/ledger/2.6.2-3.1\tjessie,sid',
+    'nvidia-support\t20131102+1\tcontrib\t'
+    'pool/contrib/n/nvidia-support/nvidia-support_20131102+1.dsc\t'
+    'contrib/n/nvidia-support/20131102+1\tsid',
+    'gone\t1.0-1\tmain\tpool/main/g/gone/gone_1.0-1.dsc\t'
+    'main/g/gone/1.0-1\t',
+]
+
+
+@attr('foreach')
+class ForeachTests(unittest.TestCase):
+    """ unit tests for debsources.foreach """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='debsources-foreach-')
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.mirror_dir = os.path.join(self.tmpdir, 'mirror')
+        self.sources_dir = os.path.join(self.tmpdir, 'sources')
+        self.srclist = os.path.join(self.tmpdir, 'sources.txt')
+        with open(self.srclist, 'w') as f:
+            f.write('\n'.join(SOURCES_TXT) + '\n')
+        self.entries = list(foreach.read_sources_txt(self.srclist))
+        for entry in self.entries[:2]:  # last one is not unpacked
+            os.makedirs(os.path.join(self.sources_dir, entry.dir))
+
+    @istest
+    def parsesSourcesTxt(self):
+        self.assertEqual(len(self.entries), 3)
+        self.assertEqual(self.entries[0].package, 'ledger')
+        self.assertEqual(self.entries[0].suites, ['jessie', 'sid'])
+        self.assertEqual(self.entries[1].area, 'contrib')
+        self.assertEqual(self.entries[2].suites, [])
+
+    @istest
+    def filtersBySuiteAndArea(self):
+        def names(**kwargs):
+            return [e.package
+                    for e in foreach.filter_entries(self.entries, **kwargs)]
+        self.assertEqual(names(suites=['jessie']), ['ledger'])
+        self.assertEqual(names(suites=['jessie', 'sid']),
+                         ['ledger', 'nvidia-support'])
+        self.assertEqual(names(areas=['main']), ['ledger', 'gone'])
+        self.assertEqual(names(suites=['sid'], areas=['contrib']),
+                         ['nvidia-support'])
+        self.assertEqual(names(done=set([('ledger', '2.6.2-3.1')])),
+                         ['nvidia-support', 'gone'])
+
+    @istest
+    def runsCommandInPackageDirs(self):
+        results = []
+        failures = foreach.foreach(
+            'echo "$DEBSOURCES_PACKAGE $DEBSOURCES_SUITES $(pwd)" > out; '
+            'test $DEBSOURCES_AREA = main',
+            self.entries, self.mirror_dir, self.sources_dir, jobs=2,
+            callback=results.append)
+        self.assertEqual(failures, 1)  # contrib package
+        self.assertEqual(sorted(r.entry.package for r in results),
+                         ['ledger', 'nvidia-support'])
+        ledger_dir = os.path.join(self.sources_dir, 'main/l/ledger/2.6.2-3.1')
+        with open(os.path.join(ledger_dir, 'out')) as f:
+            self.assertEqual(f.read(),
+                             'ledger jessie,sid %s\n'
+                             % os.path.realpath(ledger_dir))
+
+    @istest
+    def resumesFromState(self):
+        state = foreach.ProgressState(os.path.join(self.tmpdir, 'state'))
+        foreach.foreach('test $DEBSOURCES_AREA = main', self.entries,
+                        self.mirror_dir, self.sources_dir, jobs=1,
+                        state=state)
+        state.close()
+        self.assertEqual(state.done(), set([('ledger', '2.6.2-3.1')]))
+
+        todo = foreach.filter_entries(self.entries, done=state.done())
+        results = []
+        foreach.foreach('true', todo, self.mirror_dir, self.sources_dir,
+                        jobs=1, state=state, callback=results.append)
+        state.close()
+        self.assertEqual([r.entry.package for r in results],
+                         ['nvidia-support'])
+        self.assertEqual(state.done(), set([('ledger', '2.6.2-3.1'),
+                                            ('nvidia-support', '20131102+1')]))
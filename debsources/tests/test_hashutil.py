@@ -11,13 +11,16 @@
 
 from __future__ import absolute_import
 
-import os.path
+import os
+import shutil
+import tempfile
 import unittest
 
 from nose.tools import istest
 from nose.plugins.attrib import attr
 
-from debsources.hashutil import sha1sum, sha256sum
+from debsources import hashutil
+from debsources.hashutil import sha1sum, sha256sum, hash_file, hash_files
 from debsources.tests.testdata import *  # NOQA
 
 
@@ -40,3 +43,56 @@ class HashutilTests(unittest.TestCase):
         self.assertEqual(
             sha256sum(make_path('main/libc/libcaca/0.99.beta18-1/COPYING')),
             'd10f0447c835a590ef137d99dd0e3ed29b5e032e7434a87315b30402bf14e7fd')
+
+    @istest
+    def hashFileComputesAllSums(self):
+        path = make_path('main/libc/libcaca/0.99.beta18-1/COPYING')
+        hashes = hash_file(path)
+        self.assertEqual(hashes.sha1, sha1sum(path))
+        self.assertEqual(hashes.sha256, sha256sum(path))
+        self.assertEqual(hashes.size, os.path.getsize(path))
+
+    @istest
+    def hashFileMmapsBigFiles(self):
+        tmpdir = tempfile.mkdtemp(prefix='debsources-hashutil-')
+        try:
+            path = os.path.join(tmpdir, 'big')
+            with open(path, 'wb') as f:
+                f.write(b'\x00\xff' * hashutil.MMAP_THRESHOLD)
+            hashes = hash_file(path)
+            self.assertEqual(hashes.sha256, sha256sum(path))
+            self.assertEqual(hashes.sha1, sha1sum(path))
+            self.assertEqual(hashes.size, 2 * hashutil.MMAP_THRESHOLD)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def make_files(self):
+        tmpdir = tempfile.mkdtemp(prefix='debsources-hashutil-')
+        self.addCleanup(shutil.rmtree, tmpdir)
+        files = []
+        for (relpath, content) in [('top', b'top\n'),
+                                   ('deep', b'deep\n'),
+                                   ('empty', b'')] * 10:
+            relpath = '%s%d' % (relpath, len(files))
+            with open(os.path.join(tmpdir, relpath), 'wb') as f:
+                f.write(content)
+            files.append((relpath, os.path.join(tmpdir, relpath)))
+        return files
+
+    @istest
+    def hashFilesKeepsOrder(self):
+        files = self.make_files()
+        for jobs in [1, 4]:
+            hashes = list(hash_files(files, jobs))
+            self.assertEqual([relpath for (relpath, _h) in hashes],
+                             [relpath for (relpath, _a) in files])
+            for ((relpath, abspath), (_r, h)) in zip(files, hashes):
+                self.assertEqual(h, hash_file(abspath))
+        self.assertEqual(hashes[1][1].size, 5)
+
+    @istest
+    def hashFilesReportsErrors(self):
+        files = self.make_files() + [('missing', '/nonexistent/debsources')]
+        for jobs in [1, 2]:
+            with self.assertRaises(IOError):
+                list(hash_files(files, jobs))
@@ -0,0 +1,184 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from debsources import instrument
+from debsources.app.app_factory import AppWrapper
+
+
+@attr('instrument')
+class InstrumentTests(unittest.TestCase):
+    """ unit tests for debsources.instrument """
+
+    def setUp(self):
+        self.recorder = instrument.Recorder()
+        self.tmpdir = tempfile.mkdtemp(prefix='debsources-instrument-')
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    @istest
+    def accumulatesTimings(self):
+        for _i in range(3):
+            with self.recorder.timed('hook', 'add-package/ctags'):
+                pass
+        try:
+            with self.recorder.timed('hook', 'add-package/bad'):
+                raise RuntimeError('bad hook')
+        except RuntimeError:
+            pass
+
+        timings = self.recorder.report()['timings']['hook']
+        ctags = timings['add-package/ctags']
+        self.assertEqual(ctags['count'], 3)
+        self.assertEqual(tuple(ctags['histogram'][0]), (0.01, 3))
+        self.assertEqual(sum(n for (_bound, n) in ctags['histogram']), 3)
+        self.assertTrue(ctags['max_rss'] > 0)
+        self.assertEqual(timings['add-package/bad']['count'], 1)
+
+    @istest
+    def histogramBuckets(self):
+        stats = instrument.Stats()
+        for wall in [0.001, 0.2, 0.5, 4000]:
+            stats.add(wall, 0)
+        self.assertEqual(stats.buckets[:3], [1, 0, 2])
+        self.assertEqual(stats.buckets[-1], 1)
+        self.assertEqual(stats.max_wall, 4000)
+
+    @istest
+    def countsDbStatements(self):
+        engine = create_engine('sqlite://')
+        instrument.instrument_engine(engine)
+        instrument.instrument_engine(engine)  # idempotent
+        instrument.recorder.reset()
+        self.addCleanup(instrument.recorder.reset)
+
+        with instrument.timed('stage', 'outer'):
+            engine.execute('SELECT 1')
+            with instrument.timed('stage', 'inner'):
+                engine.execute('SELECT 2')
+
+        report = instrument.recorder.report()
+        self.assertEqual(report['db_statements'], 2)
+        self.assertEqual(report['timings']['stage']['outer']['db_statements'],
+                         2)
+        self.assertEqual(report['timings']['stage']['inner']['db_statements'],
+                         1)
+
+    @istest
+    def decoratorTimesCalls(self):
+        instrument.recorder.reset()
+        self.addCleanup(instrument.recorder.reset)
+
+        @instrument.instrumented('package', 'add')
+        def add(x):
+            return x + 1
+
+        self.assertEqual(add(1), 2)
+        self.assertEqual(add.__name__, 'add')
+        report = instrument.recorder.report()
+        self.assertEqual(report['timings']['package']['add']['count'], 1)
+
+    @istest
+    def writesReports(self):
+        with self.recorder.timed('stage', 'extract'):
+            pass
+        json_path = os.path.join(self.tmpdir, 'report.json')
+        self.recorder.write_report(json_path)
+        with open(json_path) as f:
+            report = json.load(f)
+        self.assertEqual(report['timings']['stage']['extract']['count'], 1)
+
+        prom_path = os.path.join(self.tmpdir, 'debsources.prom')
+        self.recorder.write_prometheus(prom_path)
+        with open(prom_path) as f:
+            prom = f.read().splitlines()
+        self.assertIn('debsources_update_runs{category="stage",'
+                      'name="extract"} 1', prom)
+        self.assertIn('debsources_update_wall_seconds_histogram_bucket{'
+                      'category="stage",name="extract",le="+Inf"} 1', prom)
+        self.assertFalse(os.path.exists(prom_path + '.new'))
+
+
+@attr('instrument')
+class RequestProfileTests(unittest.TestCase):
+    """ unit tests for per-request profiling """
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        instrument.profile_engine(self.engine)
+        self.addCleanup(instrument.stop_profile)
+
+    @istest
+    def profilesCurrentThreadOnly(self):
+        with instrument.section('fs'):  # no profile: no-op
+            self.engine.execute('SELECT 1')
+        self.assertIsNone(instrument.current_profile())
+
+        profile = instrument.start_profile()
+        for _i in range(3):
+            self.engine.execute('SELECT 1')
+        self.engine.execute('SELECT 2')
+        with instrument.section('magic'):
+            pass
+        with instrument.section('magic'):
+            pass
+        self.assertIs(instrument.stop_profile(), profile)
+        self.engine.execute('SELECT 3')
+
+        self.assertEqual(profile.db_statements, 4)
+        self.assertEqual(dict((stmt, count) for (stmt, count, _t)
+                              in profile.top_queries()),
+                         {'SELECT 1': 3, 'SELECT 2': 1})
+        self.assertEqual(len(profile.top_queries(1)), 1)
+        self.assertEqual(list(profile.sections), ['magic'])
+        timing = profile.server_timing()
+        self.assertTrue(timing.startswith('db;dur='))
+        self.assertIn('desc="4 queries"', timing)
+        self.assertIn('magic;dur=', timing)
+
+    @istest
+    def appWrapperMiddleware(self):
+        log = os.path.join(tempfile.mkdtemp(prefix='debsources-instrument-'),
+                           'slow.log')
+        self.addCleanup(shutil.rmtree, os.path.dirname(log))
+        session = scoped_session(sessionmaker(bind=self.engine))
+        wrapper = AppWrapper(config={'PROFILE_REQUESTS': True,
+                                     'SLOW_REQUEST_THRESHOLD': '0',
+                                     'SLOW_REQUEST_LOG': log},
+                             session=session)
+        wrapper.setup_profiling()
+
+        @wrapper.app.route('/n-plus-one')
+        def n_plus_one():
+            for i in range(3):
+                session.execute('SELECT %d' % i)
+            return 'ok'
+
+        response = wrapper.app.test_client().get('/n-plus-one')
+        self.assertIn('desc="3 queries"', response.headers['Server-Timing'])
+        self.assertIsNone(instrument.current_profile())
+        with open(log) as f:
+            entry = json.loads(f.readline())
+        self.assertEqual(entry['endpoint'], 'n_plus_one')
+        self.assertEqual(entry['db_statements'], 3)
+        self.assertEqual(len(entry['top_queries']), 3)
@@ -0,0 +1,203 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime, timedelta
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from sqlalchemy.orm import sessionmaker
+
+from debsources import bloom
+from debsources import jobqueue
+from debsources import sqla_session
+from debsources.models import Base, File, Job, Package, PackageName
+from debsources.tests.db_testing import DbTestFixture
+
+
+@attr('jobqueue')
+class JobQueueTests(unittest.TestCase):
+    """ unit tests for debsources.jobqueue """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='debsources-jobqueue-')
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.calls = []
+        self.conf = {
+            'cache_dir': self.tmpdir,
+            'sources_dir': os.path.join(self.tmpdir, 'sources'),
+            'mirror_dir': os.path.join(self.tmpdir, 'mirror'),
+            'dry_run': False,
+            'observers': {
+                'add-package': [('good', self.hook('add')),
+                                ('bad', self.bad_hook),
+                                ('checksums', self.hook('add'))],
+                'rm-package': [('good', self.hook('rm'))],
+            },
+        }
+        engine = sqla_session._get_engine(
+            'sqlite:///' + os.path.join(self.tmpdir, 'db.sqlite'),
+            verbose=False)
+        Base.metadata.create_all(engine, tables=[
+            PackageName.__table__, Package.__table__, File.__table__,
+            Job.__table__])
+        self.session = sessionmaker(bind=engine)()
+        self.addCleanup(self.session.close)
+        for name in ['gnubg', 'ledger']:
+            db_name = PackageName(name)
+            self.session.add(db_name)
+            self.session.flush()
+            pkg = Package('1.0-1', db_name)
+            pkg.area = 'main'
+            self.session.add(pkg)
+            self.session.flush()
+            self.session.add(File(pkg, b'README'))
+            os.makedirs(os.path.join(self.conf['sources_dir'], 'main',
+                                     name[0], name, '1.0-1'))
+        self.session.commit()
+
+    def hook(self, event):
+        def action(session, pkg, pkgdir, file_table):
+            self.calls.append((event, str(pkg), os.getcwd(),
+                               sorted(file_table) if file_table else None))
+        return action
+
+    def bad_hook(self, session, pkg, pkgdir, file_table):
+        raise RuntimeError('bad hook')
+
+    def states(self):
+        return dict((str(job), job.state)
+                    for job in self.session.query(Job))
+
+    @istest
+    def enqueueIsIdempotent(self):
+        self.assertTrue(jobqueue.enqueue(self.session, 'rm-package',
+                                         'gnubg', '1.0-1'))
+        self.assertFalse(jobqueue.enqueue(self.session, 'rm-package',
+                                          'gnubg', '1.0-1'))
+        self.assertEqual(jobqueue.enqueue_hook(self.conf, self.session,
+                                               'good'), 2)
+        self.assertEqual(jobqueue.enqueue_hook(self.conf, self.session,
+                                               'good'), 0)
+        self.session.commit()
+        self.assertEqual(jobqueue.counts(self.session), {'pending': 3})
+        self.assertRaises(ValueError, jobqueue.enqueue_hook, self.conf,
+                          self.session, 'nonexistent')
+
+    @istest
+    def runsHookJobs(self):
+        jobqueue.enqueue_hook(self.conf, self.session, 'good',
+                              [('ledger', '1.0-1')])
+        self.session.commit()
+        self.assertEqual(jobqueue.work(self.conf, self.session,
+                                       exit_when_empty=True), (1, 0))
+        pkgdir = os.path.join(self.conf['sources_dir'],
+                              'main/l/ledger/1.0-1')
+        self.assertEqual(self.calls,
+                         [('rm', 'ledger/1.0-1', pkgdir, None),
+                          ('add', 'ledger/1.0-1', pkgdir, [b'README'])])
+        self.assertEqual(self.states(), {'hook ledger/1.0-1 good': 'done'})
+
+        # done jobs can be rescheduled
+        self.assertTrue(jobqueue.enqueue(self.session, 'hook', 'ledger',
+                                         '1.0-1', hook='good'))
+
+    @istest
+    def marksChecksumFilterStale(self):
+        sha256_filter = os.path.join(self.tmpdir, bloom.SHA256_FILTER)
+        open(sha256_filter, 'w').close()
+        jobqueue.enqueue_hook(self.conf, self.session, 'good')
+        self.session.commit()
+        jobqueue.work(self.conf, self.session, exit_when_empty=True)
+        self.assertFalse(os.path.exists(bloom.stale_marker(sha256_filter)))
+        jobqueue.enqueue_hook(self.conf, self.session, 'checksums',
+                              [('gnubg', '1.0-1')])
+        self.session.commit()
+        jobqueue.work(self.conf, self.session, exit_when_empty=True)
+        self.assertTrue(os.path.exists(bloom.stale_marker(sha256_filter)))
+
+    @istest
+    def retriesFailedJobs(self):
+        jobqueue.enqueue_hook(self.conf, self.session, 'bad',
+                              [('gnubg', '1.0-1')])
+        jobqueue.enqueue(self.session, 'rm-package', 'gone', '0.1')
+        self.session.commit()
+        self.assertEqual(jobqueue.work(self.conf, self.session,
+                                       max_attempts=2,
+                                       exit_when_empty=True), (1, 2))
+        self.assertEqual(self.states(), {'hook gnubg/1.0-1 bad': 'failed',
+                                         'rm-package gone/0.1': 'done'})
+        job = self.session.query(Job).filter_by(hook='bad').one()
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('bad hook', job.error)
+
+        self.assertEqual(jobqueue.retry_failed(self.session), 1)
+        self.assertEqual(jobqueue.counts(self.session),
+                         {'pending': 1, 'done': 1})
+
+    @istest
+    def claimsJobsOnce(self):
+        jobqueue.enqueue_hook(self.conf, self.session, 'good')
+        self.session.commit()
+        first = jobqueue.claim(self.session, 'w1')
+        second = jobqueue.claim(self.session, 'w2')
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual((first.state, first.worker, first.attempts),
+                         ('running', 'w1', 1))
+        self.assertIsNone(jobqueue.claim(self.session, 'w3'))
+
+        self.assertEqual(jobqueue.requeue_stale(self.session,
+                                                timedelta(hours=1)), 0)
+        first.started = datetime.now() - timedelta(hours=2)
+        self.session.commit()
+        self.assertEqual(jobqueue.requeue_stale(self.session,
+                                                timedelta(hours=1)), 1)
+        self.assertEqual(jobqueue.claim(self.session, 'w3').id, first.id)
+
+
+@attr('jobqueue')
+@attr('postgres')
+class JobQueueDbTests(unittest.TestCase, DbTestFixture):
+    """ debsources.jobqueue tests on the (migrated) test DB """
+
+    def setUp(self):
+        self.db_setup()
+        self.conf = {'observers': {'add-package': [('good', None)]}}
+
+    def tearDown(self):
+        self.db_teardown()
+
+    @istest
+    def queuesJobsOfFixture(self):
+        packages = self.session.query(Package).count()
+        self.assertEqual(jobqueue.enqueue_hook(self.conf, self.session,
+                                               'good'), packages)
+        self.session.commit()
+        self.assertEqual(jobqueue.counts(self.session),
+                         {'pending': packages})
+
+        first = jobqueue.claim(self.session, 'w1')
+        second = jobqueue.claim(self.session, 'w2')
+        self.assertNotEqual(first.id, second.id)
+        jobqueue.finish(self.session, first)
+        jobqueue.finish(self.session, second, error='bad hook',
+                        max_attempts=1)
+        self.assertEqual(jobqueue.counts(self.session),
+                         {'pending': packages - 2, 'done': 1, 'failed': 1})
+        self.assertEqual(jobqueue.purge_done(self.session), 1)
+        self.assertEqual(jobqueue.retry_failed(self.session), 1)
@@ -0,0 +1,73 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from debsources.local_info import LocalInfoCache, read_update_ts
+
+
+@attr('local_info')
+class LocalInfoCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(suffix='.debsources-test')
+        self.fname = os.path.join(self.tmpdir, 'last-update')
+        self.loads = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, content):
+        # same as the updater: atomic replace via rename
+        with open(self.fname + '.new', 'w') as f:
+            f.write(content)
+        os.rename(self.fname + '.new', self.fname)
+
+    def load(self, fname):
+        self.loads += 1
+        return read_update_ts(fname)
+
+    @istest
+    def reusesUnchangedFile(self):
+        cache = LocalInfoCache(check_interval=0)
+        self.write('Mon\n')
+        self.assertEqual(cache.get(self.fname, self.load), 'Mon')
+        self.assertEqual(cache.get(self.fname, self.load), 'Mon')
+        self.assertEqual(self.loads, 1)
+
+    @istest
+    def reloadsReplacedFile(self):
+        cache = LocalInfoCache(check_interval=0)
+        self.write('Mon\n')
+        self.assertEqual(cache.get(self.fname, self.load), 'Mon')
+        self.write('Tue\n')
+        self.assertEqual(cache.get(self.fname, self.load), 'Tue')
+        os.unlink(self.fname)
+        self.assertEqual(cache.get(self.fname, self.load), 'unknown')
+        self.assertEqual(self.loads, 3)
+
+    @istest
+    def trustsCacheWithinInterval(self):
+        cache = LocalInfoCache(check_interval=3600)
+        self.write('Mon\n')
+        self.assertEqual(cache.get(self.fname, self.load), 'Mon')
+        self.write('Tue\n')
+        self.assertEqual(cache.get(self.fname, self.load), 'Mon')
+        cache.clear()
+        self.assertEqual(cache.get(self.fname, self.load), 'Tue')
@@ -0,0 +1,136 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from debsources import package_scan
+from debsources.package_scan import PackageScan, count_sloc, \
+    format_sloccount, guess_language
+from debsources.package_tree import PackageTree
+from debsources.plugins.hook_sloccount import parse_sloccount
+
+C_SOURCE = b'''/* a comment
+   spanning lines */
+#include <stdio.h>
+
+int main(void) /* inline */ {
+    // line comment
+    printf("hello\\n");  // trailing
+    return 0;
+}
+'''
+
+PY_SOURCE = b'''#!/usr/bin/env python
+"""module docstring
+
+still docstring
+"""
+
+# comment
+def f():
+    return 42  # trailing
+'''
+
+
+@attr('package_scan')
+class PackageScanTests(unittest.TestCase):
+    """ unit tests for debsources.package_scan """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='debsources-scan-')
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.pkgdir = os.path.join(self.tmpdir, 'pkg')
+        os.makedirs(os.path.join(self.pkgdir, 'src', 'sub'))
+        files = [('src/main.c', C_SOURCE),
+                 ('src/copy.c', C_SOURCE),  # duplicate, counted once
+                 ('src/sub/util.h', b'int util(void);\n'),
+                 ('tool', PY_SOURCE),  # no extension, but shebang
+                 ('README', b'hello\n' * 2000),
+                 ('gen.c', b'/* automatically generated */\nint x;\n')]
+        for (relpath, content) in files:
+            with open(os.path.join(self.pkgdir, relpath), 'wb') as f:
+                f.write(content)
+        os.link(os.path.join(self.pkgdir, 'README'),
+                os.path.join(self.pkgdir, 'README.link'))
+        os.symlink('README', os.path.join(self.pkgdir, 'README.sym'))
+
+    def scan(self):
+        return PackageScan(PackageTree.from_fs(self.pkgdir))
+
+    @istest
+    def listsRegularFiles(self):
+        scan = self.scan()
+        self.assertEqual([f.relpath for f in scan.files],
+                         ['README', 'README.link', 'gen.c', 'src/copy.c',
+                          'src/main.c', 'src/sub/util.h', 'tool'])
+        f = scan.files[0]
+        self.assertEqual(f.abspath, os.path.join(self.pkgdir, 'README'))
+        self.assertEqual(f.stat.st_size, 12000)
+
+    @istest
+    def diskUsageMatchesDu(self):
+        du = subprocess.check_output(['du', '--summarize', self.pkgdir])
+        self.assertEqual(self.scan().disk_usage, int(du.split()[0]))
+
+    @istest
+    def countsSlocs(self):
+        self.assertEqual(self.scan().slocs, {'ansic': 6, 'python': 2})
+
+    @istest
+    def guessesLanguages(self):
+        self.assertEqual(guess_language('a/Makefile', b''), 'makefile')
+        self.assertEqual(guess_language('x.CPP', b''), 'cpp')
+        self.assertEqual(guess_language('x.C', b''), 'cpp')
+        self.assertEqual(guess_language('x.h', b''), 'h')
+        self.assertEqual(guess_language('configure', b'#! /bin/sh\n'), 'sh')
+        self.assertIsNone(guess_language('COPYING', b'GPL'))
+
+    @istest
+    def countsSlocsPerLanguage(self):
+        self.assertEqual(count_sloc(b'=head1 NAME\n\nfoo\n\n=cut\n'
+                                    b'print 1; # x\n', 'perl'), 1)
+        self.assertEqual(count_sloc(b'C     comment\n      X = 1\n'
+                                    b'! other\n', 'fortran'), 1)
+        self.assertEqual(count_sloc(b'(* a *) x := 1;\n{ b\n}\n', 'pascal'),
+                         1)
+
+    @istest
+    def formatsSloccountOutput(self):
+        path = os.path.join(self.tmpdir, 'pkg.sloccount')
+        slocs = {'ansic': 120, 'python': 30, 'sh': 3}
+        with open(path, 'w') as f:
+            f.write(format_sloccount(slocs))
+        self.assertEqual(parse_sloccount(path), slocs)
+        with open(path, 'w') as f:
+            f.write(format_sloccount({}))
+        self.assertEqual(parse_sloccount(path), {})
+
+    @istest
+    def memoizesLastScan(self):
+        tree = PackageTree.from_fs(self.pkgdir)
+        scan = package_scan.scan(self.pkgdir, tree)
+        self.assertIs(scan.tree, tree)
+        self.assertIs(package_scan.scan(self.pkgdir), scan)
+        shutil.rmtree(self.pkgdir)
+        os.makedirs(self.pkgdir)
+        os.utime(self.pkgdir, (0, 0))
+        rescan = package_scan.scan(self.pkgdir)
+        self.assertIsNot(rescan, scan)
+        self.assertEqual(rescan.files, [])
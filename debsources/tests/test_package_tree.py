@@ -0,0 +1,127 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from debsources import fs_storage
+from debsources import package_tree
+from debsources.models import Base, File, Package, PackageName
+from debsources.package_tree import PackageTree
+
+
+@attr('package_tree')
+class PackageTreeTests(unittest.TestCase):
+    """ unit tests for debsources.package_tree """
+
+    def setUp(self):
+        self.pkgdir = tempfile.mkdtemp(prefix='debsources-tree-')
+        self.addCleanup(shutil.rmtree, self.pkgdir)
+        os.makedirs(os.path.join(self.pkgdir, 'src', 'sub'))
+        for relpath in ['README', 'src/main.c', 'src/sub/util.h']:
+            with open(os.path.join(self.pkgdir, relpath), 'w') as f:
+                f.write(relpath + '\n')
+        os.symlink('README', os.path.join(self.pkgdir, 'README.sym'))
+        os.symlink('src', os.path.join(self.pkgdir, 'srclink'))
+        os.symlink('nowhere', os.path.join(self.pkgdir, 'dangling'))
+
+    @istest
+    def listsFilesAsOsWalk(self):
+        tree = PackageTree.from_fs(self.pkgdir)
+        walked = [relpath
+                  for (relpath, _abspath)
+                  in fs_storage.walk_pkg_files(self.pkgdir)]
+        self.assertEqual(sorted(tree), sorted(walked))
+        self.assertEqual(sorted(tree), ['README', 'README.sym', 'dangling',
+                                        'src/main.c', 'src/sub/util.h'])
+        self.assertIsNone(tree['README'])
+
+    @istest
+    def knowsRegularFiles(self):
+        tree = PackageTree.from_fs(self.pkgdir)
+        self.assertTrue(tree.is_regular('src/main.c'))
+        self.assertFalse(tree.is_regular('README.sym'))
+        self.assertFalse(tree.is_regular('dangling'))
+        self.assertEqual(tree.stat('README').st_size, len('README\n'))
+        self.assertEqual(tree.regular_files(),
+                         [(p, os.path.join(self.pkgdir, p))
+                          for p in ['README', 'src/main.c',
+                                    'src/sub/util.h']])
+
+    @istest
+    def walksWithoutScandir(self):
+        orig_scandir = package_tree.scandir
+        package_tree.scandir = None
+        try:
+            tree = PackageTree.from_fs(self.pkgdir)
+        finally:
+            package_tree.scandir = orig_scandir
+        self.assertEqual(tree, PackageTree.from_fs(self.pkgdir))
+        self.assertEqual(tree.disk_usage(),
+                         PackageTree.from_fs(self.pkgdir).disk_usage())
+
+    @istest
+    def diskUsageMatchesDu(self):
+        with open(os.path.join(self.pkgdir, 'big'), 'wb') as f:
+            f.write(b'x' * 100000)
+        os.link(os.path.join(self.pkgdir, 'big'),
+                os.path.join(self.pkgdir, 'src', 'big.link'))
+        du = subprocess.check_output(['du', '--summarize', self.pkgdir])
+        tree = PackageTree.from_fs(self.pkgdir)
+        self.assertEqual(tree.disk_usage(), int(du.split()[0]))
+        # trees without metadata walk the package directory
+        self.assertEqual(PackageTree(self.pkgdir).disk_usage(),
+                         tree.disk_usage())
+
+    @istest
+    def forgetsDeletedFiles(self):
+        tree = PackageTree.from_fs(self.pkgdir)
+        del tree['README']
+        self.assertNotIn('README', tree)
+        self.assertEqual(len(tree.regular_files()), 2)
+
+    @istest
+    def loadsFromDb(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine, tables=[
+            PackageName.__table__, Package.__table__, File.__table__])
+        session = sessionmaker(bind=engine)()
+        name = PackageName('gnubg')
+        session.add(name)
+        session.flush()
+        pkg = Package('1.02.000-2', name)
+        pkg.area = 'main'
+        session.add(pkg)
+        session.flush()
+        files = [File(pkg, b'README'), File(pkg, b'src/main.c'),
+                 File(pkg, b'gone.c')]
+        session.add_all(files)
+        session.flush()
+
+        tree = PackageTree.from_db(session, pkg.id, self.pkgdir)
+        self.assertEqual(tree, dict((f.path, f.id) for f in files))
+        # metadata are gathered on demand
+        self.assertTrue(tree.is_regular(b'src/main.c'))
+        self.assertIsNone(tree.stat(b'gone.c'))
+        self.assertEqual([p for (p, _a) in tree.regular_files()],
+                         [b'README', b'src/main.c'])
+        session.close()
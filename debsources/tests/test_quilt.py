@@ -0,0 +1,112 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from debsources import quilt
+from debsources.plugins import hook_patches
+
+PATCH = '''Description: Fix the frobnicator
+ and the widget
+Bug: #123456
+---
+--- a/src/frob.c
++++ b/src/frob.c
+@@ -1,3 +1,4 @@
+ int main() {
+-  return 1;
++  return 0;
++  /* ok */
+ }
+--- /dev/null
++++ b/debian/NEWS
+@@ -0,0 +1,2 @@
++news
++--- not a header
+'''
+
+
+@attr('patches')
+class QuiltTests(unittest.TestCase):
+    """ unit tests for debsources.quilt and the patches hook """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='debsources-quilt-')
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.pkgdir = os.path.join(self.tmpdir, 'frob', '1.0-1')
+        os.makedirs(os.path.join(self.pkgdir, 'debian', 'patches'))
+        os.makedirs(os.path.join(self.pkgdir, 'debian', 'source'))
+        self.write('debian/source/format', '3.0 (quilt)\n')
+        self.write('debian/patches/series',
+                   '# comment\nfix-frob.patch -p1\n\nmissing.patch\n'
+                   '../../../outside.patch\n')
+        self.write('debian/patches/fix-frob.patch', PATCH)
+        with open(os.path.join(self.tmpdir, 'outside.patch'), 'w') as f:
+            f.write(PATCH)
+
+    def write(self, path, content):
+        with open(os.path.join(self.pkgdir, path), 'w') as f:
+            f.write(content)
+
+    @istest
+    def computesDiffstat(self):
+        stats = quilt.diffstat(PATCH.splitlines(True))
+        self.assertEqual(stats, {'src/frob.c': [2, 1],
+                                 'debian/NEWS': [2, 0]})
+        self.assertEqual(quilt.format_diffstat(stats),
+                         ' debian/NEWS |    2 \t2 +\t0 -\t0 !\n'
+                         ' src/frob.c  |    3 \t2 +\t1 -\t0 !\n'
+                         ' 2 files changed, 4 insertions(+), 1 deletion(-)\n')
+        self.assertEqual(quilt.format_diffstat({}), ' 0 files changed\n')
+
+    @istest
+    def computesPatchesInfo(self):
+        info = quilt.patches_info(self.pkgdir)
+        self.assertEqual(info['format'], '3.0 (quilt)\n')
+        self.assertEqual([(e['series'], e.get('missing', False))
+                          for e in info['series']],
+                         [('fix-frob.patch -p1', False),
+                          ('missing.patch', True),
+                          ('../../../outside.patch', True)])
+        patch = info['series'][0]
+        self.assertEqual(patch['name'], 'fix-frob.patch')
+        self.assertEqual(patch['bug'], '123456')
+        self.assertIn('fix the frobnicator', patch['description'])
+        self.assertIn('2 files changed', patch['file_deltas'])
+
+    @istest
+    def skipsUnsupportedFormats(self):
+        self.write('debian/source/format', '1.0\n')
+        self.assertEqual(quilt.patches_info(self.pkgdir),
+                         dict(format='1.0\n', series=None))
+        os.unlink(os.path.join(self.pkgdir, 'debian/source/format'))
+        self.assertEqual(quilt.patches_info(self.pkgdir),
+                         dict(format=None, series=None))
+
+    @istest
+    def hookMaintainsSidecar(self):
+        hook_patches.conf = {'backends': set(['hooks.fs'])}
+        self.addCleanup(setattr, hook_patches, 'conf', None)
+        pkg = {'package': 'frob', 'version': '1.0-1'}
+        self.assertIsNone(quilt.read_sidecar(self.pkgdir))
+        hook_patches.add_package(None, pkg, self.pkgdir, None)
+        self.assertEqual(quilt.read_sidecar(self.pkgdir),
+                         quilt.patches_info(self.pkgdir))
+        hook_patches.rm_package(None, pkg, self.pkgdir, None)
+        self.assertFalse(os.path.exists(quilt.sidecar_path(self.pkgdir)))
@@ -0,0 +1,124 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from debsources import local_info
+from debsources import updater
+from debsources.app.render_cache import cache_key, make_cache, \
+    current_stamps, NullCache, MemoryCache, FileSystemCache, MemcachedCache
+
+PAGE = (200, [('Content-Type', 'text/html')], b'<html/>')
+
+
+class FakeMemcache(object):
+    """local stand-in for memcache.Client"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, time=0):
+        self.data[key] = value
+
+
+@attr('render_cache')
+class RenderCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(suffix='.debsources-test')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @istest
+    def keyIgnoresArgsOrder(self):
+        k1 = cache_key('sources.source', {'path_to': 'a/b', 'x': '1'},
+                       {'hl': '1', 'msg': 'foo'}, 'Mon', 1)
+        k2 = cache_key('sources.source', {'x': '1', 'path_to': 'a/b'},
+                       {'msg': 'foo', 'hl': '1'}, 'Mon', 1)
+        self.assertEqual(k1, k2)
+
+    @istest
+    def keyDependsOnStamps(self):
+        k = cache_key('sources.source', {'path_to': 'a/b'}, {}, 'Mon', 1)
+        self.assertNotEqual(
+            k, cache_key('sources.source', {'path_to': 'a/b'}, {}, 'Tue', 1))
+        self.assertNotEqual(
+            k, cache_key('sources.source', {'path_to': 'a/b'}, {}, 'Mon', 2))
+        self.assertNotEqual(
+            k, cache_key('copyright.source', {'path_to': 'a/b'}, {}, 'Mon',
+                         1))
+
+    @istest
+    def memoryCacheEvictsLeastRecentlyUsed(self):
+        cache = MemoryCache(size=2)
+        cache.set('a', PAGE)
+        cache.set('b', PAGE)
+        self.assertEqual(cache.get('a'), PAGE)  # 'b' is now the LRU entry
+        cache.set('c', PAGE)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), PAGE)
+        self.assertEqual(cache.get('c'), PAGE)
+
+    @istest
+    def fsCacheRoundTrip(self):
+        cache = FileSystemCache(os.path.join(self.tmpdir, 'render'))
+        self.assertIsNone(cache.get('deadbeef'))
+        cache.set('deadbeef', PAGE)
+        self.assertEqual(cache.get('deadbeef'), PAGE)
+        # entries are visible to other processes, i.e. other instances
+        other = FileSystemCache(os.path.join(self.tmpdir, 'render'))
+        self.assertEqual(other.get('deadbeef'), PAGE)
+        cache.clear()
+        self.assertIsNone(other.get('deadbeef'))
+
+    @istest
+    def memcachedCacheUsesClient(self):
+        client = FakeMemcache()
+        cache = MemcachedCache(client, prefix='test:')
+        cache.set('k', PAGE)
+        self.assertEqual(client.data, {'test:k': PAGE})
+        self.assertEqual(cache.get('k'), PAGE)
+
+    @istest
+    def makesConfiguredCache(self):
+        self.assertIsInstance(make_cache({}), NullCache)
+        self.assertIsInstance(make_cache({'RENDER_CACHE': 'memory'}),
+                              MemoryCache)
+        self.assertIsInstance(make_cache({'RENDER_CACHE': 'fs',
+                                          'CACHE_DIR': self.tmpdir}),
+                              FileSystemCache)
+        self.assertRaises(ValueError, make_cache, {'RENDER_CACHE': 'nope'})
+
+    @istest
+    def updaterBumpsGeneration(self):
+        conf = {'cache_dir': self.tmpdir, 'dry_run': False,
+                'backends': set(['fs'])}
+        gen_file = os.path.join(self.tmpdir, 'render-generation')
+        self.assertEqual(local_info.read_generation(gen_file), 0)
+        updater.bump_render_generation(conf)
+        updater.bump_render_generation(conf)
+        self.assertEqual(current_stamps(self.tmpdir), ('unknown', 2))
+        conf['dry_run'] = True
+        updater.bump_render_generation(conf)
+        self.assertEqual(local_info.read_generation(gen_file), 2)
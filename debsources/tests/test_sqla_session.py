@@ -0,0 +1,117 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+
+from debsources.sqla_session import _get_engine, _get_engine_session, \
+    _pool_metrics, _count_pool_events, TimedQueuePool
+
+Base = declarative_base()
+
+
+class Thing(Base):
+    __tablename__ = 'things'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+@attr('sqla_session')
+class SqlaSessionTests(unittest.TestCase):
+    """ unit tests for DB pooling and replica routing, on SQLite """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(suffix='.debsources-test')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def db_url(self, name):
+        return 'sqlite:///' + os.path.join(self.tmpdir, name + '.db')
+
+    @istest
+    def countsCheckouts(self):
+        # _get_engine only meters the pools of non-SQLite engines
+        engine = create_engine(self.db_url('primary'),
+                               poolclass=TimedQueuePool,
+                               pool_size=2, max_overflow=0)
+        _count_pool_events(engine)
+        for _i in range(3):
+            conn = engine.connect()
+            conn.execute('SELECT 1')
+            conn.close()
+        metrics = _pool_metrics(engine)
+        self.assertEqual(metrics['checkouts'], 3)
+        self.assertEqual(metrics['checkins'], 3)
+        self.assertEqual(metrics['connects'], 1)  # connection got reused
+        self.assertGreaterEqual(metrics['wait_time'], 0)
+
+        engine.dispose()  # metrics survive pool re-creation
+        engine.connect().close()
+        self.assertEqual(_pool_metrics(engine)['checkouts'], 4)
+
+    @istest
+    def sqliteKeepsDefaultPool(self):
+        engine = _get_engine(self.db_url('primary'), verbose=False,
+                             pool_size=2, max_overflow=0, pool_pre_ping=True)
+        self.assertNotIsInstance(engine.pool, TimedQueuePool)
+        self.assertEqual(engine.execute('SELECT 1').scalar(), 1)
+        self.assertEqual(_pool_metrics(engine), {})
+
+        engine = _get_engine('sqlite://', verbose=False)  # in-memory DB
+        Base.metadata.create_all(engine)
+        engine.execute(Thing.__table__.insert(), {'id': 1, 'name': 'foo'})
+        self.assertEqual(
+            [r.name for r in engine.execute(Thing.__table__.select())],
+            ['foo'])
+
+    @istest
+    def routesReadsToReplica(self):
+        engine, session = _get_engine_session(
+            self.db_url('primary'), verbose=False,
+            replica_url=self.db_url('replica'))
+        Base.metadata.create_all(engine)
+        Base.metadata.create_all(session.replica)
+        session.replica.execute(Thing.__table__.insert(),
+                                {'id': 1, 'name': 'on-replica'})
+
+        session.add(Thing(id=2, name='on-primary'))
+        session.flush()  # writes go to the primary...
+        session.commit()
+        self.assertEqual(
+            [r.name for r in engine.execute(Thing.__table__.select())],
+            ['on-primary'])
+        # ... while reads go to the replica
+        self.assertEqual([t.name for t in session.query(Thing)],
+                         ['on-replica'])
+        session.remove()
+
+    @istest
+    def noReplicaByDefault(self):
+        engine, session = _get_engine_session(self.db_url('primary'),
+                                              verbose=False)
+        self.assertIsNone(session.replica)
+        Base.metadata.create_all(engine)
+        session.add(Thing(id=1, name='foo'))
+        session.commit()
+        self.assertEqual(session.query(Thing).count(), 1)
+        session.remove()
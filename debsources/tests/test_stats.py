@@ -15,10 +15,13 @@ import unittest
 
 import six
 
+from datetime import datetime, timedelta
+
 from nose.tools import istest
 from nose.plugins.attrib import attr
 
 from debsources import statistics
+from debsources.models import HistorySize
 
 from debsources.tests.db_testing import DbTestFixture
 
@@ -209,3 +212,95 @@ class Stats(unittest.TestCase, DbTestFixture):
         wheezy_sloc = [[item[1], item[2]] for item in sloc_list
                        if item[0] == "wheezy"]
         self.assertEqual(dict(wheezy_sloc)['sh'], 13560)
+
+    @istest
+    def snapshotMatchesPerSuiteQueries(self):
+        snapshot = statistics.StatsSnapshot(self.session)
+        for stat in snapshot.SIZE_STATS:
+            query_method = getattr(statistics, stat)
+            self.assertEqual(snapshot.total(stat), query_method(self.session))
+            self.assertEqual(snapshot.by_suite(stat)['jessie'],
+                             query_method(self.session, suite='jessie'))
+        self.assertEqual(snapshot.sloccount(),
+                         statistics.sloccount_summary(self.session))
+        self.assertEqual(snapshot.sloccount('jessie'),
+                         statistics.sloccount_summary(self.session,
+                                                      suite='jessie'))
+        self.assertEqual(snapshot.licenses(),
+                         statistics.get_licenses(self.session, 'ALL'))
+        self.assertEqual(snapshot.licenses('jessie'),
+                         statistics.get_licenses(self.session, 'jessie'))
+        self.assertEqual(snapshot.ratio(), 77)
+        self.assertEqual(snapshot.ratio('jessie'), 50)
+        self.assertEqual(snapshot.ratio('squeeze'), 100)
+        self.assertEqual(snapshot.ratio('nonexistent'), 0)
+        self.assertEqual(snapshot.sloccount('nonexistent'), {})
+
+    @istest
+    def compactionPreservesCharts(self):
+        now = datetime.utcnow()
+        start = now - timedelta(days=400)
+        for i in range(400 * 3):  # one sample every 8 hours
+            sample = HistorySize('compacttest', start + timedelta(hours=8 * i))
+            sample.disk_usage = i
+            self.session.add(sample)
+        self.session.flush()
+        try:
+            charts = [statistics.history_size_daily,
+                      statistics.history_size_weekly,
+                      statistics.history_size_monthly]
+            before = [chart(self.session, 'disk_usage', '2 years',
+                            'compacttest')
+                      for chart in charts]
+            self.assertEqual(len(before[0]), 400)
+
+            retention = timedelta(days=31)
+            self.assertTrue(statistics.compact_history(self.session,
+                                                       retention, now))
+            remaining = self.session.query(HistorySize) \
+                                    .filter_by(suite='compacttest').count()
+            self.assertTrue(remaining < 400 * 3 / 2)
+            self.assertEqual(statistics.compact_history(self.session,
+                                                        retention, now), 0)
+            after = [chart(self.session, 'disk_usage', '2 years',
+                           'compacttest')
+                     for chart in charts]
+            self.assertEqual(before, after)
+        finally:
+            self.session.rollback()
+
+    @istest
+    def compactionPreservesReferenceCharts(self):
+        suites = [suite for (suite,) in self.session.execute(
+            'SELECT DISTINCT suite FROM history_size')]
+        self.assertTrue(suites)
+        interval = '100 years'
+
+        def charts():
+            return [
+                [statistics.history_size_daily(self.session, 'disk_usage',
+                                               interval, suite),
+                 statistics.history_size_weekly(self.session, 'source_files',
+                                                interval, suite),
+                 statistics.history_size_monthly(self.session, 'ctags',
+                                                 interval, suite),
+                 statistics.history_sloc_daily(self.session, interval, suite),
+                 statistics.history_sloc_weekly(self.session, interval,
+                                                suite),
+                 statistics.history_sloc_monthly(self.session, interval,
+                                                 suite),
+                 statistics.history_copyright_daily(self.session, interval,
+                                                    suite),
+                 statistics.history_copyright_monthly(self.session, interval,
+                                                      suite)]
+                for suite in suites]
+
+        try:
+            before = charts()
+            statistics.compact_history(self.session, timedelta(days=31))
+            rolled_up = self.session.execute(
+                'SELECT count(*) FROM history_size_rollup').scalar()
+            self.assertTrue(rolled_up > 0)
+            self.assertEqual(charts(), before)
+        finally:
+            self.session.rollback()
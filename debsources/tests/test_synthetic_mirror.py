@@ -0,0 +1,82 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from debsources import fs_storage
+from debsources.debmirror import SourcePackage
+from debsources.tests.synthetic_mirror import generate_mirror
+
+
+def read_sources(mirror_dir, suite):
+    index = os.path.join(mirror_dir, 'dists', suite, 'main', 'source',
+                         'Sources.gz')
+    with gzip.open(index) as f:
+        packages = list(SourcePackage.iter_paragraphs(f))
+    for pkg in packages:
+        pkg['x-debsources-mirror-root'] = mirror_dir
+    return packages
+
+
+@attr('fs_storage')
+class SyntheticMirrorTests(unittest.TestCase):
+    """ unit tests for debsources.tests.synthetic_mirror """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='debsources-mirror-')
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.mirror_dir = os.path.join(self.tmpdir, 'mirror')
+
+    @istest
+    def generatesSuites(self):
+        listing = generate_mirror(self.mirror_dir, packages=20, files=2,
+                                  suites=['sid', 'jessie'])
+        self.assertEqual(len(listing['sid']), 20)
+        self.assertTrue(0 < len(listing['jessie']) < 20)
+        sources = read_sources(self.mirror_dir, 'jessie')
+        self.assertEqual([(pkg['package'], pkg['version'])
+                          for pkg in sources],
+                         listing['jessie'])
+        for pkg in sources:
+            self.assertEqual(pkg.archive_area(), 'main')
+            self.assertTrue(os.path.isfile(pkg.dsc_path()))
+
+    @istest
+    def churnsFirstSuiteOnly(self):
+        first = generate_mirror(self.mirror_dir, packages=20, churn=0.25)
+        second = generate_mirror(self.mirror_dir, packages=20, churn=0.25,
+                                 generation=1)
+        self.assertEqual(first['jessie'], second['jessie'])
+        self.assertEqual(len(set(second['sid']) - set(first['sid'])), 5)
+        again = generate_mirror(self.mirror_dir, packages=20, churn=0.25,
+                                generation=1)
+        self.assertEqual(again, second)
+
+    @istest
+    def packagesExtract(self):
+        generate_mirror(self.mirror_dir, packages=1, files=3, lines=10)
+        pkg = read_sources(self.mirror_dir, 'sid')[0]
+        destdir = pkg.extraction_dir(os.path.join(self.tmpdir, 'sources'))
+        fs_storage.extract_package(pkg, destdir)
+        self.assertEqual(sorted(os.listdir(os.path.join(destdir, 'src'))),
+                         ['liba00000_0.c', 'liba00000_1.c',
+                          'liba00000_2.c'])
+        self.assertTrue(os.path.isfile(os.path.join(destdir, 'debian',
+                                                    'copyright')))
@@ -17,6 +17,7 @@ import logging
 import os
 import shutil
 import sqlalchemy
+import sqlalchemy.orm
 import subprocess
 import tempfile
 import unittest
@@ -26,12 +27,15 @@ import six
 from nose.tools import istest
 from nose.plugins.attrib import attr
 
+from debsources import bloom
 from debsources import db_storage
+from debsources import local_info
 from debsources import mainlib
 from debsources import models
 from debsources import statistics
 from debsources import updater
 
+from debsources.debmirror import SourcePackage
 from debsources.tests.db_testing import DbTestFixture, DB_COMPARE_QUERIES
 from debsources.tests.updater_testing import mk_conf
 from debsources.subprocess_workaround import subprocess_setup
@@ -116,7 +120,9 @@ class Updater(unittest.TestCase, DbTestFixture):
         self.db_teardown()
         shutil.rmtree(self.tmpdir)
 
-    TEST_STAGES = updater.UPDATE_STAGES - set([updater.STAGE_CHARTS])
+    # compaction prunes history depending on the current time: not reproducible
+    TEST_STAGES = updater.UPDATE_STAGES - set([updater.STAGE_CHARTS,
+                                               updater.STAGE_COMPACT])
 
     def do_update(self, stages=TEST_STAGES):
         """do a full update run in a virtual test environment"""
@@ -166,6 +172,29 @@ class Updater(unittest.TestCase, DbTestFixture):
                                                               srctxt_path)))
         self.assertItemsEqual(actual_srctxt, expected_srctxt)
 
+    @istest
+    def extractMarksChecksumFilterStale(self):
+        db_mv_tables_to_schema(self.session, 'ref')
+        sha256_filter = os.path.join(self.conf['cache_dir'],
+                                     bloom.SHA256_FILTER)
+        os.makedirs(self.conf['cache_dir'])
+        bloom.build_sha256_filter(self.session, sha256_filter)  # empty
+        self.do_update(stages=set([updater.STAGE_EXTRACT]))
+
+        (checksum,) = self.session.query(models.Checksum.sha256).first()
+        from debsources.app import app_wrapper
+        from debsources.app.views import checksum_may_exist
+        app = app_wrapper.app
+        orig_cache_dir = app.config.get('CACHE_DIR')
+        app.config['CACHE_DIR'] = self.conf['cache_dir']
+        try:
+            local_info.cache.clear()
+            with app.test_request_context():
+                self.assertTrue(checksum_may_exist(checksum))
+        finally:
+            app.config['CACHE_DIR'] = orig_cache_dir
+            local_info.cache.clear()
+
     @istest
     def recreatesDbFromFiles(self):
         orig_sources = os.path.join(TEST_DATA_DIR, 'sources')
@@ -335,3 +364,111 @@ class MetadataCache(unittest.TestCase, DbTestFixture):
         }
 
         self.assertDictContainsSubset(expected_stats, license_stats)
+
+
+@attr('infra')
+class SourcesIndexTests(unittest.TestCase):
+    """ unit tests for updater.SourcesIndex """
+
+    def setUp(self):
+        self.sources = updater.SourcesIndex()
+        self.sources.add(('ocaml', '4.01.0-3'), 'main',
+                         'pool/main/o/ocaml/ocaml_4.01.0-3.dsc',
+                         'main/o/ocaml/4.01.0-3', package_id=42)
+        self.sources.add(('gnubg', '1.02.000-2'), 'main',
+                         'pool/main/g/gnubg/gnubg_1.02.000-2.dsc',
+                         'main/g/gnubg/1.02.000-2')
+        for suite in ['sid', 'jessie']:
+            self.sources.add_suite(('ocaml', '4.01.0-3'), suite)
+        self.sources.add_suite(('gnubg', '1.02.000-2'), 'jessie')
+
+    @istest
+    def keepsEntries(self):
+        self.assertEqual(len(self.sources), 2)
+        self.assertIn(('gnubg', '1.02.000-2'), self.sources)
+        self.assertNotIn(('gnubg', '0.9'), self.sources)
+        self.assertEqual(self.sources[('ocaml', '4.01.0-3')],
+                         ('main', 'pool/main/o/ocaml/ocaml_4.01.0-3.dsc',
+                          'main/o/ocaml/4.01.0-3', ['sid', 'jessie']))
+        self.assertEqual(self.sources.package_id(('ocaml', '4.01.0-3')), 42)
+        self.assertIsNone(self.sources.package_id(('gnubg', '1.02.000-2')))
+        self.assertIsNone(self.sources.package_id(('gnubg', '0.9')))
+
+    @istest
+    def writesSortedSourcesTxt(self):
+        tmpdir = tempfile.mkdtemp(suffix='.debsources-test')
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'sources.txt')
+        self.sources.write(path)
+        with open(path) as f:
+            self.assertEqual(f.read(),
+                             'gnubg\t1.02.000-2\tmain\t'
+                             'pool/main/g/gnubg/gnubg_1.02.000-2.dsc\t'
+                             'main/g/gnubg/1.02.000-2\tjessie\n'
+                             'ocaml\t4.01.0-3\tmain\t'
+                             'pool/main/o/ocaml/ocaml_4.01.0-3.dsc\t'
+                             'main/o/ocaml/4.01.0-3\tsid,jessie\n')
+        self.assertFalse(os.path.exists(path + '.new'))
+
+
+class FakeMirror(object):
+
+    def __init__(self, packages):
+        self.packages = packages
+
+    def ls(self):
+        return self.packages
+
+
+@attr('infra')
+class ForceTriggersTests(unittest.TestCase):
+    """ unit tests for hooks forced on packages by extract_new """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(suffix='.debsources-test')
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        engine = sqlalchemy.create_engine('sqlite://')
+        models.Base.metadata.create_all(engine, tables=[
+            models.PackageName.__table__, models.Package.__table__,
+            models.File.__table__])
+        self.session = sqlalchemy.orm.sessionmaker(bind=engine)()
+        self.addCleanup(self.session.close)
+
+        self.calls = []
+        self.conf = mk_conf(self.tmpdir)
+        self.conf.update(backends=set(),  # neither FS extraction nor DB
+                         observers={'add-package': [('spy', self.spy)]},
+                         force_triggers=[('add-package', 'spy')])
+        pkg = SourcePackage('Package: gnubg\n'
+                            'Version: 1.0-1\n'
+                            'Section: games\n'
+                            'Directory: pool/main/g/gnubg\n'
+                            'Files:\n'
+                            ' d41d8cd98f00b204e9800998ecf8427e 0 '
+                            'gnubg_1.0-1.dsc\n')
+        pkg['x-debsources-mirror-root'] = self.conf['mirror_dir']
+        self.mirror = FakeMirror([pkg])
+        self.pkgdir = pkg.extraction_dir(self.conf['sources_dir'])
+        os.makedirs(os.path.join(self.pkgdir, 'src'))
+        open(os.path.join(self.pkgdir, 'src', 'gnubg.c'), 'w').close()
+
+    def spy(self, session, pkg, pkgdir, file_table):
+        self.calls.append((str(pkg), file_table))
+
+    def extract_new(self):
+        status = updater.UpdateStatus()
+        updater.extract_new(status, self.conf, self.session, self.mirror)
+        return status
+
+    @istest
+    def walksTreeWithoutDb(self):
+        status = self.extract_new()
+        self.assertEqual(self.calls, [('gnubg/1.0-1', {'src/gnubg.c': None})])
+        self.assertIn(('gnubg', '1.0-1'), status.sources)
+
+    @istest
+    def buildsNoTreeOnDryRun(self):
+        self.conf['dry_run'] = True
+        status = self.extract_new()
+        self.assertEqual(self.calls, [])
+        self.assertIn(('gnubg', '1.0-1'), status.sources)
@@ -0,0 +1,157 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+from __future__ import absolute_import
+
+import itertools
+import random
+import unittest
+
+from nose.tools import istest
+from nose.plugins.attrib import attr
+
+from debian.debian_support import version_compare
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from debsources import db_storage
+from debsources import query as qry
+from debsources.models import Base, Package, PackageName, Suite
+from debsources.tests.db_testing import DbTestFixture
+from debsources.version_key import split_version, version_key
+
+TRICKY_VERSIONS = [
+    '0', '0~', '0~~', '0~a', '0a', '0.0', '00', '1', '1.0', '1.0~rc1',
+    '1.0~rc1~', '1.0+b1', '1.0.1', '1.0a', '1.0A', '1.0-', '1.0-0',
+    '1.0-1', '1.0-1~bpo1', '1.0-1+b1', '1.0-1.1', '1.0-10', '1.0-9',
+    '1.00-1', '1:0.1', '0:1.0', '2:1', '10:1', '1.0-1-1',
+    '1.2.3-4ubuntu1', '2.6.32+git20100101', '2.6.32-5', '9.99999999999',
+    '10.0',
+]
+
+
+def random_version(rnd):
+    chars = '0123456789.+~ab-'
+    version = ''.join(rnd.choice(chars) for _i in range(rnd.randint(1, 8)))
+    if not version[0].isdigit():
+        version = '1' + version
+    if rnd.random() < 0.2:
+        version = '%d:%s' % (rnd.randint(0, 3), version)
+    return version
+
+
+def cmp_sign(n):
+    return (n > 0) - (n < 0)
+
+
+@attr('version_key')
+class VersionKeyTests(unittest.TestCase):
+    """ unit tests for debsources.version_key """
+
+    def assertSameOrder(self, v1, v2):
+        (k1, k2) = (version_key(v1), version_key(v2))
+        self.assertEqual(cmp_sign((k1 > k2) - (k1 < k2)),
+                         cmp_sign(version_compare(v1, v2)),
+                         '%s vs %s' % (v1, v2))
+
+    @istest
+    def splitsVersions(self):
+        self.assertEqual(split_version('1.0'), ('0', '1.0', ''))
+        self.assertEqual(split_version('1:1.0-2'), ('1', '1.0', '2'))
+        self.assertEqual(split_version('1.0-1-2'), ('0', '1.0-1', '2'))
+        self.assertEqual(split_version('1.0-'), ('0', '1.0-', ''))
+        self.assertEqual(split_version('a:1.0'), ('0', 'a:1.0', ''))
+
+    @istest
+    def matchesDpkgOrderOnTrickyVersions(self):
+        for (v1, v2) in itertools.product(TRICKY_VERSIONS, repeat=2):
+            self.assertSameOrder(v1, v2)
+
+    @istest
+    def matchesDpkgOrderOnRandomVersions(self):
+        rnd = random.Random(42)
+        for _i in range(2000):
+            self.assertSameOrder(random_version(rnd), random_version(rnd))
+
+    @istest
+    def sortsLikeVersionCompare(self):
+        versions = sorted(TRICKY_VERSIONS, key=version_key)
+        for (v1, v2) in zip(versions, versions[1:]):
+            self.assertLessEqual(version_compare(v1, v2), 0)
+
+
+@attr('version_key')
+class VersionKeyDbTests(unittest.TestCase):
+    """ unit tests for DB queries relying on packages.version_key """
+
+    VERSIONS = ['1.0-1', '1.0~rc1-1', '1:0.9-1', '1.0-10', '1.0-9']
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine, tables=[
+            PackageName.__table__, Package.__table__, Suite.__table__])
+        self.session = sessionmaker(bind=engine)()
+        self.addCleanup(self.session.close)
+        db_name = PackageName('gnubg')
+        self.session.add(db_name)
+        self.session.flush()
+        for version in self.VERSIONS:
+            self.session.add(Package(version, db_name))
+        self.session.flush()
+
+    @istest
+    def ordersVersionsInDb(self):
+        versions = [p.version
+                    for p in qry.pkg_names_list_versions(self.session,
+                                                         'gnubg')]
+        self.assertEqual(versions, ['1.0~rc1-1', '1.0-1', '1.0-9', '1.0-10',
+                                    '1:0.9-1'])
+        self.assertEqual(qry.get_latest_version(self.session, 'gnubg'),
+                         '1:0.9-1')
+        self.assertIsNone(qry.get_latest_version(self.session, 'nonexistent'))
+
+    @istest
+    def fillsVersionKeys(self):
+        self.session.query(Package).update({'version_key': b''})
+        self.assertEqual(db_storage.fill_version_keys(self.session), 0)
+        self.assertEqual(db_storage.fill_version_keys(self.session,
+                                                      all_packages=True,
+                                                      batch_size=2),
+                         len(self.VERSIONS))
+        self.session.expire_all()
+        for pkg in self.session.query(Package):
+            self.assertEqual(pkg.version_key, version_key(pkg.version))
+
+
+@attr('version_key')
+@attr('postgres')
+class VersionKeyFixtureTests(unittest.TestCase, DbTestFixture):
+    """ check the version keys of the (migrated) test DB """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db_setup_cls()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_teardown_cls()
+
+    @istest
+    def fixtureHasVersionKeys(self):
+        packages = self.session.query(Package).all()
+        self.assertTrue(packages)
+        for pkg in packages:
+            self.assertEqual(pkg.version_key, version_key(pkg.version))
+        nullable = self.session.execute(
+            "SELECT is_nullable FROM information_schema.columns "
+            "WHERE table_name = 'packages' AND column_name = 'version_key'") \
+            .scalar()
+        self.assertEqual(nullable, 'NO')
@@ -15,24 +15,26 @@ from __future__ import division
 import glob
 import logging
 import os
-import string
 import subprocess
 
 import six
 from six.moves import map
 from six.moves import range
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from email.utils import formatdate
 from sqlalchemy import sql, not_
 
+from debsources import bloom
 from debsources import db_storage
 from debsources import fs_storage
+from debsources import instrument
+from debsources import local_info
 from debsources import statistics
-from . import query as qry
 
 from debsources.consts import DEBIAN_RELEASES, SLOCCOUNT_LANGUAGES
 from debsources.debmirror import SourceMirror, SourcePackage
+from debsources.package_tree import PackageTree
 from debsources.models import SuiteInfo, Suite, SuiteAlias, Package, \
     HistorySize, HistorySlocCount, HistoryCopyright
 from debsources.subprocess_workaround import subprocess_setup
@@ -43,19 +45,93 @@ NO_OBSERVERS = dict([(e, []) for e in KNOWN_EVENTS])
 # maximum number of pending rows before performing a (bulk) insert
 BULK_FLUSH_THRESHOLD = 50000
 
+# days of history rows kept by the compact stage; older ones only survive as
+# rolled up samples. The hourly charts need one month of raw history
+DEFAULT_HISTORY_RETENTION_DAYS = 90
+MIN_HISTORY_RETENTION_DAYS = 31
+
+
+class SourcesIndex(object):
+    """entries for the on-disk cache of source packages (AKA sources.txt)
+
+    Maps pairs <SRC_NAME, SRC_VERSION> to tuples <AREA, DSC, UNPACK_DIR,
+    SUITES>, where SUITES is a list of SUITE_NAMEs. There is an entry for each
+    package of the mirror, so entries are stored compactly: one flat tuple per
+    package, with shared area names and suites encoded as a bit mask. The DB
+    ID of packages, when known, is stored as well, to spare lookups to later
+    update stages.
+
+    """
+
+    def __init__(self):
+        # <package, version> -> <area, dsc, unpack_dir, package_id, suites>
+        self._entries = {}
+        self._areas = {}
+        self._suites = []  # suite names, in order of first appearance
+        self._suite_bits = {}  # suite name -> bit mask
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, pkg_id):
+        return pkg_id in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getitem__(self, pkg_id):
+        (area, dsc, unpack_dir, _package_id, suites) = self._entries[pkg_id]
+        return (area, dsc, unpack_dir, self._suite_names(suites))
+
+    def _suite_names(self, mask):
+        return [suite for (i, suite) in enumerate(self._suites)
+                if mask & (1 << i)]
+
+    def add(self, pkg_id, area, dsc, unpack_dir, package_id=None):
+        """add a package, with no suite associated (yet)"""
+        area = self._areas.setdefault(area, area)
+        self._entries[pkg_id] = (area, dsc, unpack_dir, package_id, 0)
+
+    def add_suite(self, pkg_id, suite):
+        """associate package `pkg_id`, which must have been added, to suite"""
+        bit = self._suite_bits.get(suite)
+        if bit is None:
+            bit = self._suite_bits[suite] = 1 << len(self._suites)
+            self._suites.append(suite)
+        entry = self._entries[pkg_id]
+        self._entries[pkg_id] = entry[:-1] + (entry[-1] | bit,)
+
+    def package_id(self, pkg_id):
+        """return the DB ID of package `pkg_id`, or None if unknown"""
+        entry = self._entries.get(pkg_id)
+        return entry[3] if entry is not None else None
+
+    def write(self, path):
+        """(atomically) write entries to `path`, in sources.txt format, sorted
+        by package name and version
+
+        """
+        with open(path + '.new', 'w') as src_list:
+            for pkg_id in sorted(self._entries):
+                (area, dsc, unpack_dir, _package_id, suites) = \
+                    self._entries[pkg_id]
+                fields = list(pkg_id) + [area, dsc, unpack_dir,
+                                         ','.join(self._suite_names(suites))]
+                src_list.write('\t'.join(fields) + '\n')
+        os.rename(path + '.new', path)
+
 
 class UpdateStatus(object):
     """store update status during update runs"""
 
     def __init__(self):
-        self._sources = {}
+        self._sources = SourcesIndex()
+        self._stats = None
 
     @property
     def sources(self):
-        """entries for the on-disk cache of source packages (AKA sources.txt)
-
-        sources is a dictionary from pairs <SRC_NAME, SRC_VERSION> to tuples
-        <AREA, DSC, UNPACK_DIR, SUITES>, where SUITES is a list of SUITE_NAMEs
+        """entries for the on-disk cache of source packages (AKA sources.txt),
+        as a SourcesIndex
 
         """
         return self._sources
@@ -64,6 +140,16 @@ class UpdateStatus(object):
     def sources(self, new_sources):
         self._sources = new_sources
 
+    def stats(self, session):
+        """aggregate statistics of the DB (a statistics.StatsSnapshot),
+        computed at most once per update run and shared by the stages that
+        need them
+
+        """
+        if self._stats is None:
+            self._stats = statistics.StatsSnapshot(session)
+        return self._stats
+
 
 # TODO fill tables: BinaryPackage, BinaryVersion
 # TODO get rid of shell hooks; they shall die a horrible death
@@ -92,10 +178,11 @@ def notify(conf, event, session, pkg, pkgdir, file_table=None):
 
     * pkgdir: path pointing to the package location in the file storage
 
-    * file_table: a dictionary mapping file names to DB file identifiers
-      (unique integers). If != None, the hook can rely on the file_table keys
-      to avoid re-scanning the file-system and use the corresponding file IDs.
-      If None, the hook will have to redo the scanning work.
+    * file_table: for add-package, a package_tree.PackageTree, i.e. a
+      dictionary mapping file names to DB file identifiers (unique integers),
+      which also knows file types and stats. Hooks should rely on it rather
+      than re-scanning the file-system or looking up file IDs in the DB. For
+      rm-package, None.
 
     Shell hoks re invoked with the following arguments: pkgdir, package name,
     package version
@@ -111,8 +198,9 @@ def notify(conf, event, session, pkg, pkgdir, file_table=None):
 
     # fire shell hooks
     try:
-        subprocess.check_output(cmd, stderr=subprocess.STDOUT,
-                                preexec_fn=subprocess_setup)
+        with instrument.timed('hook', event + '/shell'):
+            subprocess.check_output(cmd, stderr=subprocess.STDOUT,
+                                    preexec_fn=subprocess_setup)
     except subprocess.CalledProcessError as e:
         logging.error('shell hooks for %s on %s returned exit code %d.'
                       ' Output: %s'
@@ -133,12 +221,14 @@ def notify_plugins(observers, event, session, pkg, pkgdir,
     for (title, action) in observers[event]:
         try:
             if triggers is None:
-                action(session, pkg, pkgdir, file_table)
+                with instrument.timed('hook', '%s/%s' % (event, title)):
+                    action(session, pkg, pkgdir, file_table)
             elif (event, title) in triggers:
                 logging.info('notify (forced) %s/%s for %s'
                              % (event, title, pkg))
                 if not dry:
-                    action(session, pkg, pkgdir, file_table)
+                    with instrument.timed('hook', '%s/%s' % (event, title)):
+                        action(session, pkg, pkgdir, file_table)
         except:
             logging.error('plugin hooks for %s on %s failed' % (event, pkg))
             raise
@@ -153,6 +243,21 @@ def ensure_cache_dir(conf):
     ensure_dir(conf['cache_dir'])
 
 
+def bump_render_generation(conf):
+    """increment the generation counter of the web app render cache,
+    invalidating all rendered pages cached so far
+
+    """
+    if conf['dry_run'] or 'fs' not in conf['backends']:
+        return
+    ensure_cache_dir(conf)
+    gen_file = os.path.join(conf['cache_dir'], 'render-generation')
+    generation = local_info.read_generation(gen_file) + 1
+    with open(gen_file + '.new', 'w') as out:
+        out.write('%d\n' % generation)
+    os.rename(gen_file + '.new', gen_file)
+
+
 def ensure_stats_dir(conf):
     ensure_dir(os.path.join(conf['cache_dir'], 'stats'))
 
@@ -201,10 +306,11 @@ def is_excluded_package(pkg, exclude_specs):
     return bool(specs)
 
 
+@instrument.instrumented('package', 'add-package')
 def _add_package(pkg, conf, session, sticky=False):
     """add package `pkg` to both FS and DB storage, and notify plugins
 
-    handles and logs exceptions
+    handles and logs exceptions; return False if any occurred, True otherwise
     """
     logging.info('add %s...' % pkg)
     workdir = os.getcwd()
@@ -212,7 +318,7 @@ def _add_package(pkg, conf, session, sticky=False):
         pkgdir = pkg.extraction_dir(conf['sources_dir'])
         if pkgdir is None:
             logging.warning('package %s has no extracion dir, skipping' % pkg)
-            return
+            return True
         if not conf['dry_run'] and 'fs' in conf['backends']:
             fs_storage.extract_package(pkg, pkgdir)
             os.chdir(pkgdir)
@@ -224,19 +330,24 @@ def _add_package(pkg, conf, session, sticky=False):
             if not conf['dry_run'] and 'db' in conf['backends']:
                 file_table = db_storage.add_package(session, pkg, pkgdir,
                                                     sticky)
+            elif not conf['dry_run'] and os.path.isdir(pkgdir):
+                file_table = PackageTree.from_fs(pkgdir)  # without file IDs
             exclude_files(session, pkg, pkgdir, file_table, conf['exclude'])
             if not conf['dry_run'] and 'hooks' in conf['backends']:
                 notify(conf, 'add-package', session, pkg, pkgdir, file_table)
     except:
         logging.exception('failed to add %s' % pkg)
+        return False
     finally:
         os.chdir(workdir)
+    return True
 
 
+@instrument.instrumented('package', 'rm-package')
 def _rm_package(pkg, conf, session, db_package=None):
     """remove package `pkg` from both FS and DB storage, and notify plugins
 
-    handles and logs exceptions
+    handles and logs exceptions; return False if any occurred, True otherwise
     """
     logging.info("remove %s..." % pkg)
     pkgdir = pkg.extraction_dir(conf['sources_dir'])
@@ -245,7 +356,7 @@ def _rm_package(pkg, conf, session, db_package=None):
                                                pkg['version'])
         if not db_package:
             logging.warn('cannot find package %s, not removing' % pkg)
-            return
+            return True
     try:
         if not conf['dry_run'] and 'hooks' in conf['backends']:
             notify(conf, 'rm-package', session, pkg, pkgdir)
@@ -256,6 +367,8 @@ def _rm_package(pkg, conf, session, db_package=None):
                 db_storage.rm_package(session, pkg, db_package)
     except:
         logging.exception('failed to remove %s' % pkg)
+        return False
+    return True
 
 
 def _add_suite(conf, session, suite, sticky=False, aliases=[]):
@@ -284,13 +397,19 @@ def extract_new(status, conf, session, mirror):
 
     """
     ensure_cache_dir(conf)
+    if not conf['dry_run'] and 'fs' in conf['backends'] \
+       and 'checksums' in conf['hooks']:
+        # checksums of new packages may be committed (and looked up) well
+        # before the cache stage, if any, rebuilds the filter
+        bloom.mark_stale(os.path.join(conf['cache_dir'], bloom.SHA256_FILTER))
 
     def add_package(pkg):
         if is_excluded_package(pkg, conf['exclude']):
             logging.info('skipping excluded package %s' % pkg)
             return
-        if not db_storage.lookup_package(session, pkg['package'],
-                                         pkg['version']):
+        db_package = db_storage.lookup_package(session, pkg['package'],
+                                               pkg['version'])
+        if not db_package:
             # use DB as completion marker: if the package has been inserted, it
             # means everything went fine last time we tried. If not, we redo
             # everything, just to be safe
@@ -298,10 +417,21 @@ def extract_new(status, conf, session, mirror):
         pkgdir = pkg.extraction_dir(conf['sources_dir'])
         if conf['force_triggers']:
             try:
+                if not db_package:  # just added
+                    db_package = db_storage.lookup_package(
+                        session, pkg['package'], pkg['version'])
+                file_table = None
+                if conf['dry_run']:
+                    pass
+                elif db_package:
+                    file_table = PackageTree.from_db(session, db_package.id,
+                                                     pkgdir)
+                elif os.path.isdir(pkgdir):  # no DB backend, or add failed
+                    file_table = PackageTree.from_fs(pkgdir)
                 notify_plugins(conf['observers'], 'add-package',
                                session, pkg, pkgdir,
                                triggers=conf['force_triggers'],
-                               dry=conf['dry_run'])
+                               dry=conf['dry_run'], file_table=file_table)
             except:
                 logging.exception('trigger failure on %s' % pkg)
         # add entry for sources.txt, temporarily with no suite associated
@@ -309,7 +439,8 @@ def extract_new(status, conf, session, mirror):
         dsc_rel = os.path.relpath(pkg.dsc_path(), conf['mirror_dir'])
         pkgdir_rel = os.path.relpath(pkg.extraction_dir(conf['sources_dir']),
                                      conf['sources_dir'])
-        status.sources[pkg_id] = pkg.archive_area(), dsc_rel, pkgdir_rel, []
+        status.sources.add(pkg_id, pkg.archive_area(), dsc_rel, pkgdir_rel,
+                           package_id=db_package.id if db_package else None)
 
     logging.info('add new packages...')
     for pkg in mirror.ls():
@@ -320,6 +451,17 @@ def extract_new(status, conf, session, mirror):
             add_package(pkg)
 
 
+def is_expired(conf, pkgdir):
+    """check whether a package gone from the mirror, and extracted to
+    `pkgdir`, is old enough to be garbage collected
+
+    """
+    if not os.path.exists(pkgdir):
+        return True
+    age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(pkgdir))
+    return age.days >= conf['expire_days']
+
+
 def garbage_collect(status, conf, session, mirror):
     """update stage: list db and remove disappeared and expired packages
 
@@ -332,12 +474,7 @@ def garbage_collect(status, conf, session, mirror):
         if pkg_id not in mirror.packages:
             # package is in in Debsources db, but gone from mirror: we
             # might have to garbage collect it (depending on expiry)
-            expire_days = conf['expire_days']
-            age = None
-            if os.path.exists(pkgdir):
-                age = datetime.now() - \
-                    datetime.fromtimestamp(os.path.getmtime(pkgdir))
-            if not age or age.days >= expire_days:
+            if is_expired(conf, pkgdir):
                 _rm_package(pkg, conf, session, db_package=version)
             else:
                 logging.debug('not removing %s as it is too young' % pkg)
@@ -371,28 +508,32 @@ def update_suites(status, conf, session, mirror):
             session.query(Suite).filter_by(suite=suite).delete()
         for pkg_id in pkgs:
             (pkg, version) = pkg_id
-            db_package = db_storage.lookup_package(session, pkg, version)
-            if not db_package:
+            # package IDs are usually known since extract_new
+            package_id = status.sources.package_id(pkg_id)
+            if package_id is None:
+                db_package = db_storage.lookup_package(session, pkg, version)
+                package_id = db_package.id if db_package else None
+            if package_id is None:
                 logging.warn('package %s/%s not found in suite %s, skipping'
                              % (pkg, version, suite))
             else:
                 logging.debug('add suite mapping: %s/%s -> %s'
                               % (pkg, version, suite))
-                params = {'package_id': db_package.id,
+                params = {'package_id': package_id,
                           'suite': suite}
                 insert_params.append(params)
                 if pkg_id in status.sources:
                     # fill-in incomplete suite information in status
-                    status.sources[pkg_id][-1].append(suite)
+                    status.sources.add_suite(pkg_id, suite)
                 else:
                     # defensive measure to make update_suites() more reusable
                     logging.warn('cannot find %s/%s during suite update'
                                  % (pkg, version))
-        if not conf['dry_run'] and 'db' in conf['backends'] \
-           and len(insert_params) >= BULK_FLUSH_THRESHOLD:
-            session.execute(insert_q, insert_params)
-            session.flush()
-            insert_params = []
+            if not conf['dry_run'] and 'db' in conf['backends'] \
+               and len(insert_params) >= BULK_FLUSH_THRESHOLD:
+                session.execute(insert_q, insert_params)
+                session.flush()
+                insert_params = []
 
         if not conf['dry_run'] and 'db' in conf['backends']:
             session.query(SuiteInfo).filter_by(name=suite).delete()
@@ -404,14 +545,9 @@ def update_suites(status, conf, session, mirror):
         session.flush()
 
     # update sources.txt, now that we know the suite mappings
-    src_list_path = os.path.join(conf['cache_dir'], 'sources.txt')
-    with open(src_list_path + '.new', 'w') as src_list:
-        for pkg_id, src_entry in six.iteritems(status.sources):
-            fields = list(pkg_id)
-            fields.extend(src_entry[:-1])  # all except suites
-            fields.append(string.join(src_entry[-1], ','))
-            src_list.write(string.join(fields, '\t') + '\n')
-    os.rename(src_list_path + '.new', src_list_path)
+    status.sources.write(os.path.join(conf['cache_dir'], 'sources.txt'))
+
+    bump_render_generation(conf)
 
 
 def __target_suites(session, suites=None):
@@ -463,16 +599,17 @@ def update_statistics(status, conf, session, suites=None):
             total_slocs += v
         d[prefix] = total_slocs
 
+    snapshot = status.stats(session)
+
     # compute overall stats
     suite = 'ALL'
     siz = HistorySize(suite, timestamp=now)
     loc = HistorySlocCount(suite, timestamp=now)
-    for stat in ['disk_usage', 'source_packages', 'source_files', 'ctags']:
-        v = getattr(statistics, stat)(session)
+    for stat in snapshot.SIZE_STATS:
+        v = snapshot.total(stat)
         stats['total.' + stat] = v
         setattr(siz, stat, v)
-    store_sloccount_stats(statistics.sloccount_summary(session),
-                          stats, 'total.sloccount', loc)
+    store_sloccount_stats(snapshot.sloccount(), stats, 'total.sloccount', loc)
     if not conf['dry_run'] and 'db' in conf['backends']:
         session.add(siz)
         session.add(loc)
@@ -481,25 +618,21 @@ def update_statistics(status, conf, session, suites=None):
     suite_key = 'debian_'
     hist_siz = dict((suite, HistorySize(suite, timestamp=now))
                     for suite in suites)
-    for stat in ['disk_usage', 'source_packages', 'source_files', 'ctags']:
-        stats_result = statistics.stats_grouped_by(session, stat)
-        for res in stats_result:
-            if res[0] in suites:
-                stats[suite_key + res[0] + '.' + stat] = res[1]
-                setattr(hist_siz[res[0]], stat, res[1])
+    for stat in snapshot.SIZE_STATS:
+        for (suite, v) in snapshot.by_suite(stat).items():
+            if suite in suites:
+                stats[suite_key + suite + '.' + stat] = v
+                setattr(hist_siz[suite], stat, v)
 
     if not conf['dry_run'] and 'db' in conf['backends']:
         for siz in hist_siz.values():
             session.add(siz)
 
     # update historySlocCount
-    sloccount_res = statistics.stats_grouped_by(session, 'sloccount')
     hist_loc = dict((suite, HistorySlocCount(suite, timestamp=now))
                     for suite in suites)
     for suite in suites:
-        temp = dict((item[1], item[2]) for item in sloccount_res
-                    if item[0] == suite)
-        store_sloccount_stats(dict(temp), stats,
+        store_sloccount_stats(snapshot.sloccount(suite), stats,
                               suite_key + suite + ".sloccount",
                               hist_loc[suite])
 
@@ -524,10 +657,8 @@ def update_statistics(status, conf, session, suites=None):
 
         hist_lic = dict((suite, HistoryCopyright(suite, timestamp=now))
                         for suite in suites)
-        results = statistics.get_licenses(session)
         for suite in suites:
-            temp = dict((item[0], item[2]) for item in results
-                        if item[1] == suite)
+            temp = snapshot.licenses(suite)
             summary = statistics.licenses_summary(temp)
             for res in summary:
                 license_stats[suite + "." + res.rstrip()] = summary[res]
@@ -542,7 +673,7 @@ def update_statistics(status, conf, session, suites=None):
 
         # overall dual licenses
         overall_d_licenses = statistics.licenses_summary_w_dual(
-            statistics.get_licenses(session, 'ALL'))
+            snapshot.licenses())
         for stat in overall_d_licenses:
             license_d_stats['overall.' + stat] = overall_d_licenses[stat]
 
@@ -551,8 +682,7 @@ def update_statistics(status, conf, session, suites=None):
             statistics.save_metadata_cache(license_d_stats, dual_license_file)
 
         session.flush()
-        overall_licenses = statistics.licenses_summary(
-            statistics.get_licenses(session, 'ALL'))
+        overall_licenses = statistics.licenses_summary(snapshot.licenses())
         for stat in overall_licenses:
             lic = HistoryCopyright('ALL', timestamp=now)
             setattr(lic, 'license', stat.replace('_', ' '))
@@ -568,6 +698,22 @@ def update_statistics(status, conf, session, suites=None):
         update_license_statistics(suites)
 
 
+def compact_history(status, conf, session):
+    """update stage: roll up history samples used by charts, and prune
+    history rows older than conf['history_retention_days']
+
+    """
+    logging.info('compact history...')
+    retention = max(conf.get('history_retention_days',
+                             DEFAULT_HISTORY_RETENTION_DAYS),
+                    MIN_HISTORY_RETENTION_DAYS)
+    if not conf['dry_run'] and 'db' in conf['backends']:
+        pruned = statistics.compact_history(session,
+                                            timedelta(days=retention))
+        session.flush()
+        logging.info('pruned %d history rows', pruned)
+
+
 def update_metadata(status, conf, session):
     """update stage: update metadata
 
@@ -583,6 +729,14 @@ def update_metadata(status, conf, session):
                 out.write('%s\n' % prefix)
         os.rename(prefix_path + '.new', prefix_path)
 
+    # rebuild the filter of known checksums, used by web app lookups
+    if not conf['dry_run'] and 'fs' in conf['backends'] \
+       and 'checksums' in conf['hooks']:
+        logging.info('build checksum filter...')
+        filter_path = os.path.join(conf['cache_dir'], bloom.SHA256_FILTER)
+        count = bloom.build_sha256_filter(session, filter_path)
+        logging.debug('%d checksum(s) in %s' % (count, filter_path))
+
     # update timestamp
     if not conf['dry_run'] and 'fs' in conf['backends']:
         timestamp_file = os.path.join(conf['cache_dir'], 'last-update')
@@ -590,6 +744,8 @@ def update_metadata(status, conf, session):
             out.write('%s\n' % formatdate())
         os.rename(timestamp_file + '.new', timestamp_file)
 
+    bump_render_generation(conf)
+
 
 def update_charts(status, conf, session, suites=None):
     """update stage: rebuild charts"""
@@ -598,6 +754,7 @@ def update_charts(status, conf, session, suites=None):
     logging.info('update charts...')
     ensure_stats_dir(conf)
     suites = __target_suites(session, suites)
+    snapshot = status.stats(session)
 
     CHARTS = [  # <period, granularity> paris
         ('1 month', 'hourly'),
@@ -637,7 +794,7 @@ def update_charts(status, conf, session, suites=None):
         sloc_suite = suite
         if sloc_suite == 'ALL':
             sloc_suite = None
-        slocs = statistics.sloccount_summary(session, suite=sloc_suite)
+        slocs = snapshot.sloccount(sloc_suite)
         if suite not in ['ALL']:
             sloc_per_suite.append(slocs)
         chart_file = os.path.join(conf['cache_dir'], 'stats',
@@ -667,9 +824,8 @@ def update_charts(status, conf, session, suites=None):
                     charts.multiseries_plot(mseries, chart_file, cols=3)
 
         # License: overall pie chart
-        overall_licenses = statistics.licenses_summary(
-            statistics.get_licenses(session, 'ALL'))
-        ratio = qry.get_ratio(session)
+        overall_licenses = statistics.licenses_summary(snapshot.licenses())
+        ratio = snapshot.ratio()
         chart_file = os.path.join(conf['cache_dir'], 'stats',
                                   'copyright_overall-license_pie.png')
         if not conf['dry_run']:
@@ -679,12 +835,9 @@ def update_charts(status, conf, session, suites=None):
         all_suites = statistics.sticky_suites(session) \
             + __target_suites(session, None)
         licenses_per_suite = []
-        results = statistics.get_licenses(session)
         for suite in all_suites:
-            temp = dict((item[0], item[2]) for item in results
-                        if item[1] == suite)
-            licenses = statistics.licenses_summary(temp)
-            ratio = qry.get_ratio(session, suite=suite)
+            licenses = statistics.licenses_summary(snapshot.licenses(suite))
+            ratio = snapshot.ratio(suite)
             # draw license pie chart
             if not conf['dry_run']:
                 chart_file = os.path.join(conf['cache_dir'], 'stats',
@@ -711,7 +864,8 @@ def update_charts(status, conf, session, suites=None):
  STAGE_GC,
  STAGE_STATS,
  STAGE_CACHE,
- STAGE_CHARTS,) = list(range(1, 7))
+ STAGE_CHARTS,
+ STAGE_COMPACT,) = list(range(1, 8))
 __STAGES = {
     'extract': STAGE_EXTRACT,
     'suites': STAGE_SUITES,
@@ -719,6 +873,7 @@ __STAGES = {
     'stats': STAGE_STATS,
     'cache': STAGE_CACHE,
     'charts': STAGE_CHARTS,
+    'compact': STAGE_COMPACT,
 }
 __STAGE2STR = {v: k for k, v in list(__STAGES.items())}
 UPDATE_STAGES = set(__STAGES.values())
@@ -746,21 +901,50 @@ def update(conf, session, stages=UPDATE_STAGES):
     """do a full update run
     """
     logging.info('start')
+    instrument.recorder.reset()
+    if session.bind is not None:
+        instrument.instrument_engine(session.bind)
     logging.info('list mirror packages...')
     mirror = SourceMirror(conf['mirror_dir'])
     status = UpdateStatus()
 
+    def timed(stage):
+        return instrument.timed('stage', pp_stage(stage))
+
     if STAGE_EXTRACT in stages:
-        extract_new(status, conf, session, mirror)      # stage 1
+        with timed(STAGE_EXTRACT):
+            extract_new(status, conf, session, mirror)      # stage 1
     if STAGE_SUITES in stages:
-        update_suites(status, conf, session, mirror)    # stage 2
+        with timed(STAGE_SUITES):
+            update_suites(status, conf, session, mirror)    # stage 2
     if STAGE_GC in stages:
-        garbage_collect(status, conf, session, mirror)  # stage 3
+        with timed(STAGE_GC):
+            garbage_collect(status, conf, session, mirror)  # stage 3
     if STAGE_STATS in stages:
-        update_statistics(status, conf, session)        # stage 4
+        with timed(STAGE_STATS):
+            update_statistics(status, conf, session)        # stage 4
+    if STAGE_COMPACT in stages:
+        with timed(STAGE_COMPACT):
+            compact_history(status, conf, session)          # stage 7
     if STAGE_CACHE in stages:
-        update_metadata(status, conf, session)          # stage 5
+        with timed(STAGE_CACHE):
+            update_metadata(status, conf, session)          # stage 5
     if STAGE_CHARTS in stages:
-        update_charts(status, conf, session)            # stage 6
+        with timed(STAGE_CHARTS):
+            update_charts(status, conf, session)            # stage 6
 
+    if not conf['dry_run'] and 'fs' in conf['backends']:
+        write_run_report(conf)
     logging.info('finish')
+
+
+def write_run_report(conf):
+    """write the timings of the update run to cache_dir/update-report.json
+    and, if configured, to a Prometheus textfile
+
+    """
+    ensure_cache_dir(conf)
+    instrument.recorder.write_report(os.path.join(conf['cache_dir'],
+                                                  'update-report.json'))
+    if conf.get('prometheus_textfile'):
+        instrument.recorder.write_prometheus(conf['prometheus_textfile'])
@@ -0,0 +1,97 @@
+# Copyright (C) 2015  The Debsources developers <info@sources.debian.net>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=AUTHORS;hb=HEAD
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://anonscm.debian.org/gitweb/?p=qa/debsources.git;a=blob;f=COPYING;hb=HEAD
+
+"""byte-comparable sort keys of Debian versions
+
+version_key(v1) < version_key(v2) (as byte strings, e.g. bytea values in
+PostgreSQL) if and only if v1 < v2 according to dpkg, so that versions can be
+sorted with an ORDER BY, or with a key function rather than version_compare.
+
+dpkg compares the epoch numerically, then the upstream version and the
+Debian revision with the same algorithm: strings are split into alternating
+non-digit and digit parts, non-digit parts are compared character by
+character ('~' sorts before anything, even the end of the part, and letters
+before other characters), digit parts numerically. Missing parts count as
+empty strings and zeros. Keys encode each part so that byte order is the same:
+
+- non-digit parts: one byte per character (see _char_order), then END_PART
+- digit parts: number of digits (without leading zeros) + 1, then digits
+- after the last part of the upstream version or of the revision: END
+
+"""
+
+from __future__ import absolute_import
+
+import re
+
+TILDE = 0x01       # '~', before the end of a non-digit part
+END = 0x02         # end of upstream version or revision
+END_PART = 0x03    # end of a non-digit part
+
+_PART_RE = re.compile(r'([^0-9]*)([0-9]*)')
+
+
+def _char_order(c):
+    if c == '~':
+        return TILDE
+    if 'a' <= c <= 'z' or 'A' <= c <= 'Z':
+        return ord(c)  # letters: 0x41-0x7a
+    return min(0x80 + ord(c), 0xff)  # anything else, after letters
+
+
+_CHAR_ORDER = dict((chr(i), _char_order(chr(i))) for i in range(128))
+
+
+def _add_number(digits, key):
+    digits = digits.lstrip('0')
+    key.append(min(len(digits) + 1, 0xff))
+    key.extend(digits.encode('ascii'))
+
+
+def _add_string(s, key):
+    """append the key of an upstream version or revision to `key`"""
+    pos = 0
+    while True:  # always at least one part, so that "" sorts as "0"
+        (non_digits, digits) = _PART_RE.match(s, pos).groups()
+        for c in non_digits:
+            key.append(_CHAR_ORDER.get(c) or _char_order(c))
+        key.append(END_PART)
+        _add_number(digits, key)
+        pos += len(non_digits) + len(digits)
+        if pos >= len(s):
+            break
+    key.append(END)
+
+
+def split_version(version):
+    """split a Debian version into <epoch, upstream version, revision>; the
+    epoch defaults to "0" and the revision to "". As python-debian does, an
+    empty revision (i.e. a trailing '-') belongs to the upstream version
+
+    """
+    (epoch, upstream, revision) = ('0', version, '')
+    if ':' in upstream:
+        (head, tail) = upstream.split(':', 1)
+        if head.isdigit():
+            (epoch, upstream) = (head, tail)
+    if '-' in upstream and not upstream.endswith('-'):
+        (upstream, revision) = upstream.rsplit('-', 1)
+    return (epoch, upstream, revision)
+
+
+def version_key(version):
+    """return the sort key of Debian version `version`, as a byte string"""
+    (epoch, upstream, revision) = split_version(version)
+    key = bytearray()
+    _add_number(epoch, key)
+    _add_string(upstream, key)
+    _add_string(revision, key)
+    return bytes(key)